@@ -13,4 +13,29 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CapstoneServer.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from smart_plant_api import live
+from smart_plant_api.fastpath import FastPathASGI
+
+# The device endpoints skip the Django middleware (see smart_plant_api/fastpath.py)
+http_application = FastPathASGI(django_application)
+
+async def application(scope, receive, send):
+    # The WebSocket connections of the live feed are served next to the Django views
+    if scope['type'] == 'websocket':
+        return await live.websocket_application(scope, receive, send)
+
+    return await http_application(scope, receive, send)
+
+from django.conf import settings
+
+if settings.WARM_UP_ON_START:
+    import threading
+    from smart_plant_api.warmup import warm_up
+
+    # The ASGI server may import this module from inside its event loop where the database can not be used, and the sync
+    # views do not run on this thread anyway, so the warm up runs on a thread of its own
+    warm_up_thread = threading.Thread(target=warm_up, kwargs={'keep_connections': False})
+    warm_up_thread.start()
+    warm_up_thread.join()
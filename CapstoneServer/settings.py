@@ -25,9 +25,13 @@ SECRET_KEY = 'xz9&pdt^-=z+w%2k^)-plkc+8^p-xtab-u_mv_30^-2##5ar%c'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
-# A variable that defines if the server should print to the command line or not
+# A variable that defines if the server should log its debug events (the readings received, the actuator states sent...) or not
 VERBOUSE = True
 
+# A variable that defines if the workers should open their database connections and caches as soon as they start instead of
+# on their first request
+WARM_UP_ON_START = True
+
 ALLOWED_HOSTS = ['206.81.2.205']
 
 
@@ -44,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'smart_plant_api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +60,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'CapstoneServer.urls'
 
+# The paths of the device endpoints that are served without going through the middleware above (see smart_plant_api/fastpath.py).
+# Leave it empty to send every request through Django
+FAST_PATH_ROUTES = ['/AddEntry', '/ActuatorData', '/ActuatorPlan']
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -81,7 +90,136 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+    },
+    # The read only copy of the primary database used by the analytical reads (see smart_plant_api/snapshot.py)
+    'snapshot': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.snapshot.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['smart_plant_api.snapshot.SnapshotRouter']
+
+# The snapshot of the primary database, refreshed with python manage.py refresh_snapshot --every
+SNAPSHOT = {
+    'DATABASE': 'snapshot',         # The alias of the snapshot in DATABASES
+    'ENABLED': True,                # Whether the reads can go to the snapshot at all. The benchmarks turn it off since the snapshot is not a copy of their database
+    'MAX_AGE': 300,                 # The staleness bound: the reads go back to the primary once the snapshot is older than this many seconds
+    'REFRESH_INTERVAL': 60,         # The default number of seconds between two refreshes of refresh_snapshot --every. Keep it well below MAX_AGE
+    'BACKUP_PAGES': 1024,           # The number of pages copied in every step of a refresh. The writers of the primary wait for at most one step
+    'BACKUP_SLEEP': 0.005,          # The number of seconds between two steps of a refresh
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # A cache shared by all of the worker processes. Point this at memcached when the server runs on more than one machine
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+}
+
+# The limits applied to the ingest endpoint (/AddEntry) to stop a single misbehaving device from starving the other plants
+ADMISSION_CONTROL = {
+    'BUCKET_CAPACITY': 10,          # The number of entries a single Plant-Id can send in a burst
+    'REFILL_RATE': 1,               # The number of entries per second a single Plant-Id can keep sending
+    'MAX_CONCURRENT_INGESTS': 8,    # The number of entries that can be processed at the same time across all workers
+    'SLOT_TIMEOUT': 60,             # The number of seconds after which a slot that has not been released is given back
+}
+
+# The server side cache of the responses of the GET endpoints used by the app
+RESPONSE_CACHE = {
+    'CACHE': 'shared',              # The cache alias that holds the cached responses (the data versions of the plants are kept in the DataVersion model)
+    'TIMEOUT': 300,                 # The maximum number of seconds a response is cached for
+    'SINGLE_FLIGHT': True,          # Identical requests made while a response is being computed wait for it instead of computing it again
+    'ACROSS_WORKERS': True,         # The requests of the other workers wait as well, through a lock held in the ResponseLock model
+    'WAIT_TIMEOUT': 10,             # The number of seconds a request waits for an identical one before computing the response itself
+    'POLL_INTERVAL': 0.02,          # How often (in seconds) a request waiting on another worker checks the cache for the response
+}
+
+# The range of the values sent by the sensors, which are all percentages. AddEntry refuses the readings outside of it
+SENSOR_RANGE = {
+    'MINIMUM': 0,
+    'MAXIMUM': 100,
+}
+
+# The alerts sent by AddEntry and by the fleet sweeper (python manage.py sweep_alerts)
+ALERTS = {
+    'WATER_LOW': 20,                # The water level (in percent) below which the low water alert is sent
+    'SOIL_MOISTURE_LOW': 20,        # The soil moisture (in percent) below which the low soil moisture alert is sent
+    'WAIT_TIME': 10,                # The number of minutes before the same alert is sent again for a plant
+    'STALE_MINUTES': 90,            # A plant is considered offline after this many minutes without a reading. Keep it above the reporting interval of the sensors
+    'SWEEP_INTERVAL': 60,           # The default number of seconds between two sweeps of sweep_alerts --every
+}
+
+# The running statistics behind the soil moisture trend and the water tank depletion forecast
+FORECAST = {
+    'HALF_LIFE': 24,                # The number of hours after which the weight of a reading in the statistics is halved
+    'MIN_WEIGHT': 3,                # The total weight of readings needed before a forecast is reported
+}
+
+# The time-boxed actuator plans served by /ActuatorPlan, which let the actuators poll far less often than /ActuatorData
+ACTUATOR_PLAN = {
+    'HORIZON': 600,                 # The number of seconds that a plan covers
+    'PUMP_HORIZON': 60,             # The number of seconds covered while the water pump is on, since the next reading is expected to stop it
+    'POLL_FRACTION': 0.5,           # The part of the plan after which the device is asked to poll again, so a missed poll does not leave it without a plan
+}
+
+# The in-process ring buffers holding the latest readings of every plant
+TIMESERIES = {
+    'CAPACITY': 256,                # The number of readings kept for every plant
+    'MAX_PLANTS': 5000,             # The number of plants kept by every worker before the least recently used ones are dropped
+}
+
+# The WebSocket live feed served by the ASGI application (see smart_plant_api/live.py)
+LIVE_FEED = {
+    'POLL_INTERVAL': 5,             # How often (in seconds) a connection checks for changes made by the other workers
+    'SEND_TIMEOUT': 10,             # The number of seconds a connection has to accept a message before it is closed
+    'MAX_PLANTS_PER_CONNECTION': 50,
+}
+
+# The logs of the server are written to stdout as JSON lines by a background thread so that the requests never wait for them
+# (see smart_plant_api/logs.py)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample_debug': {
+            '()': 'smart_plant_api.logs.SampleFilter',
+            'rate': 10,                                 # Only 1 of every 10 debug records of the same event is kept
+        },
+    },
+    'handlers': {
+        'background': {
+            'class': 'smart_plant_api.logs.BackgroundHandler',
+            'filters': ['sample_debug'],
+            'max_size': 10000,                          # The number of records waiting to be written before new ones are dropped
+        },
+    },
+    'loggers': {
+        'smart_plant_api': {
+            'handlers': ['background'],
+            'level': 'DEBUG' if VERBOUSE else 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Opt in profiling of single requests. The stored profiles are listed by the /Profiles endpoint (staff only)
+PROFILING = {
+    'TOKEN': os.environ.get('PROFILING_TOKEN'),     # Requests with a Profile-Token header equal to this token are profiled
+    'SAMPLE_RATE': 0,                               # The fraction of all of the requests that are profiled at random
+    'DIRECTORY': os.path.join(BASE_DIR, 'profiles'),
+    'MAX_PROFILES': 50,                             # The number of the latest profiles that are kept
 }
 
 
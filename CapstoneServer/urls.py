@@ -22,11 +22,16 @@ urlpatterns = [
     path('', smart_api_views.welcome_view),
     path('AddEntry', smart_api_views.add_entry),
     path('StatisticalData', smart_api_views.statistical_data),
+    path('ReadingHistory', smart_api_views.reading_history),
+    path('RecentStatistics', smart_api_views.recent_statistics),
     path('RemoveEntries', smart_api_views.remove_entries),
     path('ActuatorData', smart_api_views.actuator_data),
+    path('ActuatorPlan', smart_api_views.actuator_plan),
     path('AppBasicData', smart_api_views.app_basic_data),
     path('Override', smart_api_views.Override),
     path('RemoveOverride', smart_api_views.RemoveOverride),
     path('BindPlantIdToken', smart_api_views.bindPlantIdToken),
     path('Uptime', smart_api_views.uptime),
+    path('Profiles', smart_api_views.profiles),
+    path('Profiles/<str:file_name>', smart_api_views.profiles),
 ]
\ No newline at end of file
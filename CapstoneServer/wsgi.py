@@ -13,4 +13,15 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CapstoneServer.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+from smart_plant_api.fastpath import FastPathWSGI
+
+# The device endpoints skip the Django middleware (see smart_plant_api/fastpath.py)
+application = FastPathWSGI(django_application)
+
+from django.conf import settings
+
+if settings.WARM_UP_ON_START:
+    from smart_plant_api.warmup import warm_up
+    warm_up()
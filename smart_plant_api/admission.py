@@ -0,0 +1,129 @@
+'''
+Admission control for the ingest endpoint. Every Plant-Id gets its own token bucket and the number of ingest requests that
+are processed at the same time is capped. The state is kept in the AdmissionBucket and AdmissionSlot models so that all of the
+worker processes share the same limits.
+
+Every change to the state is a single conditional UPDATE, which the database applies atomically: a token is only taken from a
+bucket that still has one, and a slot is only taken while it is free. A request first takes a slot and only then a token, so a
+request turned away because the server is busy does not use up the bucket of its Plant-Id.
+'''
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Subquery, Value
+from django.db.models.functions import Least
+from django.http import JsonResponse
+import functools, math, time, uuid
+
+def take_token(plant_id, now=None) -> float:
+    '''
+    Takes a token from the bucket of the given plant
+
+    Arguments:
+        |- plant_id: the Plant-Id that made the request
+        |- now: the current time in seconds. Defaults to time.time()
+
+    Returns:
+        |- (float): 0 if a token was taken, otherwise the number of seconds until the next token becomes available
+    '''
+    from smart_plant_api.models import AdmissionBucket
+
+    capacity = settings.ADMISSION_CONTROL['BUCKET_CAPACITY']
+    refill_rate = settings.ADMISSION_CONTROL['REFILL_RATE']
+    now = time.time() if now == None else now
+
+    #The tokens of the bucket once it has been refilled up to now
+    tokens = Least(Value(capacity), F('tokens') + (Value(now) - F('updated_at')) * Value(refill_rate))
+    buckets = AdmissionBucket.objects.filter(plant_id = plant_id)
+
+    if buckets.annotate(available = tokens).filter(available__gte = 1).update(tokens = tokens - 1, updated_at = now):
+        return 0
+
+    bucket = buckets.values_list('tokens', 'updated_at').first()
+    if bucket == None:
+        try:
+            with transaction.atomic():
+                AdmissionBucket.objects.create(plant_id = plant_id, tokens = capacity - 1, updated_at = now)
+            return 0
+        except IntegrityError:
+            #The bucket has been made by another worker in the mean time
+            return take_token(plant_id, now)
+
+    available = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+    if available >= 1:
+        #A token has been given back by the refill between the two queries
+        return take_token(plant_id, now)
+
+    return (1 - available) / refill_rate
+
+def acquire_slot(now=None) -> str:
+    '''
+    Tries to take one of the ingest slots. A slot that has been held for longer than SLOT_TIMEOUT (by a worker that crashed
+    for example) is free to be taken again.
+
+    Returns:
+        |- (str): the id that the slot is held with, which is passed to release_slot once the request is done. None if every
+        slot is taken
+    '''
+    from smart_plant_api.models import AdmissionSlot
+
+    count = settings.ADMISSION_CONTROL['MAX_CONCURRENT_INGESTS']
+    now = time.time() if now == None else now
+    holder = uuid.uuid4().hex
+
+    #The condition on the slot itself is repeated outside of the subquery so that two workers never both take the same slot
+    free = Q(holder = None) | Q(expires_at__lt = now)
+    slots = AdmissionSlot.objects.filter(free, number__lt = count)
+    for _ in range(2):
+        if slots.filter(number = Subquery(slots.order_by('number').values('number')[:1])).update(holder = holder, expires_at = now + settings.ADMISSION_CONTROL['SLOT_TIMEOUT']):
+            return holder
+
+        #The slots are made the first time they are needed, and when MAX_CONCURRENT_INGESTS is raised
+        if AdmissionSlot.objects.filter(number__lt = count).count() == count:
+            return None
+        AdmissionSlot.objects.bulk_create([AdmissionSlot(number = number) for number in range(count)], ignore_conflicts=True)
+
+    return None
+
+def release_slot(holder) -> None:
+    '''
+    Gives back the slot taken by acquire_slot
+    '''
+    from smart_plant_api.models import AdmissionSlot
+
+    AdmissionSlot.objects.filter(holder = holder).update(holder = None, expires_at = None)
+
+def too_many_requests(retry_after, reason) -> JsonResponse:
+    from smart_plant_api.views import generate_error_message
+
+    response = JsonResponse({'status': 429,
+                            'response': generate_error_message(reason)},
+                            status = 429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def admission_control(view):
+    '''
+    A decorator used on the ingest views to reject the requests over the limits with a 429 response before the view (and
+    therefore any database work) runs.
+    '''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != "POST":
+            return view(request, *args, **kwargs)
+
+        holder = acquire_slot()
+        if holder == None:
+            return too_many_requests(1, 'The server is busy processing other entries')
+
+        try:
+            plant_id = request.headers.get('Plant-Id')
+            if plant_id != None:
+                retry_after = take_token(plant_id)
+                if retry_after:
+                    return too_many_requests(retry_after, f'Too many requests from the Plant-Id {plant_id}')
+
+            return view(request, *args, **kwargs)
+        finally:
+            release_slot(holder)
+
+    return wrapper
@@ -0,0 +1,220 @@
+'''
+Cold storage for the older readings. The readings of a plant for a whole day are packed into a single ReadingBlock row instead
+of one row per reading, which is done by the compact_readings command for the readings older than a given date.
+
+A block stores the ids and the three readings of the day column by column. Every column is delta encoded (each value is stored
+as its difference from the previous one), the differences are zigzag encoded so that small negative numbers stay small and
+written as varints, and the whole block is compressed with zlib. The sums of the readings are kept next to the block so that
+the daily statistics do not need to decode it.
+
+The helpers in readings.py read the blocks along with the partitions, so the rest of the code does not need to know where a
+reading is stored.
+'''
+from django.db import transaction
+from smart_plant_api import partitions, plants
+import collections, heapq, itertools, zlib
+
+COLUMNS = ('soil_moisture_reading', 'light_intensity_reading', 'water_level_reading')
+
+#A reading read from a block. It has the same attributes as a reading entry but is much cheaper to create
+CompactedReading = collections.namedtuple('CompactedReading', ('id', 'plant_id', 'reading_date') + COLUMNS)
+
+#The number of plants compacted in a single transaction
+COMPACT_BATCH_SIZE = 200
+
+def _write_varint(output, value) -> None:
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+def _read_varint(data, position) -> tuple:
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def encode_block(ids, columns) -> bytes:
+    '''
+    Encodes the readings of a day into a compressed block
+
+    Arguments:
+        |- ids: the ids of the readings in ascending order
+        |- columns: a list of the values of every column in COLUMNS, in the same order as the ids
+
+    Returns:
+        |- (bytes): the compressed block
+    '''
+    output = bytearray()
+    _write_varint(output, len(ids))
+
+    previous = 0
+    for reading_id in ids:
+        _write_varint(output, reading_id - previous)
+        previous = reading_id
+
+    for values in columns:
+        previous = 0
+        for value in values:
+            difference = value - previous
+            _write_varint(output, difference << 1 if difference >= 0 else (-difference << 1) - 1)
+            previous = value
+
+    return zlib.compress(bytes(output), 9)
+
+def decode_block(data) -> tuple:
+    '''
+    Decodes a compressed block
+
+    Returns:
+        |- (tuple): of the list of ids followed by the list of values of every column in COLUMNS
+    '''
+    data = zlib.decompress(data)
+    count, position = _read_varint(data, 0)
+
+    ids, previous = [], 0
+    for _ in range(count):
+        difference, position = _read_varint(data, position)
+        previous += difference
+        ids.append(previous)
+
+    columns = []
+    for _ in COLUMNS:
+        values, previous = [], 0
+        for _ in range(count):
+            encoded, position = _read_varint(data, position)
+            previous += (encoded >> 1) if encoded & 1 == 0 else -((encoded + 1) >> 1)
+            values.append(previous)
+        columns.append(values)
+
+    return (ids, *columns)
+
+def make_block(plant_key, reading_date, rows):
+    '''
+    Builds the block of a plant for a day
+
+    Arguments:
+        |- plant_key: the key of the plant in the registry (see plants.py)
+        |- rows: the (id, soil moisture, light intensity, water level) of the readings of the day, sorted by id
+
+    Returns:
+        |- (ReadingBlock): the unsaved block
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    ids = [row[0] for row in rows]
+    columns = [[row[index] for row in rows] for index in range(1, len(COLUMNS) + 1)]
+    return ReadingBlock(plant_id = plant_key, reading_date = reading_date, count = len(rows), data = encode_block(ids, columns),
+                        **{column.replace('_reading', '_sum'): sum(values) for column, values in zip(COLUMNS, columns)})
+
+def block_rows(block) -> list:
+    '''
+    Gets the (id, soil moisture, light intensity, water level) of the readings of a block, sorted by id
+    '''
+    return list(zip(*decode_block(bytes(block.data))))
+
+def block_entries(plant_id, start_date=None, end_date=None, newest_first=True):
+    '''
+    Iterates over the readings stored in the blocks of a plant as CompactedReading tuples sorted by (reading_date, id). The blocks
+    are only fetched and decoded as the iteration goes.
+
+    Arguments:
+        |- start_date: the first date (inclusive), None for no start
+        |- end_date: the last date (inclusive), None for no end
+        |- newest_first: the order of the iteration
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return
+
+    queryset = ReadingBlock.objects.filter(plant_id = key)
+    if start_date != None:
+        queryset = queryset.filter(reading_date__gte = start_date)
+    if end_date != None:
+        queryset = queryset.filter(reading_date__lte = end_date)
+
+    for block in queryset.order_by('-reading_date' if newest_first else 'reading_date').iterator(chunk_size=50):
+        rows = block_rows(block)
+        for row in (reversed(rows) if newest_first else rows):
+            yield CompactedReading(row[0], plant_id, block.reading_date, *row[1:])
+
+def merge_entries(sources, newest_first=True):
+    '''
+    Merges iterables of reading entries that are each sorted by (reading_date, id) into a single sorted iterable
+    '''
+    return heapq.merge(*sources, key=lambda entry: (entry.reading_date, entry.id), reverse=newest_first)
+
+def drop_blocks_before(date) -> int:
+    '''
+    Removes the blocks of all of the months before the month of the given date, the same months whose partitions are dropped
+    by partitions.drop_partitions_before
+
+    Returns:
+        |- (int): the number of blocks removed
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    first_kept_day = partitions.month_bounds(partitions.month_of(date))[0]
+    removed, _ = ReadingBlock.objects.filter(reading_date__lt = first_kept_day).delete()
+    return removed
+
+def compact(before_date, vacuum=False) -> dict:
+    '''
+    Moves all of the readings older than the given date from the partitions into blocks. Every batch of plants is moved in a
+    single transaction so that a reading is never seen in both places or in neither. A block that already exists for a day is
+    merged with the new readings of that day.
+
+    Arguments:
+        |- before_date: the readings before this date are compacted
+        |- vacuum: runs VACUUM on SQLite afterwards so that the freed space is given back to the file system
+
+    Returns:
+        |- (dict): of the number of readings compacted and of blocks written
+    '''
+    from django.db import connection
+    from smart_plant_api.models import ReadingBlock
+
+    counts = {'readings': 0, 'blocks': 0}
+    #The list of the partitions is read again since some of them may have been dropped since this process read it
+    partitions.existing_months(refresh=True)
+    for model in partitions.partitions_between(end_date=before_date, newest_first=False):
+        old_rows = model.objects.filter(reading_date__lt = before_date)
+        keys = sorted(old_rows.values_list('plant_id', flat=True).distinct())
+
+        for start in range(0, len(keys), COMPACT_BATCH_SIZE):
+            batch = keys[start:start + COMPACT_BATCH_SIZE]
+            with transaction.atomic():
+                rows = (old_rows.filter(plant_id__in = batch)
+                                .order_by('plant_id', 'reading_date', 'id')
+                                .values_list('plant_id', 'reading_date', 'id', *COLUMNS))
+                days = [(key, [row[2:] for row in group]) for key, group in itertools.groupby(rows, key=lambda row: row[:2])]
+                if len(days) == 0:
+                    continue
+
+                existing = {(block.plant_id, block.reading_date): block
+                            for block in ReadingBlock.objects.filter(plant_id__in = batch, reading_date__in = {day for (_, day), _ in days})}
+
+                new_blocks = []
+                for (key, day), day_rows in days:
+                    block = existing.get((key, day))
+                    if block != None:
+                        day_rows = sorted(block_rows(block) + day_rows)
+                        block.delete()
+                    new_blocks.append(make_block(key, day, day_rows))
+                    counts['readings'] += len(day_rows) - (block.count if block != None else 0)
+
+                ReadingBlock.objects.bulk_create(new_blocks, batch_size=500)
+                old_rows.filter(plant_id__in = batch).delete()
+                counts['blocks'] += len(new_blocks)
+
+    if vacuum and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM')
+
+    return counts
@@ -0,0 +1,358 @@
+'''
+A server side cache of the responses of the GET endpoints used by the app.
+
+Every plant has a data version which is bumped whenever its data changes (a new reading, an override being made or removed,
+or its readings being removed). The versions are stored in the DataVersion model rather than in the cache, so that they are
+bumped atomically by every worker and never expire. The cached responses are keyed on the data version, so a response is
+served from the cache until the data of its plant changes, at which point the new version simply misses the cache.
+
+A miss is computed once however many identical requests come in while it is being computed (when a notification makes every
+phone of a plant open the app at once for example). The other requests of the same worker wait for the response of the first
+one, and the requests of the other workers wait for it to show up in the cache while the first one holds a lock. The lock is a
+row of the ResponseLock model, which is taken atomically by its unique key whatever the cache backend (FileBasedCache.add is
+a read followed by a write, so two workers could both take a lock held in it).
+
+The responses carry an ETag made from the state of their plant (its key, its data version, its latest reading and its latest
+override along with whether it is still in effect) rather than from their content, so the app can revalidate what it already
+has with If-None-Match. The state is kept in the DataVersion row of the plant by the writes that bump its version, so the ETag
+is known from that one row and a matching revalidation is answered with a 304 before the view runs.
+
+The views reading the snapshot (see snapshot.snapshot_view) lag behind the data versions, so the ETags of their responses are
+made from the snapshot file they are read from as well. A refresh of the snapshot then changes the ETag, instead of a response
+read from the previous snapshot being revalidated until the next change of the plant.
+'''
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from smart_plant_api import snapshot
+import functools, hashlib, threading, time, uuid
+
+#The responses being computed by this worker, keyed on their cache keys
+_flights = {}
+_flights_lock = threading.Lock()
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE['CACHE']]
+
+def data_version(plant_id) -> int:
+    '''
+    Gets the current data version of a plant, or None if the plant is not in the registry
+    '''
+    return data_versions([plant_id])[plant_id]
+
+def data_versions(plant_ids) -> dict:
+    '''
+    Gets the current data versions of many plants at once
+
+    Returns:
+        |- (dict): of {Plant-Id: data version}. The version is None for the plants that are not in the registry
+    '''
+    from smart_plant_api import plants
+    from smart_plant_api.models import DataVersion
+
+    #The versions are always read from the primary, even inside of snapshot_reads, since a stale version would serve stale responses
+    versions = dict(DataVersion.objects.using('default').filter(plant_id__in = plant_ids).values_list('plant_id', 'version'))
+    missing = [plant_id for plant_id in plant_ids if plant_id not in versions]
+    if missing:
+        #Any Plant-Id can be asked for, so a version is only made for the plants that have data
+        registered = plants.plant_keys(missing)
+        for plant_id in missing:
+            versions[plant_id] = bump_data_version(plant_id) if plant_id in registered else None
+
+    return versions
+
+def initial_state(plant_id) -> dict:
+    '''
+    Reads the state that the ETags of a plant are made from (see DataVersion) out of its data. This is only used for the plants
+    that have no DataVersion yet, since the state is kept up to date by the writes afterwards
+    '''
+    from smart_plant_api import plants, readings
+    from smart_plant_api.models import OverrideRequest
+
+    latest_readings = readings.latest_readings(plant_id)
+    override = OverrideRequest.objects.filter(plant_id = plants.plant_key(plant_id)).order_by('-id').values_list('id', 'request_time').first()
+    return {
+        'latest_reading_id': latest_readings[0].id if latest_readings else None,
+        'override_id': override[0] if override != None else None,
+        'override_time': override[1] if override != None else None,
+    }
+
+def bump_data_version(plant_id, **state) -> int:
+    '''
+    Marks the data of a plant as changed so that its cached responses are no longer used
+
+    Arguments:
+        |- state: the changes to the state that the ETags are made from, which are saved along with the new version. These are
+                  latest_reading_id when a reading is added or removed, and override_id and override_time when an override
+                  request is made or removed
+
+    Returns:
+        |- (int): the new data version of the plant
+    '''
+    from smart_plant_api.models import DataVersion
+
+    with transaction.atomic(using='default'):
+        versions = DataVersion.objects.using('default').filter(plant_id = plant_id)
+        if versions.update(version = F('version') + 1, **state) == 0:
+            #The responses cached before the versions were lost (a new database for example) must not be used again, so a new
+            #version starts from the clock rather than from 0
+            try:
+                with transaction.atomic(using='default'):
+                    DataVersion.objects.using('default').create(plant_id = plant_id, version = time.time_ns(), **{**initial_state(plant_id), **state})
+            except IntegrityError:
+                versions.update(version = F('version') + 1, **state)
+
+        #The update holds the write lock until the end of the transaction, so this is the version set above
+        return versions.values_list('version', flat=True).get()
+
+def bump_data_versions(plant_ids) -> dict:
+    '''
+    Marks the data of many plants as changed at once, with a single update of the versions of every 500 plants. This is used
+    by the commands that rewrite the data of the whole fleet
+
+    Returns:
+        |- (dict): of {Plant-Id: new data version} for the plants that are in the registry
+    '''
+    from smart_plant_api import plants
+    from smart_plant_api.models import DataVersion
+
+    plant_ids = list(plant_ids)
+    versions = {}
+    for start in range(0, len(plant_ids), 500):
+        with transaction.atomic(using='default'):
+            rows = DataVersion.objects.using('default').filter(plant_id__in = plant_ids[start:start + 500])
+            rows.update(version = F('version') + 1)
+            versions.update(rows.values_list('plant_id', 'version'))
+
+    missing = [plant_id for plant_id in plant_ids if plant_id not in versions]
+    if missing:
+        registered = plants.plant_keys(missing)
+        for plant_id in missing:
+            if plant_id in registered:
+                versions[plant_id] = bump_data_version(plant_id)
+
+    return versions
+
+def plant_state(plant_id) -> tuple:
+    '''
+    Gets the state that the cached responses and the ETags of a plant are made from, in a single indexed lookup
+
+    Returns:
+        |- (tuple): of the (plant key, data version, latest reading id, override id, override time) of the plant, or None if
+                    the plant is not in the registry
+    '''
+    from smart_plant_api import plants
+    from smart_plant_api.models import DataVersion, Plant
+
+    state = (DataVersion.objects.using('default').filter(plant_id = plant_id)
+             .annotate(plant_key = Subquery(Plant.objects.filter(plant_id = OuterRef('plant_id')).values('id')))
+             .values_list('plant_key', 'version', 'latest_reading_id', 'override_id', 'override_time')
+             .first())
+
+    if state == None and plants.plant_key(plant_id) != None:
+        #The plant has not changed since the versions were added
+        bump_data_version(plant_id)
+        return plant_state(plant_id)
+
+    return state
+
+def state_etag(request, state, vary_on_headers, source=None) -> str:
+    '''
+    Makes the ETag of a response out of the state of its plant (see plant_state). Nothing else changes the responses but the
+    current date, the headers they vary on, the override expiring, and the snapshot that the response is read from (given in
+    source, see snapshot.snapshot_identity), which are part of the ETag as well
+    '''
+    from smart_plant_api.models import OverrideRequest
+
+    plant_key, version, latest_reading_id, override_id, override_time = state
+    #The same check as views.override_data
+    overridden = override_time != None and OverrideRequest(request_time = override_time).override_since(timezone.now()) <= OverrideRequest.VALIDITY
+
+    headers = "\n".join(f'{header}:{request.headers.get(header, "")}' for header in vary_on_headers)
+    tag = f'{request.path}\n{plant_key}\n{version}\n{latest_reading_id}\n{override_id}:{overridden}\n{timezone.now().date()}\n{headers}\n{source}'
+    return '"{}"'.format(hashlib.md5(tag.encode()).hexdigest())
+
+class Flight:
+    '''
+    A response being computed, which the identical requests wait for
+    '''
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None #The (content, content type, status code) of the response once it is computed
+
+def shared_response(content, content_type, status=200, source='COALESCED') -> HttpResponse:
+    response = HttpResponse(content, content_type=content_type, status=status)
+    response['X-Cache'] = source
+    return response
+
+def acquire_lock(key, now=None) -> str:
+    '''
+    Tries to take the lock telling the other workers that a response is being computed. A lock that has not been released
+    within RESPONSE_CACHE['WAIT_TIMEOUT'] (by a worker that crashed for example) is taken over
+
+    Arguments:
+        |- key: the cache key of the response
+        |- now: the current time in seconds. Defaults to time.time()
+
+    Returns:
+        |- (str): the id that the lock is held with, which is passed to release_lock. None if another worker holds the lock
+    '''
+    from smart_plant_api.models import ResponseLock
+
+    now = time.time() if now == None else now
+    holder = uuid.uuid4().hex
+    expires_at = now + settings.RESPONSE_CACHE['WAIT_TIMEOUT']
+
+    locks = ResponseLock.objects.using('default').filter(key = key)
+    if locks.filter(expires_at__lt = now).update(holder = holder, expires_at = expires_at):
+        return holder
+
+    try:
+        with transaction.atomic(using='default'):
+            ResponseLock.objects.using('default').create(key = key, holder = holder, expires_at = expires_at)
+        return holder
+    except IntegrityError:
+        #Another worker holds the lock
+        return None
+
+def release_lock(key, holder) -> None:
+    '''
+    Gives back the lock taken by acquire_lock, unless it has been taken over since
+    '''
+    from smart_plant_api.models import ResponseLock
+    ResponseLock.objects.using('default').filter(key = key, holder = holder).delete()
+
+def lock_held(key) -> bool:
+    from smart_plant_api.models import ResponseLock
+    return ResponseLock.objects.using('default').filter(key = key, expires_at__gte = time.time()).exists()
+
+def wait_for_other_worker(key):
+    '''
+    Waits for the response that another worker is computing to be added to the cache
+
+    Returns:
+        |- (tuple): of the cached (content, content type), or None if the other worker has not cached it in time
+    '''
+    cache = get_cache()
+    deadline = time.monotonic() + settings.RESPONSE_CACHE['WAIT_TIMEOUT']
+
+    while time.monotonic() < deadline:
+        cached = cache.get(key)
+        if cached != None:
+            return cached
+        if not lock_held(key):
+            #The other worker is done, but its response may not have been cacheable
+            return cache.get(key)
+        time.sleep(settings.RESPONSE_CACHE['POLL_INTERVAL'])
+
+    return None
+
+def single_flight(key, compute) -> HttpResponse:
+    '''
+    Computes a response that missed the cache, unless an identical request is already computing it, in which case its
+    response is used instead
+
+    Arguments:
+        |- key: the cache key of the response
+        |- compute: a function computing the response and adding it to the cache
+    '''
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight == None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if flight.done.wait(settings.RESPONSE_CACHE['WAIT_TIMEOUT']) and flight.result != None:
+            return shared_response(*flight.result)
+        return compute()
+
+    try:
+        holder = acquire_lock(key) if settings.RESPONSE_CACHE['ACROSS_WORKERS'] else None
+
+        if settings.RESPONSE_CACHE['ACROSS_WORKERS'] and holder == None:
+            cached = wait_for_other_worker(key)
+            if cached != None:
+                flight.result = (*cached, 200)
+                return shared_response(*flight.result)
+
+        try:
+            response = compute()
+        finally:
+            if holder != None:
+                release_lock(key, holder)
+
+        if not response.streaming:
+            flight.result = (response.content, response['Content-Type'], response.status_code)
+        return response
+    finally:
+        flight.done.set()
+        with _flights_lock:
+            _flights.pop(key, None)
+
+def cache_response(vary_on_headers=('Plant-Id',)):
+    '''
+    A decorator used to cache the successful responses of a GET view. The responses are keyed on their ETag (see state_etag),
+    which is made from the state of the plant, the current date and the values of the given headers.
+
+    A view can limit how long its response is cached by setting a cache_timeout attribute (in seconds) on the response.
+    This is used for the responses that change with time alone, such as the ones showing an override that will expire or
+    the ones read from the snapshot. The ETags of the views read from the snapshot are made from the snapshot as well.
+
+    The ETag is known before the view is run, so an If-None-Match header matching it is answered with a 304 without looking the
+    response up or making it at all.
+
+    Arguments:
+        |- vary_on_headers: the request headers that change the response of the view
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            plant_id = request.headers.get('Plant-Id')
+            if request.method != "GET" or plant_id == None:
+                return view(request, *args, **kwargs)
+
+            state = plant_state(plant_id)
+            if state == None:
+                #The plant has no data, which the view answers
+                return view(request, *args, **kwargs)
+
+            #The view uses the data version that has just been read instead of reading it again (see timeseries.series_for)
+            request.data_version = state[1]
+
+            source = snapshot.snapshot_identity() if getattr(view, 'reads_snapshot', False) else None
+            etag = state_etag(request, state, vary_on_headers, source)
+            response = get_conditional_response(request, etag=etag)
+            if response != None:
+                response['ETag'] = etag
+                return response
+
+            key = 'response:{}:{}:{}'.format(request.path, plant_id, etag.strip('"'))
+            cache = get_cache()
+            cached = cache.get(key)
+            if cached != None:
+                response = shared_response(*cached, source='HIT')
+                response['ETag'] = etag
+                return response
+
+            def compute():
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    timeout = min(settings.RESPONSE_CACHE['TIMEOUT'], getattr(response, 'cache_timeout', settings.RESPONSE_CACHE['TIMEOUT']))
+                    if timeout > 0:
+                        cache.set(key, (response.content, response['Content-Type']), timeout)
+                    response['X-Cache'] = 'MISS'
+
+                return response
+
+            response = single_flight(key, compute) if settings.RESPONSE_CACHE['SINGLE_FLIGHT'] else compute()
+            if response.status_code == 200:
+                response['ETag'] = etag
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,114 @@
+'''
+A lean entry point for the device traffic. The sensors call /AddEntry and /ActuatorData far more often than the app calls
+anything else, and they are identified by their Plant-Id header alone, so the sessions, authentication, messages, CSRF and
+clickjacking middleware, and the URL resolution are pure overhead for them.
+
+FastPathWSGI and FastPathASGI wrap the Django application in CapstoneServer/wsgi.py and CapstoneServer/asgi.py. The paths in
+FAST_PATH_ROUTES are answered by calling their views directly, and everything else is handed to Django untouched. What the
+device views still rely on is kept:
+    |- the request_started and request_finished signals, which manage the database connections
+    |- the host validation against ALLOWED_HOSTS
+    |- the conversion of exceptions to responses (and their logging) done by Django
+    |- the opt in profiling of profiling.ProfilingMiddleware
+The decorators of the views (admission control, the response cache, csrf_exempt) are part of the views and work as before.
+
+The overhead saved can be measured with python manage.py benchmark_entrypoints.
+'''
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from django.core.handlers.asgi import ASGIRequest
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+import io
+
+_routes = None
+
+def routes() -> dict:
+    '''
+    Gets the views of the FAST_PATH_ROUTES, wrapped in the profiling middleware. The views are taken from the URL configuration
+    so that both entry points always serve the same view for a path
+    '''
+    global _routes
+    if _routes == None:
+        from django.urls import get_resolver
+        from smart_plant_api.profiling import ProfilingMiddleware
+
+        resolver = get_resolver()
+        _routes = {path: ProfilingMiddleware(resolver.resolve(path).func) for path in settings.FAST_PATH_ROUTES}
+
+    return _routes
+
+def get_response(request, view):
+    '''
+    Runs a view the way Django would once the request has gone through the middleware
+    '''
+    try:
+        #Raises DisallowedHost for the hosts that are not in ALLOWED_HOSTS, just like CommonMiddleware does
+        request.get_host()
+        response = view(request)
+    except Exception as exception:
+        response = response_for_exception(request, exception)
+
+    response._resource_closers.append(request.close)
+    return response
+
+def response_headers(response) -> list:
+    return [*response.items(), *(('Set-Cookie', cookie.output(header='')) for cookie in response.cookies.values())]
+
+class FastPathWSGI:
+    '''
+    The WSGI application serving the device routes directly and passing everything else to the Django application
+    '''
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        view = routes().get(environ.get('PATH_INFO'))
+        if view == None:
+            return self.application(environ, start_response)
+
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        response = get_response(WSGIRequest(environ), view)
+
+        #The WSGI server closes the response once it has been sent, which sends the request_finished signal
+        start_response(f'{response.status_code} {response.reason_phrase}', response_headers(response))
+        return response
+
+class FastPathASGI:
+    '''
+    The ASGI application serving the device routes directly and passing everything else to the Django application
+    '''
+    def __init__(self, application):
+        self.application = application
+
+    def respond(self, scope, body) -> tuple:
+        #Runs on the thread of the sync views so that the database connections are opened and closed on the same thread
+        signals.request_started.send(sender=self.__class__, scope=scope)
+        response = get_response(ASGIRequest(scope, io.BytesIO(body)), routes()[scope['path']])
+        try:
+            content = b''.join(response) if response.streaming else response.content
+            return response.status_code, response_headers(response), content
+        finally:
+            response.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in routes():
+            return await self.application(scope, receive, send)
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                break
+
+        status, headers, content = await sync_to_async(self.respond, thread_sensitive=True)(scope, bytes(body))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.encode('latin1'), str(value).encode('latin1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': content})
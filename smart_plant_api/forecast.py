@@ -0,0 +1,169 @@
+'''
+The soil moisture trend and the water tank depletion forecast of every plant. Each plant keeps running, exponentially decayed
+regression sums of its readings against time in the PlantForecast model. They are updated in constant time whenever a reading is
+added, so the forecast is read without going through the history of the plant.
+
+The times in the sums are in hours relative to the latest update, which keeps the sums small and is why they are shifted
+before every update.
+'''
+from django.conf import settings
+from django.db import transaction
+import datetime, json, math
+
+COLUMNS = ('soil_moisture_reading', 'water_level_reading')
+
+#Depletion times further away than this are not reported since the trend is practically flat
+MAX_FORECAST_HOURS = 24 * 365
+
+def empty_statistics() -> dict:
+    statistics = {'weight': 0.0, 'time': 0.0, 'time_square': 0.0}
+    for column in COLUMNS:
+        statistics.update({column: 0.0, f'{column}_square': 0.0, f'{column}_time': 0.0})
+
+    return statistics
+
+def add_reading(statistics, hours_elapsed, readings) -> dict:
+    '''
+    Adds a reading to the running sums
+
+    Arguments:
+        |- statistics: the running sums (see empty_statistics)
+        |- hours_elapsed: the hours since the last update of the sums
+        |- readings: a dict mapping the names in COLUMNS to the new readings
+
+    Returns:
+        |- (dict): the updated sums with the new reading at time 0
+    '''
+    elapsed = max(hours_elapsed, 0)
+    decay = 0.5 ** (elapsed / settings.FORECAST['HALF_LIFE'])
+
+    #Moving the time origin to the new reading
+    statistics['time_square'] += elapsed * (elapsed * statistics['weight'] - 2 * statistics['time'])
+    for column in COLUMNS:
+        statistics[f'{column}_time'] -= elapsed * statistics[column]
+    statistics['time'] -= elapsed * statistics['weight']
+
+    for key in statistics:
+        statistics[key] *= decay
+
+    statistics['weight'] += 1
+    for column in COLUMNS:
+        statistics[column] += readings[column]
+        statistics[f'{column}_square'] += readings[column] ** 2
+
+    return statistics
+
+def regression(statistics, column) -> dict:
+    '''
+    Gets the weighted least squares fit of a column against time
+
+    Returns:
+        |- (dict): of the fit, or None if there is not enough data yet. The following is the format of the dict
+            {
+                trend: (float) the change of the column per hour
+                level: (float) the fitted value of the column at the time of the latest reading
+                mean: (float)
+                deviation: (float) the standard deviation of the column
+            }
+    '''
+    weight = statistics['weight']
+    if weight < settings.FORECAST['MIN_WEIGHT']:
+        return None
+
+    mean_time = statistics['time'] / weight
+    mean = statistics[column] / weight
+    time_variance = statistics['time_square'] / weight - mean_time ** 2
+    if time_variance <= 1e-12:
+        return None
+
+    trend = (statistics[f'{column}_time'] / weight - mean_time * mean) / time_variance
+    return {
+        'trend': trend,
+        'level': mean - trend * mean_time,
+        'mean': mean,
+        'deviation': math.sqrt(max(statistics[f'{column}_square'] / weight - mean ** 2, 0)),
+    }
+
+def record_reading(plant_id, reading, reading_time):
+    '''
+    Adds the latest reading of a plant to its running sums
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- reading: the latest reading entry of the plant
+        |- reading_time: the time that the reading was received at
+
+    Returns:
+        |- (PlantForecast): the updated forecast of the plant
+    '''
+    from smart_plant_api.models import PlantForecast
+
+    with transaction.atomic():
+        forecast = PlantForecast.objects.select_for_update().filter(plant_id = plant_id).first()
+        if forecast == None:
+            forecast = PlantForecast(plant_id = plant_id, updated_at = reading_time, statistics = json.dumps(empty_statistics()))
+
+        statistics = add_reading(json.loads(forecast.statistics),
+                                 (reading_time - forecast.updated_at).total_seconds() / 3600,
+                                 {column: getattr(reading, column) for column in COLUMNS})
+
+        forecast.statistics = json.dumps(statistics)
+        forecast.updated_at = max(forecast.updated_at, reading_time)
+        forecast.save()
+
+    return forecast
+
+def plant_forecast(plant_id, water_low) -> dict:
+    '''
+    Gets the forecast of a plant from its running sums
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- water_low: the water level (in percent) that the depletion time is forecasted for
+
+    Returns:
+        |- (dict): of the forecast. Every value is None if it can not be forecasted yet. The following is the format of the dict
+            {
+                soil_moisture_trend: (float) the change of the soil moisture in percent per hour
+                soil_moisture_deviation: (float) the standard deviation of the soil moisture
+                water_level_trend: (float) the change of the water level in percent per hour
+                water_low_threshold: (int) the water_low argument
+                hours_until_water_low: (float) the hours from the latest reading until the water level reaches the threshold, 0 if it already has and None if it is not decreasing
+                water_low_time: (datetime) the time at which the water level reaches the threshold
+            }
+    '''
+    from smart_plant_api.models import PlantForecast
+
+    result = dict.fromkeys(('soil_moisture_trend', 'soil_moisture_deviation', 'water_level_trend', 'hours_until_water_low', 'water_low_time'))
+    result['water_low_threshold'] = water_low
+
+    forecast = PlantForecast.objects.filter(plant_id = plant_id).first()
+    if forecast == None:
+        return result
+
+    statistics = json.loads(forecast.statistics)
+    soil_moisture = regression(statistics, 'soil_moisture_reading')
+    if soil_moisture != None:
+        result['soil_moisture_trend'] = round(soil_moisture['trend'], 3)
+        result['soil_moisture_deviation'] = round(soil_moisture['deviation'], 3)
+
+    water_level = regression(statistics, 'water_level_reading')
+    if water_level != None:
+        result['water_level_trend'] = round(water_level['trend'], 3)
+
+        if water_level['level'] <= water_low:
+            hours = 0
+        elif water_level['trend'] < 0:
+            hours = (water_low - water_level['level']) / water_level['trend']
+        else:
+            hours = None
+
+        if hours != None and hours <= MAX_FORECAST_HOURS:
+            result['hours_until_water_low'] = round(hours, 1)
+            result['water_low_time'] = forecast.updated_at + datetime.timedelta(hours = hours)
+
+    return result
+
+def delete_forecast(plant_id) -> None:
+    from smart_plant_api.models import PlantForecast
+    PlantForecast.objects.filter(plant_id = plant_id).delete()
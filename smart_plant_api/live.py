@@ -0,0 +1,392 @@
+'''
+The live feed of the smartphone application. The application opens a WebSocket to /Live, subscribes to its Plant-Ids, gets a
+snapshot of every plant and then gets pushed the changes made by AddEntry, Override and RemoveOverride instead of polling
+/AppBasicData.
+
+A connection can only subscribe to the plants that its Expo token is bound to through /BindPlantIdToken, the same binding
+that the push notifications are sent through. The token is given in the Token header of the handshake or in the "token" key
+of a message.
+
+The views publish their changes to an in-process pub/sub. Publishing only puts the changes on a bounded queue, and a
+background thread computes them and fans them out to the subscribed connections, so that the requests never wait for the
+queries of the changes or for a connection. When the queue is full the changes are dropped, and the connections catch up with
+them through the polling of the data versions below. Every connection keeps at most one pending update per plant and merges the
+new changes into it, so a slow connection receives fewer, merged updates and its memory stays bounded by the number of plants it
+subscribed to. A connection that does not accept a message within LIVE_FEED['SEND_TIMEOUT'] seconds is closed.
+
+Changes made by the other worker processes are not published here. They are found by polling the data versions of the
+subscribed plants (see caching.py) every LIVE_FEED['POLL_INTERVAL'] seconds, after which a new snapshot is sent.
+
+Messages sent by the application:
+    |- {"subscribe": [Plant-Ids], "token": ...}: the Plant-Ids can also be given in the Plant-Id header of the handshake, separated by commas
+    |- {"unsubscribe": [Plant-Ids]}
+
+Messages sent to the application:
+    |- {"type": "subscribed", "plant_ids": [...]}: the Plant-Ids that the connection is subscribed to
+    |- {"type": "snapshot", "plant_id": ..., "version": ..., "data": {...}}: the full state of a plant, data is null if the plant has no readings
+    |- {"type": "update", "plant_id": ..., "version": ..., "changes": {...}}: the parts of the state that changed
+    |- {"type": "error", "response": ...}
+'''
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from smart_plant_api import caching, rules
+import asyncio, collections, json, logging, os, queue, threading
+
+logger = logging.getLogger(__name__)
+
+PATH = '/Live'
+
+class Subscription:
+    '''
+    A single WebSocket connection and the plants it is subscribed to. Everything but offer runs on the event loop of the connection
+    '''
+    def __init__(self, loop, token=None):
+        self.loop = loop
+        self.token = token #The Expo token that the subscriptions are checked against
+        self.plant_ids = set()
+        self.versions = {} #The latest data version sent for every plant
+        self.pending = collections.OrderedDict() #The merged changes not sent yet for every plant
+        self.replies = collections.deque()
+        self.ready = asyncio.Event()
+
+    def offer(self, plant_id, version, changes) -> None:
+        '''
+        Hands the changes of a plant to the connection. This can be called from any thread and never waits
+        '''
+        try:
+            self.loop.call_soon_threadsafe(self._merge, plant_id, version, changes)
+        except RuntimeError:
+            #The event loop of the connection has been closed
+            pass
+
+    def _merge(self, plant_id, version, changes) -> None:
+        if plant_id not in self.plant_ids:
+            return
+
+        message = self.pending.get(plant_id)
+        if message == None:
+            self.pending[plant_id] = {'type': 'update', 'plant_id': plant_id, 'version': version, 'changes': dict(changes)}
+        elif message['type'] == 'snapshot':
+            message['data'] = {**(message['data'] or {}), **changes}
+            message['version'] = version
+        else:
+            message['changes'].update(changes)
+            message['version'] = version
+        self.ready.set()
+
+    def reply(self, message) -> None:
+        self.replies.append(message)
+        self.ready.set()
+
+    def next_messages(self) -> list:
+        messages = list(self.replies) + list(self.pending.values())
+        self.replies.clear()
+        self.pending.clear()
+        self.ready.clear()
+
+        for message in messages:
+            if 'version' in message:
+                self.versions[message['plant_id']] = message['version']
+        return messages
+
+_subscriptions = collections.defaultdict(set)
+_lock = threading.Lock()
+
+def subscribe(subscription, plant_id) -> None:
+    with _lock:
+        _subscriptions[plant_id].add(subscription)
+    subscription.plant_ids.add(plant_id)
+
+def unsubscribe(subscription, plant_id) -> None:
+    with _lock:
+        _subscriptions[plant_id].discard(subscription)
+        if not _subscriptions[plant_id]:
+            del _subscriptions[plant_id]
+    subscription.plant_ids.discard(plant_id)
+    subscription.pending.pop(plant_id, None)
+    subscription.versions.pop(plant_id, None)
+
+def authorized_plants(plant_ids, token) -> set:
+    '''
+    Gets the Plant-Ids that the given Expo token is bound to through /BindPlantIdToken
+
+    Arguments:
+        |- plant_ids: the Plant-Ids to check
+        |- token: the Expo token of the connection, or None
+
+    Returns:
+        |- (set): the Plant-Ids out of plant_ids that the token is bound to
+    '''
+    from smart_plant_api import plants
+    from smart_plant_api.models import TokenPlantIDBind
+
+    if not token or not plant_ids:
+        return set()
+
+    keys = plants.plant_keys(plant_ids)
+    binds = TokenPlantIDBind.objects.filter(plant_id__in = list(keys.values())).values_list('plant_id', 'tokens')
+    bound = {plant_key for plant_key, tokens in binds if token in tokens.split(',')}
+    return {plant_id for plant_id, plant_key in keys.items() if plant_key in bound}
+
+#The changes waiting for the publisher thread, as (Plant-Id, version, changes)
+_publications = queue.Queue(10000)
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def _start_publisher() -> None:
+    global _publisher
+
+    with _publisher_lock:
+        if _publisher == None or not _publisher.is_alive():
+            _publisher = threading.Thread(target=_publish_forever, name='live-feed-publisher', daemon=True)
+            _publisher.start()
+
+def _reset_publisher() -> None:
+    #The thread does not survive a fork, so the child starts its own one with its first publication
+    global _publications, _publisher, _publisher_lock
+    _publications, _publisher, _publisher_lock = queue.Queue(10000), None, threading.Lock()
+
+def _publish_forever() -> None:
+    from django.db import close_old_connections
+
+    publications = _publications
+    while True:
+        plant_id, version, changes = publications.get()
+        try:
+            close_old_connections()
+            fan_out(plant_id, version, changes)
+        except Exception:
+            logger.exception('Could not publish the changes of a plant to the live feed', extra={'plant_id': plant_id})
+        finally:
+            publications.task_done()
+
+os.register_at_fork(after_in_child=_reset_publisher)
+
+def publish(plant_id, version, changes) -> int:
+    '''
+    Publishes the changes of a plant to all of its subscribers. The changes are handed to the subscribers by a background thread,
+    so this never runs a query or waits
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- version: the data version of the plant after the changes
+        |- changes: a dict of the changed parts of the state of the plant (see plant_snapshot), or a function returning one.
+            The function is only called if the plant has subscribers, and it is called on the background thread
+
+    Returns:
+        |- (int): the number of subscribers that the changes are going to be handed to
+    '''
+    with _lock:
+        subscribers = len(_subscriptions.get(plant_id, ()))
+
+    if subscribers == 0:
+        return 0
+
+    _start_publisher()
+    try:
+        _publications.put_nowait((plant_id, version, changes))
+    except queue.Full:
+        #The subscribers catch up with these changes through the polling of the data versions
+        logger.warning('The live feed is behind, dropping the changes of a plant', extra={'plant_id': plant_id})
+        return 0
+
+    return subscribers
+
+def fan_out(plant_id, version, changes) -> int:
+    '''
+    Hands the changes of a plant to all of its subscribers. This is what the publisher thread runs for every publication
+
+    Returns:
+        |- (int): the number of subscribers that the changes were handed to
+    '''
+    with _lock:
+        subscribers = list(_subscriptions.get(plant_id, ()))
+
+    if len(subscribers) == 0:
+        return 0
+
+    if callable(changes):
+        changes = changes()
+    for subscription in subscribers:
+        subscription.offer(plant_id, version, changes)
+
+    return len(subscribers)
+
+def decision_changes(decision) -> dict:
+    '''
+    Gets the parts of the state of a plant that come from its precomputed decision (see rules.record_decision)
+    '''
+    state, description = rules.describe_state(decision.plant_state_rule)
+    return {
+        'last_reading_time': decision.reading_time,
+        'sensor_readings': {
+            'Soil Moisture': decision.soil_moisture_reading,
+            'Light Intensity': decision.light_intensity_reading,
+            'Water Level': decision.water_level_reading,
+        },
+        'actuators': {
+            'Lamp Intensity State': decision.lamp_intensity_state,
+            'Water Pump State': decision.water_pump_state,
+        },
+        'plant_state': {'state': state, 'description': description},
+    }
+
+def override_changes(plant_id) -> dict:
+    '''
+    Gets the parts of the state of a plant that depend on its override requests. The actuators and the plant state follow the
+    active override if there is one and the precomputed decision otherwise
+    '''
+    from smart_plant_api.models import PlantDecision
+    from smart_plant_api.views import override_data
+
+    override_info = override_data(plant_id)
+    changes = {'override': override_info['isOverridden'], 'override_expires': override_info['expires']}
+
+    decision = PlantDecision.objects.filter(plant_id = plant_id).first()
+    if override_info['isOverridden'] == True:
+        changes['actuators'] = dict(override_info['data'])
+        if decision != None:
+            state, description = rules.rules_for(plant_id).plant_state(decision.soil_moisture_reading, decision.light_intensity_reading, decision.water_level_reading,
+                                                                      override_info['data']['Lamp Intensity State'], override_info['data']['Water Pump State'])
+            changes['plant_state'] = {'state': state, 'description': description}
+    elif decision != None:
+        changes.update({key: value for key, value in decision_changes(decision).items() if key in ('actuators', 'plant_state')})
+
+    return changes
+
+def reading_changes(plant_id, decision) -> dict:
+    '''
+    Gets the parts of the state of a plant that change with a new reading, given the decision made for that reading
+    '''
+    changes = decision_changes(decision)
+    overrides = override_changes(plant_id)
+    if overrides['override'] == True:
+        changes.update(overrides)
+
+    return changes
+
+def plant_snapshot(plant_id) -> dict:
+    '''
+    Gets the full state of a plant, or None if the plant has no readings. The following is the format of the dict
+        {
+            last_reading_time: (datetime)
+            sensor_readings: {"Soil Moisture": (int), "Light Intensity": (int), "Water Level": (int)}
+            actuators: {"Lamp Intensity State": (int), "Water Pump State": (bool)}
+            plant_state: {state: (str), description: (str)}
+            override: (bool)
+            override_expires: (datetime) or None
+        }
+    '''
+    from smart_plant_api.models import PlantDecision
+
+    decision = PlantDecision.objects.filter(plant_id = plant_id).first()
+    if decision == None:
+        return None
+
+    return {**decision_changes(decision), **override_changes(plant_id)}
+
+def snapshot_message(plant_id) -> dict:
+    version = caching.data_version(plant_id)
+    return {'type': 'snapshot', 'plant_id': plant_id, 'version': version, 'data': plant_snapshot(plant_id)}
+
+def changed_plants(versions) -> list:
+    '''
+    Gets the Plant-Ids whose data versions differ from the given {Plant-Id: version}
+    '''
+    current_versions = caching.data_versions(list(versions))
+    return [plant_id for plant_id, version in versions.items() if current_versions[plant_id] != version]
+
+async def _send(send, message) -> None:
+    await asyncio.wait_for(send({'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder)}),
+                           settings.LIVE_FEED['SEND_TIMEOUT'])
+
+async def _send_messages(subscription, send) -> None:
+    while True:
+        try:
+            await asyncio.wait_for(subscription.ready.wait(), settings.LIVE_FEED['POLL_INTERVAL'])
+        except asyncio.TimeoutError:
+            #Catching up with the changes made by the other workers
+            versions = {plant_id: version for plant_id, version in subscription.versions.items() if plant_id not in subscription.pending}
+            for plant_id in await sync_to_async(changed_plants)(versions):
+                if plant_id in subscription.plant_ids and plant_id not in subscription.pending:
+                    subscription.pending[plant_id] = await sync_to_async(snapshot_message)(plant_id)
+            if not subscription.pending:
+                continue
+
+        for message in subscription.next_messages():
+            await _send(send, message)
+
+async def _handle_message(subscription, text) -> None:
+    from smart_plant_api.views import generate_error_message
+
+    try:
+        message = json.loads(text)
+        if not isinstance(message, dict):
+            raise ValueError
+        subscribing = [str(plant_id) for plant_id in message.get('subscribe', [])]
+        unsubscribing = [str(plant_id) for plant_id in message.get('unsubscribe', [])]
+        if message.get('token') != None:
+            subscription.token = str(message['token'])
+    except (ValueError, TypeError):
+        return subscription.reply({'type': 'error', 'response': generate_error_message('Messages must be JSON objects with a "subscribe" or an "unsubscribe" list of Plant-Ids')})
+
+    for plant_id in unsubscribing:
+        unsubscribe(subscription, plant_id)
+
+    new_plant_ids = [plant_id for plant_id in dict.fromkeys(subscribing) if plant_id not in subscription.plant_ids]
+    if len(subscription.plant_ids) + len(new_plant_ids) > settings.LIVE_FEED['MAX_PLANTS_PER_CONNECTION']:
+        return subscription.reply({'type': 'error', 'response': generate_error_message(f'A connection can only subscribe to {settings.LIVE_FEED["MAX_PLANTS_PER_CONNECTION"]} plants')})
+
+    authorized = await sync_to_async(authorized_plants)(new_plant_ids, subscription.token)
+    refused = [plant_id for plant_id in new_plant_ids if plant_id not in authorized]
+    if refused:
+        subscription.reply({'type': 'error', 'response': generate_error_message(f'The token of the connection is not bound to the Plant-Ids {", ".join(refused)}')})
+
+    for plant_id in [plant_id for plant_id in new_plant_ids if plant_id in authorized]:
+        #Subscribing before taking the snapshot so that no change made in between is missed
+        subscribe(subscription, plant_id)
+        subscription.pending[plant_id] = await sync_to_async(snapshot_message)(plant_id)
+
+    subscription.reply({'type': 'subscribed', 'plant_ids': sorted(subscription.plant_ids)})
+
+async def websocket_application(scope, receive, send) -> None:
+    '''
+    The ASGI application of the WebSocket connections. It is routed to from CapstoneServer/asgi.py
+    '''
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    if scope['path'].rstrip('/') != PATH:
+        return await send({'type': 'websocket.close', 'code': 4404})
+
+    await send({'type': 'websocket.accept'})
+    headers = dict(scope.get('headers', []))
+    subscription = Subscription(asyncio.get_running_loop(), headers.get(b'token', b'').decode().strip() or None)
+    sender = asyncio.ensure_future(_send_messages(subscription, send))
+
+    try:
+        plant_ids = [plant_id.strip() for plant_id in headers.get(b'plant-id', b'').decode().split(',') if plant_id.strip()]
+        if plant_ids:
+            await _handle_message(subscription, json.dumps({'subscribe': plant_ids}))
+
+        while True:
+            receiving = asyncio.ensure_future(receive())
+            done, _ = await asyncio.wait({receiving, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                #The connection was too slow or sending failed
+                receiving.cancel()
+                sender.result()
+
+            event = receiving.result()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] == 'websocket.receive':
+                await _handle_message(subscription, event.get('text') or (event.get('bytes') or b'').decode())
+    except asyncio.TimeoutError:
+        await send({'type': 'websocket.close', 'code': 1008})
+    finally:
+        sender.cancel()
+        for plant_id in list(subscription.plant_ids):
+            unsubscribe(subscription, plant_id)
@@ -0,0 +1,130 @@
+'''
+The logging of the server. The records are put on a queue by the thread handling the request and written out as JSON lines by a
+background thread, so a request never waits for stdout. The handler and the filter are set up by LOGGING in the settings.
+
+The views log structured events: the message names the event and the values go in the extra argument, for example
+    logger.debug('Reading received', extra={'plant_id': plant_id, 'soil_moisture': 40})
+which is written out as
+    {"time": "...", "level": "DEBUG", "logger": "smart_plant_api.views", "message": "Reading received", "plant_id": "...", "soil_moisture": 40}
+
+The debug events are sent on every ingest and actuator poll, so only 1 of every few debug records of the same event is kept.
+'''
+import atexit, copy, itertools, json, logging, logging.handlers, os, queue, sys, time, weakref
+
+#The attributes that every record has, anything else on a record was given in extra
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', logging.INFO, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats a record as a single line JSON object of its time (in UTC), level, logger, message and extra values
+    '''
+    converter = time.gmtime
+
+    def format(self, record) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+
+        return json.dumps(data, default=str)
+
+    def formatTime(self, record, datefmt=None) -> str:
+        return super().formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}Z'
+
+class SampleFilter(logging.Filter):
+    '''
+    Keeps only 1 of every rate debug records of the same event. The records of the other levels are always kept
+    '''
+    def __init__(self, rate=1):
+        super().__init__()
+        self.rate = max(int(rate), 1)
+        self.counters = {}
+
+    def filter(self, record) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+
+        counter = self.counters.get((record.name, record.msg))
+        if counter == None:
+            counter = self.counters.setdefault((record.name, record.msg), itertools.count())
+        return next(counter) % self.rate == 0
+
+_handlers = weakref.WeakSet()
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    '''
+    Puts the records on a bounded queue which a background thread writes to the stream. When the queue is full the records are
+    dropped instead of making the request wait, and the number of dropped records is added to the next record that gets through
+    '''
+    def __init__(self, stream=None, max_size=10000):
+        super().__init__(queue.Queue(max_size))
+        self.stream = stream or sys.stdout
+        self.max_size = max_size
+        self.dropped = 0
+        self.listener = None
+        self.start()
+        _handlers.add(self)
+
+    def start(self) -> None:
+        output = logging.StreamHandler(self.stream)
+        output.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, output)
+        self.listener.start()
+
+    def stop(self) -> None:
+        if self.listener != None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart(self) -> None:
+        '''
+        Starts a new queue and thread. The thread of the parent process does not exist in a forked worker process
+        '''
+        if self.listener == None:
+            return
+
+        self.queue = queue.Queue(self.max_size)
+        self.start()
+
+    def prepare(self, record):
+        #Only the message and the traceback need to be turned into text here, the JSON is built by the background thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        if self.dropped:
+            record.dropped, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1 + getattr(record, 'dropped', 0)
+
+    def close(self) -> None:
+        self.stop()
+        super().close()
+
+def _restart_handlers() -> None:
+    for handler in list(_handlers):
+        handler.restart()
+
+def _stop_handlers() -> None:
+    #Writing out the records still on the queue before the process exits
+    for handler in list(_handlers):
+        handler.stop()
+
+os.register_at_fork(after_in_child=_restart_handlers)
+atexit.register(_stop_handlers)
@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from smart_plant_api import partitions, readings
+from smart_plant_api.management.commands.generate_fleet import plant_name
+import contextlib, datetime, io, json, logging, os, random, statistics, time, tracemalloc
+
+PREFIX = 'benchmark'
+
+def add_entry_payload(plant_id) -> dict:
+    #The payload is kept away from the thresholds of the notifications since the generated plants have no tokens to send them to
+    water_level = readings.latest_readings(plant_id)[0].water_level_reading
+    return {'Soil Moisture': 60, 'Light Intensity': 60, 'Water Level': max(water_level, 20)}
+
+#The views that are measured as (name, method, path, extra headers, function giving the payload for a Plant-Id)
+VIEWS = (
+    ('AddEntry', 'post', '/AddEntry', {}, add_entry_payload),
+    ('ActuatorData', 'get', '/ActuatorData', {}, None),
+    ('AppBasicData', 'get', '/AppBasicData', {}, None),
+    ('StatisticalData', 'get', '/StatisticalData', {}, None),
+)
+
+#Every cache is replaced by a local memory cache so that the benchmark never reads or changes the caches of the server
+BENCHMARK_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'benchmark-{alias}'}
+    for alias in settings.CACHES
+}
+
+#The snapshot is a copy of the database of the server rather than of the throwaway database, so every read goes to the primary
+BENCHMARK_SNAPSHOT = {**settings.SNAPSHOT, 'ENABLED': False}
+
+def percentile(values, fraction) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Command(BaseCommand):
+    help = ('Measures the latency and the memory of the views as the amount of data grows. A throwaway database is filled with '
+            'growing synthetic fleets (see generate_fleet) and every view is requested for random plants of every fleet size.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='The fleet sizes (numbers of plants) to measure')
+        parser.add_argument('--days', type=int, default=30, help='The number of days of history of every plant')
+        parser.add_argument('--interval', type=int, default=60, help='The number of minutes between two readings of a plant')
+        parser.add_argument('--requests', type=int, default=50, help='The number of requests made to every view for every fleet size')
+        parser.add_argument('--seed', default='0', help='The seed of the generated fleet and of the requested plants')
+        parser.add_argument('--database', default=os.path.join(settings.BASE_DIR, 'benchmark.sqlite3'), help='The path of the throwaway database')
+        parser.add_argument('--keep', action='store_true', help='Keeps the throwaway database after the benchmark')
+        parser.add_argument('--output', help='Writes the results as JSON to the given file so that they can be compared between versions')
+        parser.add_argument('--plot', help='Plots the scaling curves to the given image file. This needs matplotlib')
+
+    def handle(self, *args, **options):
+        if options['plot']:
+            try:
+                import matplotlib
+            except ImportError:
+                raise CommandError('Plotting needs matplotlib. Install it with "pip install matplotlib" or leave out --plot')
+
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark only supports SQLite databases')
+
+        sizes = sorted(set(options['sizes']))
+        end_date = timezone.now().date() - datetime.timedelta(days=1)
+        results = []
+
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        #The debug events of the views would be mixed with the report
+        logging.disable(logging.DEBUG)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES, SNAPSHOT=BENCHMARK_SNAPSHOT):
+                generated = 0
+                for size in sizes:
+                    call_command('generate_fleet', plants=size - generated, first_plant=generated, days=options['days'],
+                                 interval=options['interval'], end_date=end_date, seed=options['seed'], prefix=PREFIX, stdout=io.StringIO())
+                    generated = size
+                    partitions.existing_months(refresh=True)
+
+                    result = self.measure(size, options)
+                    results.append(result)
+                    self.report(result)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keep'])
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'days': options['days'], 'interval': options['interval'], 'requests': options['requests'], 'results': results}, output, indent=4)
+
+        if options['plot']:
+            self.plot(results, options['plot'])
+
+    def measure(self, size, options) -> dict:
+        '''
+        Requests every view for random plants, once to time the requests and once more with tracemalloc to measure their memory
+
+        Returns:
+            |- (dict): of the results of the fleet size
+        '''
+        client = Client()
+        chooser = random.Random(f'{options["seed"]}:{size}')
+        result = {
+            'plants': size,
+            'readings': sum(model.objects.count() for model in partitions.partitions_between()),
+            'database_mb': os.path.getsize(options['database']) / 2 ** 20,
+            'views': {},
+        }
+
+        for name, method, path, headers, payload in VIEWS:
+            plant_ids = [plant_name(PREFIX, chooser.randrange(size)) for _ in range(options['requests'])]
+            latencies, memory = [], []
+
+            for measuring_memory in (False, True):
+                if measuring_memory:
+                    tracemalloc.start()
+
+                for plant_id in plant_ids:
+                    #Every request runs the view itself instead of being answered from the response cache
+                    for cache in caches.all():
+                        cache.clear()
+
+                    request = getattr(client, method)
+                    kwargs = {'HTTP_PLANT_ID': plant_id, **headers}
+                    if payload != None:
+                        kwargs.update(data=json.dumps(payload(plant_id)), content_type='application/json')
+
+                    if measuring_memory:
+                        tracemalloc.reset_peak()
+                        baseline = tracemalloc.get_traced_memory()[0]
+
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        response = request(path, **kwargs)
+                    elapsed = time.perf_counter() - start
+
+                    if response.status_code != 200:
+                        raise CommandError(f'{name} responded with {response.status_code} for {plant_id}: {response.content[:500]}')
+
+                    if measuring_memory:
+                        memory.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+                    else:
+                        latencies.append(elapsed * 1000)
+
+                if measuring_memory:
+                    tracemalloc.stop()
+
+            result['views'][name] = {
+                'median_ms': statistics.median(latencies),
+                'p95_ms': percentile(latencies, 0.95),
+                'max_ms': max(latencies),
+                'peak_memory_kb': statistics.mean(memory),
+            }
+
+        return result
+
+    def report(self, result) -> None:
+        self.stdout.write(f'{result["plants"]} plants, {result["readings"]} readings, {result["database_mb"]:.1f} MB')
+        for name, view in result['views'].items():
+            self.stdout.write(f'    {name:<16} median {view["median_ms"]:8.2f} ms  p95 {view["p95_ms"]:8.2f} ms  '
+                              f'max {view["max_ms"]:8.2f} ms  peak memory {view["peak_memory_kb"]:8.1f} KB')
+
+    def plot(self, results, path) -> None:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot
+
+        figure, (latency_axis, memory_axis) = pyplot.subplots(1, 2, figsize=(12, 5))
+        readings_counts = [result['readings'] for result in results]
+        for name, *_ in VIEWS:
+            latency_axis.plot(readings_counts, [result['views'][name]['median_ms'] for result in results], marker='o', label=f'{name} (median)')
+            latency_axis.plot(readings_counts, [result['views'][name]['p95_ms'] for result in results], linestyle='--', color=latency_axis.lines[-1].get_color(), label=f'{name} (p95)')
+            memory_axis.plot(readings_counts, [result['views'][name]['peak_memory_kb'] for result in results], marker='o', label=name)
+
+        for axis, label in ((latency_axis, 'Latency (ms)'), (memory_axis, 'Peak memory per request (KB)')):
+            axis.set_xscale('log')
+            axis.set_xlabel('Readings in the database')
+            axis.set_ylabel(label)
+            axis.grid(True, which='both', alpha=0.3)
+            axis.legend(fontsize='small')
+
+        figure.suptitle('Scaling of the views with the amount of data')
+        figure.tight_layout()
+        figure.savefig(path)
+        self.stdout.write(f'The scaling curves have been plotted to {path}')
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from smart_plant_api import fastpath, partitions
+from smart_plant_api.management.commands.benchmark import BENCHMARK_CACHES, BENCHMARK_SNAPSHOT, PREFIX, add_entry_payload, percentile
+from smart_plant_api.management.commands.generate_fleet import plant_name
+import datetime, io, json, logging, os, random, statistics, time
+
+#The device routes that are measured as (name, method, path, function giving the payload for a Plant-Id)
+ROUTES = (
+    ('AddEntry', 'POST', '/AddEntry', add_entry_payload),
+    ('ActuatorData', 'GET', '/ActuatorData', None),
+)
+
+#The admission control would start rejecting the benchmark after a few requests of the same plant
+BENCHMARK_ADMISSION_CONTROL = {**settings.ADMISSION_CONTROL, 'BUCKET_CAPACITY': 10 ** 9, 'REFILL_RATE': 10 ** 9}
+
+def make_environ(method, path, plant_id, payload=None) -> dict:
+    body = json.dumps(payload).encode() if payload != None else b''
+    return {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_PLANT_ID': plant_id,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+
+class Command(BaseCommand):
+    help = ('Measures the per request overhead of the entry points on the device routes: the full Django stack, the fast path '
+            '(see smart_plant_api/fastpath.py), and the view called on its own as the lower bound.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='The number of requests made to every route through every entry point')
+        parser.add_argument('--plants', type=int, default=50, help='The number of generated plants that the requests are spread over')
+        parser.add_argument('--seed', default='0', help='The seed of the generated fleet and of the requested plants')
+        parser.add_argument('--database', default=os.path.join(settings.BASE_DIR, 'benchmark.sqlite3'), help='The path of the throwaway database')
+        parser.add_argument('--keep', action='store_true', help='Keeps the throwaway database after the benchmark')
+        parser.add_argument('--output', help='Writes the results as JSON to the given file')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark only supports SQLite databases')
+
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        #The debug events of the views would be mixed with the report
+        logging.disable(logging.DEBUG)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES, ADMISSION_CONTROL=BENCHMARK_ADMISSION_CONTROL, SNAPSHOT=BENCHMARK_SNAPSHOT):
+                call_command('generate_fleet', plants=options['plants'], days=1, end_date=timezone.now().date() - datetime.timedelta(days=1),
+                             seed=options['seed'], prefix=PREFIX, stdout=io.StringIO())
+                partitions.existing_months(refresh=True)
+                results = self.measure(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keep'])
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+
+        for name, entry_points in results.items():
+            self.stdout.write(name)
+            for entry_point, result in entry_points.items():
+                overhead = f'overhead {result["overhead_us"]:8.1f} us' if 'overhead_us' in result else ''
+                self.stdout.write(f'    {entry_point:<10} median {result["median_us"]:8.1f} us  p95 {result["p95_us"]:8.1f} us  {overhead}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'requests': options['requests'], 'results': results}, output, indent=4)
+
+    def measure(self, options) -> dict:
+        '''
+        Requests every route through every entry point. The entry points take turns in a random order on every round so that a
+        drift of the machine affects all of them the same way
+
+        Returns:
+            |- (dict): of the latencies of every entry point of every route
+        '''
+        django_application = WSGIHandler()
+        entry_points = {
+            'django': django_application,
+            'fast path': fastpath.FastPathWSGI(django_application),
+            'view only': None,
+        }
+        chooser = random.Random(options['seed'])
+        results = {}
+
+        for name, method, path, payload in ROUTES:
+            view = fastpath.routes()[path]
+            latencies = {entry_point: [] for entry_point in entry_points}
+
+            for _ in range(options['requests']):
+                plant_id = plant_name(PREFIX, chooser.randrange(options['plants']))
+                order = list(entry_points.items())
+                chooser.shuffle(order)
+
+                for entry_point, application in order:
+                    environ = make_environ(method, path, plant_id, payload(plant_id) if payload != None else None)
+                    start = time.perf_counter()
+                    if application == None:
+                        response = view(WSGIRequest(environ))
+                    else:
+                        response = application(environ, lambda status, headers: None)
+                        b''.join(response)
+                        response.close()
+                    latencies[entry_point].append((time.perf_counter() - start) * 10 ** 6)
+
+                    if response.status_code != 200:
+                        raise CommandError(f'{name} responded with {response.status_code} through {entry_point}: {response.content[:500]}')
+
+            view_median = statistics.median(latencies['view only'])
+            results[name] = {}
+            for entry_point, values in latencies.items():
+                results[name][entry_point] = {'median_us': statistics.median(values), 'p95_us': percentile(values, 0.95)}
+                if entry_point != 'view only':
+                    results[name][entry_point]['overhead_us'] = statistics.median(values) - view_median
+
+        return results
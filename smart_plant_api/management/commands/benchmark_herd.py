@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from smart_plant_api import partitions
+from smart_plant_api.caching import bump_data_version
+from smart_plant_api.management.commands.benchmark import BENCHMARK_CACHES, BENCHMARK_SNAPSHOT, PREFIX, percentile
+from smart_plant_api.management.commands.generate_fleet import plant_name
+import datetime, io, json, logging, multiprocessing, os, statistics, tempfile, threading, time
+
+#The app endpoints that are opened by every phone of a plant at once
+PATHS = ('/AppBasicData', '/StatisticalData')
+
+#The coalescing settings that are compared as (name, settings)
+MODES = (
+    ('none', {'SINGLE_FLIGHT': False, 'ACROSS_WORKERS': False}),
+    ('in worker', {'SINGLE_FLIGHT': True, 'ACROSS_WORKERS': False}),
+    ('across workers', {'SINGLE_FLIGHT': True, 'ACROSS_WORKERS': True}),
+)
+
+def run_worker(path, plant_id, threads, barrier, results) -> None:
+    '''
+    Makes the requests of a worker process, one per thread, all released at the same time by the barrier shared by every worker.
+    The (status code, X-Cache header, number of queries, latency in ms) of every request is put on the results queue
+    '''
+    def request(outcomes):
+        queries = []
+        client = Client()
+        barrier.wait()
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(lambda execute, sql, params, many, context: queries.append(sql) or execute(sql, params, many, context)):
+            response = client.get(path, HTTP_PLANT_ID=plant_id)
+        outcomes.append((response.status_code, response.get('X-Cache'), len(queries), (time.perf_counter() - start) * 1000))
+        connection.close()
+
+    outcomes = []
+    requests = [threading.Thread(target=request, args=(outcomes,)) for _ in range(threads)]
+    for thread in requests:
+        thread.start()
+    for thread in requests:
+        thread.join()
+
+    results.put(outcomes)
+
+class Command(BaseCommand):
+    help = ('Measures the load of a thundering herd on the app endpoints: every phone bound to a plant opening the app at the same '
+            'moment after a notification. The herd is made by several worker processes with several threads each, and is run '
+            'without request coalescing, with coalescing in every worker, and with coalescing across the workers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='The number of worker processes of the herd')
+        parser.add_argument('--threads', type=int, default=8, help='The number of simultaneous requests of every worker')
+        parser.add_argument('--rounds', type=int, default=5, help='The number of herds sent to every endpoint in every mode')
+        parser.add_argument('--days', type=int, default=30, help='The number of days of history of the plant')
+        parser.add_argument('--seed', default='0', help='The seed of the generated plant')
+        parser.add_argument('--database', default=os.path.join(settings.BASE_DIR, 'benchmark.sqlite3'), help='The path of the throwaway database')
+        parser.add_argument('--keep', action='store_true', help='Keeps the throwaway database after the benchmark')
+        parser.add_argument('--output', help='Writes the results as JSON to the given file')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark only supports SQLite databases')
+
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        #The debug events of the views would be mixed with the report
+        logging.disable(logging.DEBUG)
+        try:
+            with tempfile.TemporaryDirectory() as cache_directory:
+                #The workers only share the response cache if it is outside of their memory
+                herd_caches = {**BENCHMARK_CACHES, settings.RESPONSE_CACHE['CACHE']: {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': cache_directory,
+                }}
+                with override_settings(CACHES=herd_caches, SNAPSHOT=BENCHMARK_SNAPSHOT):
+                    call_command('generate_fleet', plants=1, days=options['days'], end_date=timezone.now().date() - datetime.timedelta(days=1),
+                                 seed=options['seed'], prefix=PREFIX, stdout=io.StringIO())
+                    partitions.existing_months(refresh=True)
+                    results = self.measure(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keep'])
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+
+        self.stdout.write(f'{options["workers"]} workers x {options["threads"]} threads = {options["workers"] * options["threads"]} simultaneous requests per herd')
+        for path, modes in results.items():
+            self.stdout.write(path)
+            for mode, result in modes.items():
+                self.stdout.write(f'    {mode:<15} computed {result["computed"]:5.1f}  queries {result["queries"]:7.1f}  '
+                                  f'median {result["median_ms"]:8.1f} ms  p95 {result["p95_ms"]:8.1f} ms  (per herd)')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'workers': options['workers'], 'threads': options['threads'], 'results': results}, output, indent=4)
+
+    def measure(self, options) -> dict:
+        '''
+        Sends the herds of every mode to every endpoint. The data version of the plant is bumped before every herd so that all
+        of its requests miss the response cache
+
+        Returns:
+            |- (dict): of the average number of responses computed and of queries made per herd, and of the latencies
+        '''
+        plant_id = plant_name(PREFIX, 0)
+        context = multiprocessing.get_context('fork')
+        results = {}
+
+        for path in PATHS:
+            results[path] = {}
+            for mode, mode_settings in MODES:
+                outcomes = []
+                with override_settings(RESPONSE_CACHE={**settings.RESPONSE_CACHE, **mode_settings}):
+                    for _ in range(options['rounds']):
+                        bump_data_version(plant_id)
+                        #The workers must not share the connections of this process
+                        connections.close_all()
+
+                        barrier, queue = context.Barrier(options['workers'] * options['threads']), context.Queue()
+                        workers = [context.Process(target=run_worker, args=(path, plant_id, options['threads'], barrier, queue))
+                                   for _ in range(options['workers'])]
+                        for worker in workers:
+                            worker.start()
+                        for _ in workers:
+                            outcomes.extend(queue.get())
+                        for worker in workers:
+                            worker.join()
+
+                failed = [outcome for outcome in outcomes if outcome[0] != 200]
+                if failed:
+                    raise CommandError(f'{path} responded with {failed[0][0]} in {len(failed)} requests')
+
+                latencies = [outcome[3] for outcome in outcomes]
+                results[path][mode] = {
+                    'computed': sum(outcome[1] == 'MISS' for outcome in outcomes) / options['rounds'],
+                    'queries': sum(outcome[2] for outcome in outcomes) / options['rounds'],
+                    'median_ms': statistics.median(latencies),
+                    'p95_ms': percentile(latencies, 0.95),
+                }
+
+        return results
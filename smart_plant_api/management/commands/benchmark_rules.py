@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from smart_plant_api import rules
+import json, random, statistics, time
+
+def random_columns(rows, seed) -> tuple:
+    '''
+    Gets random (light intensity, soil moisture, old soil moisture, water level) columns that cover every band and threshold
+    '''
+    chooser = random.Random(seed)
+    soil_moisture = [chooser.randint(0, 100) for _ in range(rows)]
+    return ([chooser.randint(0, 120) for _ in range(rows)],
+            soil_moisture,
+            [max(0, min(100, value + chooser.randint(-6, 6))) for value in soil_moisture],
+            [chooser.randint(0, 100) for _ in range(rows)])
+
+def evaluate_rows(plant_rules, light_intensity, soil_moisture, old_soil_moisture, water_level) -> dict:
+    '''
+    Evaluates the columns one plant at a time, the way AddEntry does it
+    '''
+    results = {'lamp_intensity_state': [], 'water_pump_state': [], 'plant_state_rule': []}
+    for light, moisture, old_moisture, water in zip(light_intensity, soil_moisture, old_soil_moisture, water_level):
+        lamp_intensity_state, water_pump_state = plant_rules.actuators(light, moisture, old_moisture)
+        results['lamp_intensity_state'].append(lamp_intensity_state)
+        results['water_pump_state'].append(water_pump_state)
+        results['plant_state_rule'].append(plant_rules.plant_state_rule(moisture, light, water, lamp_intensity_state, water_pump_state))
+
+    return results
+
+class Command(BaseCommand):
+    help = ('Measures the evaluation of the rules over the whole fleet one plant at a time, in a batch in plain Python and in a '
+            'batch with NumPy, and checks that all of them give the same results.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='The numbers of plants to evaluate')
+        parser.add_argument('--repeat', type=int, default=5, help='The number of times every evaluation is timed')
+        parser.add_argument('--seed', default='0', help='The seed of the random readings')
+        parser.add_argument('--output', help='Writes the results as JSON to the given file')
+
+    def handle(self, *args, **options):
+        plant_rules = rules.compile_profile()
+        evaluations = {
+            'per plant': lambda columns: evaluate_rows(plant_rules, *columns),
+            'batch python': lambda columns: plant_rules.evaluate_batch(*columns, vectorized=False),
+        }
+        if rules.numpy_available():
+            evaluations['batch numpy'] = lambda columns: plant_rules.evaluate_batch(*columns, vectorized=True)
+        else:
+            self.stdout.write('NumPy is not installed, so only the plain Python evaluations are measured')
+
+        results = []
+        for rows in options['rows']:
+            columns = random_columns(rows, f'{options["seed"]}:{rows}')
+            expected = evaluate_rows(plant_rules, *columns)
+            result = {'rows': rows, 'evaluations': {}}
+
+            for name, evaluate in evaluations.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    output = evaluate(columns)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                if output != expected:
+                    raise CommandError(f'The {name} evaluation of {rows} plants differs from the per plant one')
+                result['evaluations'][name] = {'median_ms': statistics.median(timings)}
+
+            results.append(result)
+            baseline = result['evaluations']['per plant']['median_ms']
+            self.stdout.write(f'{rows} plants')
+            for name, evaluation in result['evaluations'].items():
+                self.stdout.write(f'    {name:<13} median {evaluation["median_ms"]:9.2f} ms  speedup {baseline / evaluation["median_ms"]:6.1f}x')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'repeat': options['repeat'], 'results': results}, output, indent=4)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from smart_plant_api import blocks
+import datetime, time
+
+class Command(BaseCommand):
+    help = 'Packs the readings older than the given number of days into compressed per-plant, per-day blocks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, help='The readings of the days before this many days ago are compacted')
+        parser.add_argument('--vacuum', action='store_true', help='Gives the freed space back to the file system (SQLite only). This rewrites the whole database file')
+
+    def handle(self, *args, **options):
+        before_date = timezone.now().date() - datetime.timedelta(days=options['older_than'])
+
+        start = time.monotonic()
+        counts = blocks.compact(before_date, vacuum=options['vacuum'])
+        self.stdout.write(self.style.SUCCESS(f'{counts["readings"]} readings before {before_date} compacted into {counts["blocks"]} blocks '
+                                             f'in {time.monotonic() - start:.1f} s'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from smart_plant_api import partitions
+import datetime
+
+class Command(BaseCommand):
+    help = ('Removes old reading entries by dropping the monthly partitions that are older than the retention period, along with '
+            'the blocks of the readings of these months that have been compacted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, required=True, help='The number of months to keep, including the current month')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError('At least the current month has to be kept')
+
+        today = timezone.now().date()
+        months = today.year * 12 + today.month - options['keep_months']
+        first_kept_day = datetime.date(months // 12, months % 12 + 1, 1)
+
+        dropped = partitions.drop_partitions_before(first_kept_day)
+        self.stdout.write(self.style.SUCCESS(f'Dropped {len(dropped["partitions"])} partitions: {", ".join(dropped["partitions"]) if dropped["partitions"] else "none"}'))
+        self.stdout.write(self.style.SUCCESS(f'Removed {dropped["blocks"]} blocks of compacted readings'))
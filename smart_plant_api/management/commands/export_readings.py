@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from smart_plant_api import readings, snapshot
+import csv, datetime, sys
+
+class Command(BaseCommand):
+    help = 'Exports the readings of one or all of the plants as CSV, including the readings stored in compacted blocks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plant-id', help='The Plant-Id of the plant to export. All of the plants are exported when it is not given')
+        parser.add_argument('--start-date', type=datetime.date.fromisoformat, help='The first date (YYYY-MM-DD) to export')
+        parser.add_argument('--end-date', type=datetime.date.fromisoformat, help='The last date (YYYY-MM-DD) to export')
+        parser.add_argument('--output', help='The CSV file to write to. Defaults to the standard output')
+        parser.add_argument('--fresh', action='store_true', help='Reads from the primary database instead of the snapshot, so that the latest readings are exported')
+
+    def handle(self, *args, **options):
+        with snapshot.snapshot_reads(max_age=0 if options['fresh'] else None):
+            self.export(options)
+
+    def export(self, options):
+        plant_ids = [options['plant_id']] if options['plant_id'] else sorted(readings.plant_ids())
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['plant_id', 'reading_date', 'soil_moisture_reading', 'light_intensity_reading', 'water_level_reading'])
+            for plant_id in plant_ids:
+                for entry in readings.iter_readings(plant_id, options['start_date'], options['end_date']):
+                    writer.writerow([plant_id, entry.reading_date.isoformat(), entry.soil_moisture_reading, entry.light_intensity_reading, entry.water_level_reading])
+        finally:
+            if output is not sys.stdout:
+                output.close()
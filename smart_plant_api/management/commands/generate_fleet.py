@@ -0,0 +1,188 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from smart_plant_api import forecast, partitions, plants, rules
+from smart_plant_api.models import OverrideRequest, NotificationSent, PlantDecision, PlantForecast, ReadingBlock
+import datetime, json, math, random
+
+#The values used by AddEntry when it decides to send a notification
+NOTIFICATION_WAIT_TIME = datetime.timedelta(minutes=10)
+WATER_LEVEL_ALERT, SOIL_MOISTURE_ALERT, LEAK_DROP = 20, 20, 25
+
+def plant_name(prefix, index) -> str:
+    return f'{prefix}-{index:06d}'
+
+class SimulatedPlant:
+    '''
+    A plant, its pot and its water tank. Every plant gets its own random number generator seeded from the seed of the fleet and
+    its Plant-Id, so a plant always gets the same history no matter how many other plants are generated along with it.
+    '''
+    def __init__(self, plant_id, seed, plant_rules):
+        self.plant_id = plant_id
+        self.random = random.Random(f'{seed}:{plant_id}')
+        self.rules = plant_rules
+
+        self.drying_rate = self.random.uniform(0.3, 1.2)     #Soil moisture lost per hour
+        self.watering = self.random.uniform(3, 8)           #Soil moisture gained per hour of pumping
+        self.pump_usage = self.random.uniform(2, 5)         #Water level used per hour of pumping
+        self.window = self.random.uniform(0.4, 1.0)         #How much of the daylight reaches the plant
+        self.refill_level = self.random.uniform(5, 30)      #The owner refills the tank once it is below this level...
+        self.refill_chance = self.random.uniform(0.05, 0.5) #...with this chance every hour
+        self.override_chance = self.random.uniform(0.02, 0.3) #The chance of an override request every day
+        self.leak_chance = 1e-4                             #The chance of a sudden drop of the water level every hour
+
+        self.soil_moisture = self.random.uniform(40, 80)
+        self.water_level = self.random.uniform(50, 100)
+        self.old_soil_moisture = round(self.soil_moisture)
+        self.last_notifications = {}
+
+    def light_intensity(self, time) -> float:
+        hour = time.hour + time.minute / 60
+        daylight = max(0, math.sin(math.pi * (hour - 6) / 12))
+        return daylight * self.window * 100 + self.random.gauss(0, 3)
+
+    def step(self, time, hours) -> tuple:
+        '''
+        Advances the plant by the given number of hours
+
+        Returns:
+            |- (tuple): of the (soil moisture, light intensity, water level) readings at the given time
+        '''
+        pumping = self.rules.water_pump(round(self.soil_moisture), self.old_soil_moisture) and self.water_level > 0
+        self.old_soil_moisture = round(self.soil_moisture)
+
+        self.soil_moisture -= self.drying_rate * hours * self.random.uniform(0.5, 1.5)
+        if pumping:
+            self.soil_moisture += self.watering * hours
+            self.water_level -= self.pump_usage * hours
+
+        if self.water_level < self.refill_level and self.random.random() < 1 - (1 - self.refill_chance) ** hours:
+            self.water_level = self.random.uniform(85, 100)
+        if self.random.random() < self.leak_chance * hours:
+            self.water_level -= self.random.uniform(LEAK_DROP + 1, 40)
+
+        self.soil_moisture = min(max(self.soil_moisture, 0), 100)
+        self.water_level = min(max(self.water_level, 0), 100)
+        return (round(self.soil_moisture), round(min(max(self.light_intensity(time), 0), 100)), round(self.water_level))
+
+    def notifications(self, time, water_level, soil_moisture, old_water_level) -> list:
+        '''
+        Gets the reasons of the notifications that AddEntry would have sent for a reading
+        '''
+        reasons = []
+        for reason, low in (('Water Level', water_level < WATER_LEVEL_ALERT), ('Soil Moisture', soil_moisture < SOIL_MOISTURE_ALERT), ('Leaking Tank', old_water_level - water_level > LEAK_DROP)):
+            if low and time - self.last_notifications.get(reason, datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)) >= NOTIFICATION_WAIT_TIME:
+                self.last_notifications[reason] = time
+                reasons.append(reason)
+
+        return reasons
+
+class Command(BaseCommand):
+    help = ('Generates a deterministic synthetic fleet of plants with months of readings, override requests and notifications. '
+            'The same arguments always generate the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plants', type=int, default=100, help='The number of plants to generate')
+        parser.add_argument('--first-plant', type=int, default=0, help='The index of the first plant, used to grow an existing fleet')
+        parser.add_argument('--days', type=int, default=90, help='The number of days of history of every plant')
+        parser.add_argument('--interval', type=int, default=60, help='The number of minutes between two readings of a plant')
+        parser.add_argument('--end-date', type=datetime.date.fromisoformat, help='The last day of the history (YYYY-MM-DD). Defaults to today')
+        parser.add_argument('--seed', default='0', help='The seed of the random number generators')
+        parser.add_argument('--prefix', default='synthetic', help='The Plant-Ids are made out of this prefix and the index of the plant')
+        parser.add_argument('--batch-size', type=int, default=5000, help='The number of rows written to the database in a single query')
+        parser.add_argument('--clear', action='store_true', help='Removes all of the data of the plants with the prefix before generating. '
+                                                                 'This is needed when generating plants that already exist')
+
+    def handle(self, *args, **options):
+        if options['plants'] < 1 or options['days'] < 1 or options['interval'] < 1:
+            raise CommandError('--plants, --days and --interval must all be positive')
+
+        if options['clear']:
+            self.clear(options['prefix'])
+
+        end_date = options['end_date'] or timezone.now().date()
+        end_time = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time(), datetime.timezone.utc)
+        if options['end_date'] == None:
+            #The history of today stops at the current time
+            end_time = min(end_time, timezone.now())
+        start_time = end_time - datetime.timedelta(days=options['days'])
+        interval = datetime.timedelta(minutes=options['interval'])
+        hours = options['interval'] / 60
+        plant_rules = rules.compile_profile()
+
+        self.pending, self.batch_size = {}, options['batch_size']
+        counts = {'readings': 0, 'overrides': 0, 'notifications': 0}
+        decisions, forecasts = [], []
+
+        indexes = range(options['first_plant'], options['first_plant'] + options['plants'])
+        keys = plants.plant_keys([plant_name(options['prefix'], index) for index in indexes], create=True)
+
+        for index in indexes:
+            plant = SimulatedPlant(plant_name(options['prefix'], index), options['seed'], plant_rules)
+            key = keys[plant.plant_id]
+            statistics = forecast.empty_statistics()
+            previous, time = None, start_time
+
+            while time < end_time:
+                soil_moisture, light_intensity, water_level = plant.step(time, hours)
+                reading_date = timezone.localdate(time)
+                self.add(partitions.partition_for_write(reading_date)(plant_id = key, reading_date = reading_date,
+                                                                      soil_moisture_reading = soil_moisture,
+                                                                      light_intensity_reading = light_intensity,
+                                                                      water_level_reading = water_level))
+                forecast.add_reading(statistics, hours if previous else 0, {'soil_moisture_reading': soil_moisture, 'water_level_reading': water_level})
+                counts['readings'] += 1
+
+                for reason in plant.notifications(time, water_level, soil_moisture, previous[2] if previous else water_level):
+                    self.add(NotificationSent(plant_id = key, reason = reason, time = time))
+                    counts['notifications'] += 1
+
+                previous, time = (soil_moisture, light_intensity, water_level), time + interval
+
+            day = start_time
+            while day < end_time:
+                if plant.random.random() < plant.override_chance:
+                    self.add(OverrideRequest(plant_id = key,
+                                             request_time = day + datetime.timedelta(seconds=plant.random.randrange(86400)),
+                                             lamp_intensity_state = plant.random.randrange(0, 101, 10),
+                                             water_pump_state = plant.random.random() < 0.5))
+                    counts['overrides'] += 1
+                day += datetime.timedelta(days=1)
+
+            #The precomputed states and the forecast that AddEntry would have left behind after the latest reading
+            last_time = time - interval
+            soil_moisture, light_intensity, water_level = previous
+            lamp_intensity_state, water_pump_state = plant_rules.actuators(light_intensity, soil_moisture, plant.old_soil_moisture)
+            decisions.append(PlantDecision(plant_id = plant.plant_id, reading_time = last_time,
+                                           soil_moisture_reading = soil_moisture, light_intensity_reading = light_intensity,
+                                           water_level_reading = water_level, old_soil_moisture_reading = plant.old_soil_moisture,
+                                           lamp_intensity_state = lamp_intensity_state, water_pump_state = water_pump_state,
+                                           plant_state_rule = plant_rules.plant_state_rule(soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state)))
+            forecasts.append(PlantForecast(plant_id = plant.plant_id, updated_at = last_time, statistics = json.dumps(statistics)))
+
+        for instance in decisions + forecasts:
+            self.add(instance)
+        self.flush()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["plants"]} plants generated with {counts["readings"]} readings, {counts["overrides"]} override requests '
+            f'and {counts["notifications"]} notifications between {start_time.date()} and {end_date}'))
+
+    def add(self, instance) -> None:
+        self.pending.setdefault(type(instance), []).append(instance)
+        if sum(len(instances) for instances in self.pending.values()) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        with transaction.atomic():
+            for model, instances in self.pending.items():
+                model.objects.bulk_create(instances, batch_size=self.batch_size)
+        self.pending = {}
+
+    def clear(self, prefix) -> None:
+        for month in partitions.existing_months(refresh=True):
+            partitions.partition_model(month).objects.filter(plant__plant_id__startswith = f'{prefix}-').delete()
+        for model in (ReadingBlock, OverrideRequest, NotificationSent):
+            model.objects.filter(plant__plant_id__startswith = f'{prefix}-').delete()
+        for model in (PlantDecision, PlantForecast):
+            model.objects.filter(plant_id__startswith = f'{prefix}-').delete()
@@ -0,0 +1,51 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from smart_plant_api import rebuild
+import os, time
+
+class Command(BaseCommand):
+    help = ('Rebuilds the stored decisions and forecasts of every plant from its whole reading history, spreading the plants over '
+            'several worker processes. An interrupted rebuild can be continued with --resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='The number of worker processes')
+        parser.add_argument('--slice-size', type=int, default=200, help='The number of consecutive plant keys in a slice, the unit of work that is checkpointed')
+        parser.add_argument('--batch-size', type=int, default=100, help='The number of plants whose results are written in a single transaction')
+        parser.add_argument('--resume', action='store_true', help='Skips the slices that have been checkpointed by the previous rebuild, which must have used the same slice size')
+
+    def handle(self, *args, **options):
+        if not options['resume']:
+            rebuild.clear_checkpoints()
+        else:
+            #The slices of another size do not line up with the checkpointed ones, so none of them would be skipped
+            slice_sizes = rebuild.checkpoint_slice_sizes() - {options['slice_size']}
+            if slice_sizes:
+                raise CommandError(f'The checkpoints were made with --slice-size {", ".join(map(str, sorted(slice_sizes)))}. '
+                                   f'Resume with the same slice size, or rebuild everything without --resume')
+
+        slices = rebuild.key_slices(options['slice_size'])
+        done = rebuild.completed_slices()
+        pending = [key_slice for key_slice in slices if key_slice not in done]
+        self.stdout.write(f'{len(pending)} of {len(slices)} slices to rebuild with {options["workers"]} workers')
+
+        #The workers must not share the connections of this process
+        connections.close_all()
+
+        totals = {'plants': 0, 'readings': 0, 'skipped': 0}
+        start = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=rebuild.start_worker) as executor:
+            futures = [executor.submit(rebuild.rebuild_slice, first_key, last_key, options['batch_size']) for first_key, last_key in pending]
+
+            for finished, future in enumerate(as_completed(futures), 1):
+                for name, count in future.result().items():
+                    totals[name] += count
+
+                elapsed = time.monotonic() - start
+                remaining = elapsed / finished * (len(futures) - finished)
+                self.stdout.write(f'[{finished}/{len(futures)}] {totals["plants"]} plants, {totals["readings"]} readings, '
+                                  f'{totals["readings"] / elapsed:.0f} readings/s, {elapsed:.1f} s elapsed, about {remaining:.0f} s left')
+
+        self.stdout.write(self.style.SUCCESS(f'{totals["plants"]} plants rebuilt from {totals["readings"]} readings in {time.monotonic() - start:.1f} s'))
+        if totals['skipped']:
+            self.stdout.write(f'{totals["skipped"]} plants changed while they were being rebuilt and were left as they were, rebuild again to include them')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from smart_plant_api import rules
+
+class Command(BaseCommand):
+    help = 'Recomputes the precomputed actuator states and plant states of the whole fleet. Run this after the thresholds change.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='The number of rows written to the database in a single query')
+
+    def handle(self, *args, **options):
+        created = rules.backfill_decisions()
+        changed = rules.recompute_fleet(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{created} decisions created, {changed} decisions changed'))
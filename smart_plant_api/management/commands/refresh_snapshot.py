@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from smart_plant_api import snapshot
+import os, time
+
+class Command(BaseCommand):
+    help = ('Copies the database into the read only snapshot used by the analytical reads (see smart_plant_api/snapshot.py). '
+            'Run it periodically (with cron for example) or keep it running with --every.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, nargs='?', const=settings.SNAPSHOT['REFRESH_INTERVAL'],
+                            help='Keeps refreshing every given number of seconds (SNAPSHOT["REFRESH_INTERVAL"] when no number is given)')
+
+    def handle(self, *args, **options):
+        if snapshot.snapshot_path() == None:
+            raise CommandError(f'There is no {settings.SNAPSHOT["DATABASE"]} database in DATABASES')
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('The snapshot can only be made of an SQLite database')
+
+        while True:
+            elapsed = snapshot.refresh()
+            self.stdout.write(f'Snapshot of {os.path.getsize(snapshot.snapshot_path()) / 2 ** 20:.1f} MB refreshed in {elapsed:.2f} s')
+
+            if options['every'] == None:
+                break
+
+            time.sleep(max(options['every'] - elapsed, 0))
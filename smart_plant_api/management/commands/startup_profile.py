@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+import json, subprocess, sys
+
+#The script run in a fresh interpreter. It loads the WSGI application the same way a new worker does and then serves its
+#first request, printing the timings as JSON on its last line of output
+PROFILED_WORKER = '''
+import json, os, sys, time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CapstoneServer.settings')
+from CapstoneServer.wsgi import application
+loaded = time.perf_counter()
+
+from django.conf import settings
+from smart_plant_api import warmup
+
+environ = {'PATH_INFO': sys.argv[1], 'REQUEST_METHOD': 'GET', 'wsgi.input': BytesIO(),
+           'HTTP_HOST': settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'}
+setup_testing_defaults(environ)
+status = []
+b''.join(application(environ, lambda response_status, headers: status.append(response_status)))
+served = time.perf_counter()
+
+print(json.dumps({
+    'application_load': loaded - start,
+    'warm_up': warmup.timings,
+    'first_request': served - loaded,
+    'time_to_first_request': served - start,
+    'first_request_status': status[0],
+}))
+'''
+
+def parse_import_times(stderr) -> list:
+    '''
+    Parses the output of python -X importtime into a list of (module, self time, cumulative time) with the times in seconds
+    '''
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_time, cumulative_time, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(self_time) / 1e6, int(cumulative_time) / 1e6))
+
+    return imports
+
+class Command(BaseCommand):
+    help = 'Reports how long a new worker takes to start and to serve its first request, along with the slowest imports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='The path of the first request')
+        parser.add_argument('--top', type=int, default=20, help='The number of imports to list')
+        parser.add_argument('--output', help='Writes the full report as JSON to the given file so that it can be compared between versions')
+
+    def handle(self, *args, **options):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROFILED_WORKER, options['path']],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            raise CommandError(f'The profiled worker failed:\n{process.stderr[-2000:]}')
+
+        timings = json.loads(process.stdout.strip().splitlines()[-1])
+        imports = parse_import_times(process.stderr)
+
+        self.stdout.write(f'Application load:       {timings["application_load"] * 1000:8.1f} ms')
+        for step, seconds in timings['warm_up'].items():
+            self.stdout.write(f'    warm up {step + ":":<23} {seconds * 1000:8.1f} ms')
+        self.stdout.write(f'First request:          {timings["first_request"] * 1000:8.1f} ms ({timings["first_request_status"]})')
+        self.stdout.write(f'Time to first request:  {timings["time_to_first_request"] * 1000:8.1f} ms')
+        self.stdout.write(f'Imports:                {len(imports):8d} modules, {sum(imported[1] for imported in imports) * 1000:.1f} ms\n')
+
+        self.stdout.write('Slowest imports (cumulative):')
+        for module, self_time, cumulative_time in sorted(imports, key=lambda imported: imported[2], reverse=True)[:options['top']]:
+            self.stdout.write(f'    {cumulative_time * 1000:8.1f} ms {self_time * 1000:8.1f} ms (self)  {module}')
+
+        if options['output']:
+            with open(options['output'], 'w') as report:
+                json.dump({'timings': timings,
+                           'imports': [{'module': module, 'self': self_time, 'cumulative': cumulative_time} for module, self_time, cumulative_time in imports]},
+                          report, indent=4)
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from smart_plant_api import sweeper
+import time
+
+class Command(BaseCommand):
+    help = ('Evaluates the low water, low soil moisture and sensor offline alerts of the whole fleet and sends the notifications. '
+            'Run it periodically (with cron for example) or keep it running with --every.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, nargs='?', const=settings.ALERTS['SWEEP_INTERVAL'],
+                            help='Keeps sweeping every given number of seconds (ALERTS["SWEEP_INTERVAL"] when no number is given)')
+        parser.add_argument('--dry-run', action='store_true', help='Only counts the notifications that would be sent')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            counts = sweeper.sweep(send=not options['dry_run'])
+            elapsed = time.monotonic() - start
+
+            reasons = ', '.join(f'{count} {reason}' for reason, count in sorted(counts['reasons'].items())) or 'none'
+            self.stdout.write(f'{counts["alerts"]} alerts found, {counts["notifications"]} notifications '
+                              f'{"to send" if options["dry_run"] else "sent"} ({reasons}), {counts["pushed"]} pushed in {elapsed:.2f} s')
+
+            if options['every'] == None:
+                break
+
+            close_old_connections()
+            time.sleep(max(options['every'] - elapsed, 0))
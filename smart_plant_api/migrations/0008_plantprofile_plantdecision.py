@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0007_auto_20201001_1752'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantDecision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plant_id', models.CharField(max_length=32, unique=True)),
+                ('reading_time', models.DateTimeField()),
+                ('soil_moisture_reading', models.IntegerField()),
+                ('light_intensity_reading', models.IntegerField()),
+                ('water_level_reading', models.IntegerField()),
+                ('old_soil_moisture_reading', models.IntegerField()),
+                ('lamp_intensity_state', models.IntegerField()),
+                ('water_pump_state', models.BooleanField()),
+                ('plant_state_rule', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlantProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plant_id', models.CharField(max_length=32, unique=True)),
+                ('thresholds', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.apps.registry import Apps
+from django.db import migrations, models
+import datetime
+
+TABLE_PREFIX = 'smart_plant_api_readingentry_'
+COLUMNS = 'id, plant_id, reading_date, soil_moisture_reading, light_intensity_reading, water_level_reading'
+
+def month_bounds(date):
+    first_day = date.replace(day=1)
+    return (first_day, datetime.date(first_day.year + first_day.month // 12, first_day.month % 12 + 1, 1))
+
+def frozen_partition_model(month):
+    '''
+    A copy of the partition model as it is at this point of the migrations, registered in its own app registry so that it
+    does not interfere with the real models.
+    '''
+    return type(f'ReadingEntry_{month}', (models.Model,), {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {
+            'apps': Apps(),
+            'app_label': 'smart_plant_api',
+            'db_table': TABLE_PREFIX + month,
+            'indexes': [models.Index(fields=['plant_id', 'reading_date'], name=f'readingentry_{month}_plant')],
+        }),
+        'plant_id': models.CharField(max_length=32),
+        'reading_date': models.DateField(),
+        'soil_moisture_reading': models.IntegerField(),
+        'light_intensity_reading': models.IntegerField(),
+        'water_level_reading': models.IntegerField(),
+    })
+
+def split_into_partitions(apps, schema_editor):
+    ReadingEntry = apps.get_model('smart_plant_api', 'ReadingEntry')
+    legacy_table = ReadingEntry._meta.db_table
+
+    for date in ReadingEntry.objects.dates('reading_date', 'month'):
+        month = f'{date.year:04d}{date.month:02d}'
+        first_day, next_month = month_bounds(date)
+
+        schema_editor.create_model(frozen_partition_model(month))
+        schema_editor.execute(f'INSERT INTO {TABLE_PREFIX + month} ({COLUMNS}) SELECT {COLUMNS} FROM {legacy_table} WHERE reading_date >= %s AND reading_date < %s',
+                              (first_day, next_month))
+
+def merge_partitions(apps, schema_editor):
+    ReadingEntry = apps.get_model('smart_plant_api', 'ReadingEntry')
+    legacy_table = ReadingEntry._meta.db_table
+
+    tables = schema_editor.connection.introspection.table_names()
+    for month in sorted(table[len(TABLE_PREFIX):] for table in tables if table.startswith(TABLE_PREFIX) and table[len(TABLE_PREFIX):].isdigit()):
+        #The ids of the partitions overlap, so the legacy table gives them new ones
+        schema_editor.execute(f'INSERT INTO {legacy_table} ({COLUMNS[4:]}) SELECT {COLUMNS[4:]} FROM {TABLE_PREFIX + month} ORDER BY reading_date, id')
+        schema_editor.delete_model(frozen_partition_model(month))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0008_plantprofile_plantdecision'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_into_partitions, merge_partitions),
+        migrations.DeleteModel(
+            name='ReadingEntry',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.14 on 2026-10-19 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0009_partition_readingentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantForecast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plant_id', models.CharField(max_length=32, unique=True)),
+                ('updated_at', models.DateTimeField()),
+                ('statistics', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0010_plantforecast'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationsent',
+            index=models.Index(fields=['plant_id', 'reason', 'time'], name='smart_plant_plant_i_0b10ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationsent',
+            index=models.Index(fields=['time'], name='smart_plant_time_e414ff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantdecision',
+            index=models.Index(fields=['reading_time'], name='smart_plant_reading_b97a90_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantdecision',
+            index=models.Index(fields=['water_level_reading'], name='smart_plant_water_l_1a3eaa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantdecision',
+            index=models.Index(fields=['soil_moisture_reading'], name='smart_plant_soil_mo_534755_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0011_auto_20261019_1631'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingBlock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plant_id', models.CharField(max_length=32)),
+                ('reading_date', models.DateField()),
+                ('count', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('soil_moisture_sum', models.IntegerField()),
+                ('light_intensity_sum', models.IntegerField()),
+                ('water_level_sum', models.IntegerField()),
+            ],
+            options={
+                'unique_together': {('plant_id', 'reading_date')},
+            },
+        ),
+    ]
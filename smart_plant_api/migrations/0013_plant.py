@@ -0,0 +1,169 @@
+from django.apps.registry import Apps
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+TABLE_PREFIX = 'smart_plant_api_readingentry_'
+READING_COLUMNS = 'reading_date, soil_moisture_reading, light_intensity_reading, water_level_reading'
+
+#The models whose Plant-Id column is replaced by the key of the plant
+MODELS = ('OverrideRequest', 'TokenPlantIDBind', 'NotificationSent', 'ReadingBlock')
+
+#The models that keep their Plant-Id column, but whose plants are added to the registry as well
+OTHER_MODELS = ('PlantDecision', 'PlantForecast', 'PlantProfile')
+
+def partition_months(connection) -> list:
+    tables = connection.introspection.table_names()
+    return sorted(table[len(TABLE_PREFIX):] for table in tables if table.startswith(TABLE_PREFIX) and table[len(TABLE_PREFIX):].isdigit())
+
+def frozen_partition_model(month, plant_field, table=None, indexed=True):
+    '''
+    A copy of the partition model as it is at this point of the migrations, registered in its own app registry so that it
+    does not interfere with the real models. The key of the plant is frozen as a plain integer column since the partitions do
+    not have a foreign key constraint.
+    '''
+    return type(f'ReadingEntry_{month}', (models.Model,), {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {
+            'apps': Apps(),
+            'app_label': 'smart_plant_api',
+            'db_table': table or TABLE_PREFIX + month,
+            'indexes': [models.Index(fields=['plant_id', 'reading_date'], name=f'readingentry_{month}_plant')] if indexed else [],
+        }),
+        'plant_id': plant_field,
+        'reading_date': models.DateField(),
+        'soil_moisture_reading': models.IntegerField(),
+        'light_intensity_reading': models.IntegerField(),
+        'water_level_reading': models.IntegerField(),
+    })
+
+def register_plants(apps, schema_editor):
+    Plant = apps.get_model('smart_plant_api', 'Plant')
+
+    plant_ids = set()
+    for name in MODELS + OTHER_MODELS:
+        plant_ids.update(apps.get_model('smart_plant_api', name).objects.values_list('plant_id', flat=True).distinct())
+
+    with schema_editor.connection.cursor() as cursor:
+        for month in partition_months(schema_editor.connection):
+            cursor.execute(f'SELECT DISTINCT plant_id FROM {TABLE_PREFIX + month}')
+            plant_ids.update(plant_id for plant_id, in cursor.fetchall())
+
+    Plant.objects.bulk_create([Plant(plant_id = plant_id) for plant_id in sorted(plant_ids)], batch_size=500)
+
+def link_plants(apps, schema_editor):
+    Plant = apps.get_model('smart_plant_api', 'Plant')
+    for name in MODELS:
+        apps.get_model('smart_plant_api', name).objects.update(plant = Subquery(Plant.objects.filter(plant_id = OuterRef('plant_name')).values('id')[:1]))
+
+def unlink_plants(apps, schema_editor):
+    Plant = apps.get_model('smart_plant_api', 'Plant')
+    for name in MODELS:
+        apps.get_model('smart_plant_api', name).objects.update(plant_name = Subquery(Plant.objects.filter(id = OuterRef('plant')).values('plant_id')[:1]))
+
+def rebuild_partitions(schema_editor, plant_field, select_plant, join) -> None:
+    '''
+    Rebuilds the table of every partition with the given type of plant column. SQLite can not change the type of a column,
+    so the readings are copied into a new table which then replaces the old one
+    '''
+    plant_table = 'smart_plant_api_plant'
+    for month in partition_months(schema_editor.connection):
+        table = TABLE_PREFIX + month
+        new_model = frozen_partition_model(month, plant_field, table=f'{table}_new', indexed=False)
+
+        schema_editor.create_model(new_model)
+        schema_editor.execute(f'INSERT INTO {table}_new (id, plant_id, {READING_COLUMNS}) '
+                              f'SELECT readings.id, plants.{select_plant}, {", ".join("readings." + column for column in READING_COLUMNS.split(", "))} '
+                              f'FROM {table} readings JOIN {plant_table} plants ON {join}')
+        schema_editor.execute(f'DROP TABLE {table}')
+        schema_editor.alter_db_table(new_model, f'{table}_new', table)
+
+        model = frozen_partition_model(month, plant_field)
+        for index in model._meta.indexes:
+            schema_editor.add_index(model, index)
+
+def key_partitions(apps, schema_editor):
+    rebuild_partitions(schema_editor, models.IntegerField(), 'id', 'plants.plant_id = readings.plant_id')
+
+def unkey_partitions(apps, schema_editor):
+    rebuild_partitions(schema_editor, models.CharField(max_length=32), 'plant_id', 'plants.id = readings.plant_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0012_readingblock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Plant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plant_id', models.CharField(max_length=32, unique=True)),
+            ],
+        ),
+        migrations.RunPython(register_plants, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notificationsent',
+            name='smart_plant_plant_i_0b10ce_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='readingblock',
+            unique_together=set(),
+        ),
+        *[migrations.RenameField(model_name=name.lower(), old_name='plant_id', new_name='plant_name') for name in MODELS],
+        #Nullable so that the column can be added back empty and filled again when the migration is reversed
+        *[migrations.AlterField(model_name=name.lower(), name='plant_name', field=models.CharField(max_length=32, null=True)) for name in MODELS],
+        migrations.AddField(
+            model_name='overriderequest',
+            name='plant',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='smart_plant_api.plant'),
+        ),
+        migrations.AddField(
+            model_name='tokenplantidbind',
+            name='plant',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='smart_plant_api.plant'),
+        ),
+        migrations.AddField(
+            model_name='notificationsent',
+            name='plant',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='smart_plant_api.plant'),
+        ),
+        migrations.AddField(
+            model_name='readingblock',
+            name='plant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='smart_plant_api.plant'),
+        ),
+        migrations.RunPython(link_plants, unlink_plants),
+        migrations.AlterField(
+            model_name='overriderequest',
+            name='plant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='smart_plant_api.plant'),
+        ),
+        migrations.AlterField(
+            model_name='tokenplantidbind',
+            name='plant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='smart_plant_api.plant'),
+        ),
+        migrations.AlterField(
+            model_name='notificationsent',
+            name='plant',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='smart_plant_api.plant'),
+        ),
+        migrations.AlterField(
+            model_name='readingblock',
+            name='plant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='smart_plant_api.plant'),
+        ),
+        *[migrations.RemoveField(model_name=name.lower(), name='plant_name') for name in MODELS],
+        migrations.AddIndex(
+            model_name='notificationsent',
+            index=models.Index(fields=['plant', 'reason', 'time'], name='smart_plant_plant_i_0b10ce_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='readingblock',
+            unique_together={('plant', 'reading_date')},
+        ),
+        migrations.RunPython(key_partitions, unkey_partitions),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-19 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0013_plant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RebuildCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_key', models.IntegerField()),
+                ('last_key', models.IntegerField()),
+                ('plants', models.IntegerField()),
+                ('readings', models.IntegerField()),
+                ('completed_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('first_key', 'last_key')},
+            },
+        ),
+    ]
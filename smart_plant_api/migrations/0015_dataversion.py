@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0014_rebuildcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plant_id', models.CharField(max_length=32, unique=True)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
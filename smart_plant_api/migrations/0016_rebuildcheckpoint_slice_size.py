@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-19 17:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_slice_size(apps, schema_editor):
+    #The slices are aligned on their size, so the size of a checkpointed slice is given by its bounds
+    RebuildCheckpoint = apps.get_model('smart_plant_api', 'RebuildCheckpoint')
+    RebuildCheckpoint.objects.update(slice_size = F('last_key') - F('first_key') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0015_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rebuildcheckpoint',
+            name='slice_size',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_slice_size, migrations.RunPython.noop),
+    ]
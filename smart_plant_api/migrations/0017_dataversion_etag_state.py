@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+def forget_versions(apps, schema_editor):
+    #The versions are made again along with their state the next time they are used (see caching.bump_data_version), and they
+    #restart from the clock so that no version is used twice
+    DataVersion = apps.get_model('smart_plant_api', 'DataVersion')
+    DataVersion.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0016_rebuildcheckpoint_slice_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataversion',
+            name='latest_reading_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='dataversion',
+            name='override_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='dataversion',
+            name='override_time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(forget_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-19 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0018_admission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataversion',
+            name='series_reset',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.14 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_plant_api', '0019_dataversion_series_reset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('holder', models.CharField(max_length=32)),
+                ('expires_at', models.FloatField()),
+            ],
+        ),
+    ]
@@ -1,15 +1,35 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+class Plant(models.Model):
+    '''
+    The registry of the plants. The tables holding many rows per plant refer to a plant by the integer key of its row here
+    instead of repeating its Plant-Id in every row (see plants.py). A plant is never removed from the registry
+    '''
+    plant_id = models.CharField(max_length=32, unique=True)
 
 class ReadingEntry(models.Model):
-    plant_id = models.CharField(max_length=32)
+    '''
+    The reading entries are stored in one table per month. This abstract model defines the columns of these tables, the
+    tables themselves are handled in partitions.py
+    '''
+    #The readings outnumber every other row by far, so their tables skip the foreign key constraint and the index of the plant
+    #alone, which is covered by the (plant, reading_date) index of every partition
+    plant = models.ForeignKey(Plant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
     reading_date = models.DateField()
 
     soil_moisture_reading = models.IntegerField()
     light_intensity_reading = models.IntegerField()
     water_level_reading = models.IntegerField()
 
+    class Meta:
+        abstract = True
+
 class OverrideRequest(models.Model):
-    plant_id = models.CharField(max_length=32)
+    VALIDITY = 5 #How long an override request is valid in minutes
+
+    plant = models.ForeignKey(Plant, on_delete=models.CASCADE)
     request_time = models.DateTimeField()
 
     lamp_intensity_state = models.IntegerField()
@@ -19,13 +39,128 @@ class OverrideRequest(models.Model):
         return (current_time - self.request_time).seconds / 60
 
 class TokenPlantIDBind(models.Model):
-    plant_id = models.CharField(max_length=32)
+    plant = models.ForeignKey(Plant, on_delete=models.CASCADE)
     tokens = models.TextField()
 
 class NotificationSent(models.Model):
-    plant_id = models.CharField(max_length=32)
+    plant = models.ForeignKey(Plant, on_delete=models.CASCADE, db_index=False)
     reason = models.TextField()
     time = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['plant', 'reason', 'time']),
+            models.Index(fields=['time']),
+        ]
+
     def minutes_since(self,current_time):
-        return (current_time - self.time).seconds / 60
\ No newline at end of file
+        return (current_time - self.time).seconds / 60
+
+class PlantProfile(models.Model):
+    plant_id = models.CharField(max_length=32, unique=True)
+    thresholds = models.TextField() #A JSON object of the thresholds of the rule engine that are overridden for this plant
+
+@receiver([post_save, post_delete], sender=PlantProfile)
+def plant_profile_changed(sender, instance, **kwargs):
+    #The stored decision and the cached responses of the plant were made with its old thresholds
+    from smart_plant_api import rules
+    rules.profile_changed(instance.plant_id)
+
+class PlantDecision(models.Model):
+    plant_id = models.CharField(max_length=32, unique=True)
+    reading_time = models.DateTimeField()
+
+    soil_moisture_reading = models.IntegerField()
+    light_intensity_reading = models.IntegerField()
+    water_level_reading = models.IntegerField()
+    old_soil_moisture_reading = models.IntegerField()
+
+    lamp_intensity_state = models.IntegerField()
+    water_pump_state = models.BooleanField()
+    plant_state_rule = models.IntegerField() #The index of the rule in rules.PLANT_STATE_RULES that matched, -1 for the default state
+
+    class Meta:
+        #Used by the sweeper to find the plants with alerts without going through the whole fleet
+        indexes = [
+            models.Index(fields=['reading_time']),
+            models.Index(fields=['water_level_reading']),
+            models.Index(fields=['soil_moisture_reading']),
+        ]
+
+class PlantForecast(models.Model):
+    plant_id = models.CharField(max_length=32, unique=True)
+    updated_at = models.DateTimeField() #The time of the latest reading added to the statistics
+    statistics = models.TextField() #A JSON object of the decayed regression sums kept by forecast.py
+
+class ReadingBlock(models.Model):
+    '''
+    The readings of a plant for a whole day, packed into a compressed block by blocks.py
+    '''
+    plant = models.ForeignKey(Plant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    reading_date = models.DateField()
+    count = models.IntegerField()
+    data = models.BinaryField()
+
+    #The sums of the readings of the block, used for the daily statistics without decoding the block
+    soil_moisture_sum = models.IntegerField()
+    light_intensity_sum = models.IntegerField()
+    water_level_sum = models.IntegerField()
+
+    class Meta:
+        unique_together = ('plant', 'reading_date')
+
+class RebuildCheckpoint(models.Model):
+    '''
+    A slice of the plant registry whose derived data has been rebuilt by rebuild.py
+    '''
+    first_key = models.IntegerField()
+    last_key = models.IntegerField()
+    slice_size = models.IntegerField() #The --slice-size of the rebuild, which a resumed rebuild has to use as well
+    plants = models.IntegerField() #The number of plants with readings in the slice
+    readings = models.IntegerField()
+    completed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('first_key', 'last_key')
+
+class DataVersion(models.Model):
+    '''
+    The data version of a plant (see caching.py). It is bumped with an F() increment, so the bumps made at the same time by
+    different workers are never lost, and it never expires like a cached value would.
+
+    The row also keeps the rest of the state that the ETags of the plant are made from, so that a revalidation is answered with
+    this row alone
+    '''
+    plant_id = models.CharField(max_length=32, unique=True)
+    version = models.BigIntegerField()
+
+    latest_reading_id = models.BigIntegerField(null=True)
+    override_id = models.IntegerField(null=True) #The latest override request of the plant
+    override_time = models.DateTimeField(null=True) #The request_time of that override request
+
+    series_reset = models.BigIntegerField(null=True) #The time the readings were last removed, which makes every worker warm the series of the plant again (see timeseries.py)
+
+class AdmissionBucket(models.Model):
+    '''
+    The token bucket of a Plant-Id used by the admission control of the ingest endpoint (see admission.py)
+    '''
+    plant_id = models.CharField(max_length=32, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField() #The time.time() of the last token taken, which the refill is counted from
+
+class AdmissionSlot(models.Model):
+    '''
+    One of the slots of the ingest requests being processed at the same time across all of the workers (see admission.py)
+    '''
+    number = models.IntegerField(unique=True)
+    holder = models.CharField(max_length=32, null=True) #The id given to the request holding the slot, None when it is free
+    expires_at = models.FloatField(null=True) #The time.time() after which the slot is given back if it has not been released
+
+class ResponseLock(models.Model):
+    '''
+    Held by the worker computing a response that missed the cache, so that the identical requests of the other workers wait
+    for it instead of computing it as well (see caching.single_flight)
+    '''
+    key = models.CharField(max_length=255, unique=True) #The cache key of the response
+    holder = models.CharField(max_length=32) #The id given to the request holding the lock
+    expires_at = models.FloatField() #The time.time() after which the lock can be taken over if it has not been released
@@ -0,0 +1,182 @@
+'''
+Time partitioned storage for the reading entries. The readings of every month are stored in their own table
+(smart_plant_api_readingentry_YYYYMM) which is created the first time a reading for that month is added. The columns of these
+tables are defined by the abstract ReadingEntry model.
+
+Queries over a range of dates only touch the tables of the months in that range, and removing old history is done by dropping
+whole tables instead of deleting rows (along with the blocks of the same months, for the readings that have been compacted).
+
+Every worker keeps its own list of the tables, so a table dropped by another process is still in the list of this worker until
+it is read again. The reads over the partitions are wrapped in retry_dropped, which reads the list again and runs the read once
+more when it hits a table that no longer exists.
+'''
+from django.db import connection, models, transaction, DatabaseError
+from smart_plant_api.models import ReadingEntry
+import datetime, functools, threading, time
+
+TABLE_PREFIX = 'smart_plant_api_readingentry_'
+
+#How often (in seconds) the list of tables is read again from the database when a month that is not known yet is asked for.
+#This is how a worker finds out about the tables that have been created by the other workers
+REFRESH_INTERVAL = 1
+
+_models = {}
+_known_months = []
+_last_refresh = None
+_lock = threading.Lock()
+
+def month_of(date) -> str:
+    '''
+    Gets the key of the partition that holds the readings of the given date. The key is formatted as YYYYMM
+    '''
+    return f'{date.year:04d}{date.month:02d}'
+
+def month_bounds(month) -> tuple:
+    '''
+    Gets the (first day, first day of the next month) of a partition key
+    '''
+    year, month = int(month[:4]), int(month[4:])
+    first_day = datetime.date(year, month, 1)
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return (first_day, next_month)
+
+def partition_model(month):
+    '''
+    Gets the model of the partition with the given key. The models are created on demand and are not managed by the migrations.
+
+    Note: this does not check if the table of the partition exists. Use partitions_between or partition_for_write for that.
+    '''
+    with _lock:
+        if month not in _models:
+            meta = type('Meta', (), {
+                'app_label': 'smart_plant_api',
+                'db_table': TABLE_PREFIX + month,
+                'managed': False,
+                'indexes': [models.Index(fields=['plant', 'reading_date'], name=f'readingentry_{month}_plant')],
+            })
+            _models[month] = type(f'ReadingEntry_{month}', (ReadingEntry,), {'__module__': __name__, 'Meta': meta})
+
+        return _models[month]
+
+def existing_months(refresh=False) -> list:
+    '''
+    Gets the sorted keys of the partitions whose tables exist in the database
+
+    Arguments:
+        |- refresh: reads the list of tables from the database again instead of using the cached list
+    '''
+    global _known_months, _last_refresh
+
+    if refresh or _last_refresh == None:
+        tables = connection.introspection.table_names()
+        _known_months = sorted(table[len(TABLE_PREFIX):] for table in tables if table.startswith(TABLE_PREFIX) and table[len(TABLE_PREFIX):].isdigit())
+        _last_refresh = time.monotonic()
+
+    return _known_months
+
+def _months_between(start_date, end_date) -> list:
+    months = existing_months()
+
+    #The end month may have been created by another worker since the list was last read
+    if end_date != None and month_of(end_date) not in months and time.monotonic() - _last_refresh > REFRESH_INTERVAL:
+        months = existing_months(refresh=True)
+
+    return [month for month in months
+            if (start_date == None or month >= month_of(start_date)) and (end_date == None or month <= month_of(end_date))]
+
+def partitions_between(start_date=None, end_date=None, newest_first=True) -> list:
+    '''
+    Gets the models of the existing partitions that can hold readings between the two dates (both inclusive)
+
+    Arguments:
+        |- start_date: the first date of the range. None means that the range has no start
+        |- end_date: the last date of the range. None means that the range runs up to today
+        |- newest_first: whether the partitions are sorted from the newest to the oldest or the other way around
+    '''
+    from django.utils import timezone
+
+    months = _months_between(start_date, end_date if end_date != None else timezone.now().date())
+    return [partition_model(month) for month in (months[::-1] if newest_first else months)]
+
+def is_dropped_partition(error) -> bool:
+    '''
+    Checks if a database error was raised by a query on the table of a partition that does not exist (anymore)
+    '''
+    return TABLE_PREFIX in str(error)
+
+def retry_dropped(function):
+    '''
+    A decorator for the functions that read or delete over the partitions. If a partition has been dropped by another process
+    since the list of the tables was last read, the query on its table fails. In that case the list is read again and the
+    function is run once more over the partitions that still exist.
+
+    Inside of a transaction (the one of AddEntry for example) the first run is done in a savepoint, so the failed query does not
+    break the transaction.
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            if connection.in_atomic_block:
+                with transaction.atomic():
+                    return function(*args, **kwargs)
+            return function(*args, **kwargs)
+        except DatabaseError as error:
+            if not is_dropped_partition(error):
+                raise
+
+        existing_months(refresh=True)
+        return function(*args, **kwargs)
+
+    return wrapper
+
+def partition_for_write(date):
+    '''
+    Gets the model of the partition that a reading of the given date is written to, creating its table if it does not exist yet.
+    '''
+    month = month_of(date)
+    model = partition_model(month)
+
+    if month not in existing_months() and month not in existing_months(refresh=True):
+        try:
+            with connection.schema_editor() as schema_editor:
+                schema_editor.create_model(model)
+
+                #The indexes of unmanaged models are not created along with their table
+                for index in model._meta.indexes:
+                    schema_editor.add_index(model, index)
+        except DatabaseError:
+            #The table has been created by another worker in the mean time
+            pass
+        existing_months(refresh=True)
+
+    return model
+
+def drop_partition(month) -> None:
+    '''
+    Drops the table of the partition with the given key along with all of the readings in it
+    '''
+    if month in existing_months(refresh=True):
+        with connection.schema_editor() as schema_editor:
+            schema_editor.delete_model(partition_model(month))
+        existing_months(refresh=True)
+
+def drop_partitions_before(date) -> dict:
+    '''
+    Drops the partitions of all of the months before the month of the given date, along with the blocks that the readings
+    of these months have been compacted into (see blocks.py)
+
+    Returns:
+        |- (dict): of the keys of the partitions that have been dropped and of the number of blocks removed. The following is
+        the format of the dict
+            {
+                partitions: [(str)],
+                blocks: (int)
+            }
+    '''
+    from smart_plant_api import blocks
+
+    dropped = [month for month in existing_months(refresh=True) if month < month_of(date)]
+    for month in dropped:
+        drop_partition(month)
+
+    return {'partitions': dropped, 'blocks': blocks.drop_blocks_before(date)}
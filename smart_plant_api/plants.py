@@ -0,0 +1,101 @@
+'''
+The registry of the plants. Every Plant-Id is given an integer key (the id of its Plant row) the first time it is written
+with, and the tables holding many rows per plant (the readings, the blocks, the overrides, the notifications and the token
+binds) store that key instead of repeating the Plant-Id string, which keeps their rows and indexes small and their lookups
+integer comparisons.
+
+A key never changes once given and plants are never removed from the registry, so every worker keeps the keys it has looked
+up in memory and only asks the database the first time it sees a Plant-Id.
+'''
+from django.db import IntegrityError, transaction
+
+#The number of keys kept by every worker before the cache starts over
+MAX_CACHED_KEYS = 100000
+
+_keys = {}
+
+def _remember(plant_id, key) -> None:
+    if len(_keys) >= MAX_CACHED_KEYS:
+        _keys.clear()
+    _keys[plant_id] = key
+
+def plant_key(plant_id, create=False) -> int:
+    '''
+    Gets the key of a plant
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- create: adds the plant to the registry if it is not in it yet
+
+    Returns:
+        |- (int): the key of the plant, or None if the plant is not in the registry and create is False
+    '''
+    key = _keys.get(plant_id)
+    if key != None or plant_id == None:
+        return key
+
+    from smart_plant_api.models import Plant
+
+    key = Plant.objects.filter(plant_id = plant_id).values_list('id', flat=True).first()
+    if key == None and create:
+        try:
+            with transaction.atomic():
+                key = Plant.objects.create(plant_id = plant_id).id
+        except IntegrityError:
+            #The plant has been added by another worker in the mean time
+            key = Plant.objects.get(plant_id = plant_id).id
+
+    if key != None:
+        _remember(plant_id, key)
+    return key
+
+def plant_keys(plant_ids, create=False) -> dict:
+    '''
+    Gets the keys of many plants at once
+
+    Returns:
+        |- (dict): mapping every Plant-Id that is in the registry (all of them when create is True) to its key
+    '''
+    from smart_plant_api.models import Plant
+
+    keys = {plant_id: _keys[plant_id] for plant_id in plant_ids if plant_id in _keys}
+    missing = [plant_id for plant_id in plant_ids if plant_id not in keys]
+
+    if missing and create:
+        Plant.objects.bulk_create([Plant(plant_id = plant_id) for plant_id in missing], batch_size=500, ignore_conflicts=True)
+    for start in range(0, len(missing), 500):
+        keys.update(Plant.objects.filter(plant_id__in = missing[start:start + 500]).values_list('plant_id', 'id'))
+
+    for plant_id in missing:
+        if plant_id in keys:
+            _remember(plant_id, keys[plant_id])
+    return keys
+
+def plant_ids_of(keys) -> dict:
+    '''
+    Gets the Plant-Ids of the given keys as a dict mapping every key to its Plant-Id
+    '''
+    from smart_plant_api.models import Plant
+
+    keys = list(keys)
+    plant_ids = {}
+    for start in range(0, len(keys), 500):
+        plant_ids.update(Plant.objects.filter(id__in = keys[start:start + 500]).values_list('id', 'plant_id'))
+
+    return plant_ids
+
+def request_plant_key(request, create=False) -> int:
+    '''
+    Gets the key of the plant of the Plant-Id header of a request. The key is looked up once per request
+    '''
+    key = getattr(request, '_plant_key', None)
+    if key == None:
+        key = request._plant_key = plant_key(request.headers.get('Plant-Id'), create)
+
+    return key
+
+def reset() -> None:
+    '''
+    Forgets the keys looked up by this worker. Only needed when the registry itself has been emptied, by a test database for example
+    '''
+    _keys.clear()
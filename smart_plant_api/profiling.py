@@ -0,0 +1,161 @@
+'''
+Opt in profiling of single requests. A request is profiled when it has a Profile-Token header matching
+PROFILING['TOKEN'], or at random with a probability of PROFILING['SAMPLE_RATE'].
+
+For every profiled request, a cProfile dump (.prof, readable with pstats or snakeviz) and a trace of all of the SQL queries that
+were executed, with their timings and query plans (.json), are written to PROFILING['DIRECTORY']. Only the latest
+PROFILING['MAX_PROFILES'] profiles are kept.
+'''
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+import contextlib, cProfile, io, json, os, pstats, random, re, time, uuid
+
+class QueryRecorder:
+    '''
+    A database execute wrapper that records every query executed through a connection
+    '''
+    def __init__(self, alias, queries):
+        self.alias = alias
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'database': self.alias,
+                'sql': sql,
+                'params': [str(param) for param in params] if params and not many else None,
+                'many': many,
+                'duration_ms': (time.perf_counter() - start) * 1000,
+            })
+
+def explain(query) -> list:
+    '''
+    Gets the query plan of a recorded SELECT query, or None for the other queries
+    '''
+    if query['many'] or not query['sql'].lstrip().upper().startswith('SELECT'):
+        return None
+
+    connection = connections[query['database']]
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + query['sql'], query['params'])
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as error:
+        return [f'Could not explain the query: {error}']
+
+def should_profile(request) -> bool:
+    token = settings.PROFILING['TOKEN']
+    if token and request.headers.get('Profile-Token') == token:
+        return True
+
+    return random.random() < settings.PROFILING['SAMPLE_RATE']
+
+def list_profiles() -> list:
+    '''
+    Gets the metadata of the stored profiles, from the newest to the oldest
+    '''
+    directory = settings.PROFILING['DIRECTORY']
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for file_name in sorted(os.listdir(directory), reverse=True):
+        if file_name.endswith('.json'):
+            with open(os.path.join(directory, file_name)) as trace:
+                metadata = json.load(trace)
+            metadata.pop('queries')
+            profiles.append(metadata)
+
+    return profiles
+
+def profile_path(file_name) -> str:
+    '''
+    Gets the path of a file of a stored profile, or None if there is no such file
+    '''
+    directory = settings.PROFILING['DIRECTORY']
+    if os.path.isdir(directory) and file_name in os.listdir(directory):
+        return os.path.join(directory, file_name)
+
+    return None
+
+def save_profile(request, response, profiler, queries, duration) -> str:
+    '''
+    Writes a profile to the profiles directory and removes the oldest profiles over the limit
+
+    Returns:
+        |- (str): the id of the profile
+    '''
+    directory = settings.PROFILING['DIRECTORY']
+    os.makedirs(directory, exist_ok=True)
+
+    #The ids start with the time so that sorting them sorts the profiles from the oldest to the newest
+    profile_id = '{}-{}-{}'.format(timezone.now().strftime('%Y%m%d%H%M%S%f'),
+                                   re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root',
+                                   uuid.uuid4().hex[:8])
+
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(30)
+
+    for query in queries:
+        query['plan'] = explain(query)
+
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as trace:
+        json.dump({
+            'id': profile_id,
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'plant_id': request.headers.get('Plant-Id'),
+            'status': response.status_code,
+            'duration_ms': duration * 1000,
+            'query_count': len(queries),
+            'query_duration_ms': sum(query['duration_ms'] for query in queries),
+            'files': [f'{profile_id}.prof', f'{profile_id}.json'],
+            'summary': summary.getvalue(),
+            'queries': queries,
+        }, trace, indent=4)
+
+    #Keeping the directory as a ring of the latest profiles
+    profile_ids = sorted(file_name[:-len('.json')] for file_name in os.listdir(directory) if file_name.endswith('.json'))
+    for old_profile_id in profile_ids[:-settings.PROFILING['MAX_PROFILES']]:
+        for extension in ('.prof', '.json'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, old_profile_id + extension))
+
+    return profile_id
+
+class ProfilingMiddleware:
+    '''
+    The middleware that profiles the requests selected by should_profile. It should be the first middleware so that the
+    profile covers the rest of the middleware as well.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        queries = []
+        profiler = cProfile.Profile()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(QueryRecorder(connection.alias, queries)))
+
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - start
+
+        response['Profile-Id'] = save_profile(request, response, profiler, queries, duration)
+        return response
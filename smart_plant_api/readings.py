@@ -0,0 +1,270 @@
+'''
+The helper methods used by the views to add and query the reading entries. The readings are spread over the monthly
+partitions defined in partitions.py, so these helpers only touch the partitions that the query needs. The older readings may
+have been compacted into the blocks of blocks.py, which these helpers read as well.
+
+The helpers take the Plant-Id of a plant and look up its key in the registry (see plants.py) to query the tables.
+
+The partitions may be dropped by another process at any time, so the helpers reading them are wrapped in
+partitions.retry_dropped.
+'''
+from django.db import DatabaseError
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from smart_plant_api import blocks, partitions, plants
+import datetime, heapq, itertools
+
+def prepare_write(reading_date) -> None:
+    '''
+    Creates the partition that a reading of the given date is written to. SQLite cannot create a table inside of a
+    transaction, so this is called before the transaction adding the reading
+    '''
+    if isinstance(reading_date, datetime.datetime):
+        reading_date = timezone.localdate(reading_date)
+
+    partitions.partition_for_write(reading_date)
+
+def create_reading(plant_id, reading_date, soil_moisture_reading, light_intensity_reading, water_level_reading):
+    '''
+    Adds a reading entry to the partition of its month
+
+    Returns:
+        |- (ReadingEntry): the saved reading entry
+    '''
+    #The date is taken in the default timezone just like the DateField itself would do it
+    if isinstance(reading_date, datetime.datetime):
+        reading_date = timezone.localdate(reading_date)
+
+    model = partitions.partition_for_write(reading_date)
+    reading = model(plant_id = plants.plant_key(plant_id, create=True),
+                    reading_date = reading_date,
+                    soil_moisture_reading = soil_moisture_reading,
+                    light_intensity_reading = light_intensity_reading,
+                    water_level_reading = water_level_reading)
+    reading.save()
+    return reading
+
+@partitions.retry_dropped
+def latest_readings(plant_id, count=1) -> list:
+    '''
+    Gets the latest reading entries of a plant
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- count: the maximum number of entries to get
+
+    Returns:
+        |- (list): of the reading entries sorted from the newest to the oldest
+    '''
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return []
+
+    entries = []
+    for model in partitions.partitions_between():
+        entries.extend(model.objects.filter(plant_id = key).order_by('-reading_date', '-id')[:count - len(entries)])
+        if len(entries) == count:
+            break
+
+    return list(itertools.islice(blocks.merge_entries([entries, blocks.block_entries(plant_id)]), count))
+
+@partitions.retry_dropped
+def reading_count(plant_id) -> int:
+    '''
+    Gets the number of reading entries of a plant across all of the partitions
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return 0
+
+    return (sum(model.objects.filter(plant_id = key).count() for model in partitions.partitions_between())
+            + (ReadingBlock.objects.filter(plant_id = key).aggregate(count = Sum('count'))['count'] or 0))
+
+@partitions.retry_dropped
+def plant_ids() -> set:
+    '''
+    Gets the Plant-Ids of all of the plants that have at least one reading entry
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    keys = set(ReadingBlock.objects.values_list('plant_id', flat=True).distinct())
+    for model in partitions.partitions_between():
+        keys.update(model.objects.values_list('plant_id', flat=True).distinct())
+
+    return set(plants.plant_ids_of(keys).values())
+
+@partitions.retry_dropped
+def daily_averages(plant_id, start_date, end_date) -> dict:
+    '''
+    Gets the average readings of every day between two dates (both inclusive). Every partition in the range is queried once,
+    and the compacted days are averaged from the sums stored with their blocks.
+
+    Returns:
+        |- (dict): mapping the dates that have readings to a dict of the following format
+            {
+                soil_moisture_reading: (float)
+                light_intensity_reading: (float)
+                water_level_reading: (float)
+            }
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return {}
+
+    #The sums and the counts of every day, since a day may be split between a block and a partition
+    totals = {}
+    def add(reading_date, count, sums):
+        total = totals.setdefault(reading_date, [0, 0, 0, 0])
+        total[0] += count
+        for index, value in enumerate(sums, 1):
+            total[index] += value
+
+    for model in partitions.partitions_between(start_date, end_date):
+        rows = (model.objects.filter(plant_id = key, reading_date__gte = start_date, reading_date__lte = end_date)
+                             .values('reading_date')
+                             .annotate(count = Count('id'), soil_moisture = Sum('soil_moisture_reading'),
+                                       light_intensity = Sum('light_intensity_reading'), water_level = Sum('water_level_reading'))
+                             .values_list('reading_date', 'count', 'soil_moisture', 'light_intensity', 'water_level'))
+        for reading_date, count, *sums in rows:
+            add(reading_date, count, sums)
+
+    for reading_date, count, *sums in (ReadingBlock.objects.filter(plant_id = key, reading_date__gte = start_date, reading_date__lte = end_date)
+                                                           .values_list('reading_date', 'count', 'soil_moisture_sum', 'light_intensity_sum', 'water_level_sum')):
+        add(reading_date, count, sums)
+
+    return {reading_date: {'soil_moisture_reading': soil_moisture / count,
+                           'light_intensity_reading': light_intensity / count,
+                           'water_level_reading': water_level / count}
+            for reading_date, (count, soil_moisture, light_intensity, water_level) in totals.items()}
+
+@partitions.retry_dropped
+def delete_readings(plant_id) -> None:
+    '''
+    Removes all of the reading entries of a plant from every partition and from the blocks
+    '''
+    from smart_plant_api.models import ReadingBlock
+
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return
+
+    for model in partitions.partitions_between():
+        model.objects.filter(plant_id = key).delete()
+    ReadingBlock.objects.filter(plant_id = key).delete()
+
+@partitions.retry_dropped
+def readings_after(plant_id, reading_date, reading_id, limit) -> list:
+    '''
+    Gets the reading entries of a plant that were added after the given one
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- reading_date: the date of the reading to start after
+        |- reading_id: the id of the reading to start after
+        |- limit: the maximum number of entries to get
+
+    Returns:
+        |- (list): of the reading entries sorted from the oldest to the newest
+    '''
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return []
+
+    entries = []
+    for model in partitions.partitions_between(reading_date, newest_first=False):
+        entries.extend(model.objects.filter(Q(reading_date__gt = reading_date) | Q(reading_date = reading_date, id__gt = reading_id), plant_id = key)
+                                    .order_by('reading_date', 'id')[:limit - len(entries)])
+        if len(entries) == limit:
+            break
+
+    compacted = (entry for entry in blocks.block_entries(plant_id, start_date = reading_date, newest_first = False)
+                 if (entry.reading_date, entry.id) > (reading_date, reading_id))
+    return list(itertools.islice(blocks.merge_entries([entries, compacted], newest_first = False), limit))
+
+@partitions.retry_dropped
+def history_page(plant_id, limit, before=None, start_date=None, end_date=None, columns=None) -> list:
+    '''
+    Gets a page of the reading entries of a plant from the newest to the oldest using keyset pagination. Every query of the page
+    is a range search on the (plant_id, reading_date) index of the partitions, so the cost of a page does not depend on how deep
+    into the history it is.
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- limit: the maximum number of entries in the page
+        |- before: the (reading_date, id) of the last entry of the previous page. None gets the first page
+        |- start_date: the first date of the range (inclusive). None means that the range has no start
+        |- end_date: the last date of the range (inclusive). None means that the range runs up to today
+        |- columns: the names of the reading columns to get. None gets all of them
+
+    Returns:
+        |- (list): of dicts with the id, the reading_date and the selected columns of every entry
+    '''
+    key = plants.plant_key(plant_id)
+    if key == None:
+        return []
+
+    fields = ('id', 'reading_date') + tuple(columns or ('soil_moisture_reading', 'light_intensity_reading', 'water_level_reading'))
+    if before != None and (end_date == None or before[0] < end_date):
+        end_date = before[0]
+
+    entries = []
+    for model in partitions.partitions_between(start_date, end_date):
+        queryset = model.objects.filter(plant_id = key)
+        if start_date != None:
+            queryset = queryset.filter(reading_date__gte = start_date)
+
+        #Splitting the cursor condition into an equality and a range keeps every query on the index, which an OR would not
+        if before != None and model is partitions.partition_model(partitions.month_of(before[0])):
+            queries = [queryset.filter(reading_date = before[0], id__lt = before[1]), queryset.filter(reading_date__lt = before[0])]
+        elif end_date != None:
+            queries = [queryset.filter(reading_date__lte = end_date)]
+        else:
+            queries = [queryset]
+
+        for query in queries:
+            entries.extend(query.order_by('-reading_date', '-id').values(*fields)[:limit - len(entries)])
+            if len(entries) == limit:
+                break
+        if len(entries) == limit:
+            break
+
+    #The compacted readings are decoded one block at a time until the page is full
+    compacted = ({field: getattr(entry, field) for field in fields}
+                 for entry in blocks.block_entries(plant_id, start_date, end_date)
+                 if before == None or (entry.reading_date, entry.id) < before)
+    return list(itertools.islice(heapq.merge(entries, compacted, key=lambda entry: (entry['reading_date'], entry['id']), reverse=True), limit))
+
+def iter_readings(plant_id, start_date=None, end_date=None):
+    '''
+    Iterates over all of the readings of a plant from the oldest to the newest as blocks.CompactedReading tuples, without loading
+    them all at once. This is used for the exports and for the full history scans
+
+    Arguments:
+        |- start_date: the first date (inclusive), None for no start
+        |- end_date: the last date (inclusive), None for no end
+    '''
+    def partition_entries():
+        key = plants.plant_key(plant_id)
+        if key == None:
+            return
+
+        for model in partitions.partitions_between(start_date, end_date, newest_first = False):
+            queryset = model.objects.filter(plant_id = key)
+            if start_date != None:
+                queryset = queryset.filter(reading_date__gte = start_date)
+            if end_date != None:
+                queryset = queryset.filter(reading_date__lte = end_date)
+            rows = queryset.order_by('reading_date', 'id').values_list('id', 'reading_date', *blocks.COLUMNS)
+            try:
+                yield from (blocks.CompactedReading(row[0], plant_id, *row[1:]) for row in rows.iterator(chunk_size = 2000))
+            except DatabaseError as error:
+                #The readings of a partition dropped by another process are gone, so the iteration goes on with the next one
+                if not partitions.is_dropped_partition(error):
+                    raise
+                partitions.existing_months(refresh=True)
+
+    return blocks.merge_entries([blocks.block_entries(plant_id, start_date, end_date, newest_first = False), partition_entries()], newest_first = False)
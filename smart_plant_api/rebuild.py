@@ -0,0 +1,176 @@
+'''
+Rebuilds the data that is derived from the reading history: the stored decisions of rules.py and the running forecast sums of
+forecast.py. These are normally kept up to date by AddEntry one reading at a time, and are rebuilt from the whole history after
+a bug fix, a change of the forecast settings or a restore of the readings.
+
+The registry of the plants (see plants.py) is split into slices of consecutive keys that are rebuilt by a pool of worker
+processes. Every worker streams the readings of its plants, and writes the results in batched transactions. A slice is
+checkpointed in the same transaction as its last batch, so an interrupted rebuild only has to redo the slices that were not done.
+
+The server keeps running during a rebuild. Every batch bumps the data versions of its plants when it is written, which
+invalidates their cached responses, and a plant that gets a reading between the read of its history and the write of its
+batch is left as AddEntry wrote it, since its rebuilt data would be missing that reading.
+
+The history keeps the date of every reading but not its time, so the rebuilt forecasts place every reading at the start of its
+day, just like rules.backfill_decisions does for the decisions. The readings of the day of the stored decision are the
+exception: they are placed at the time of that decision, which AddEntry recorded exactly, so that the next reading is not
+decayed from midnight.
+'''
+from django.db import transaction
+from django.utils import timezone
+from smart_plant_api import caching, forecast, plants, readings, rules
+import datetime, json
+
+def key_slices(slice_size) -> list:
+    '''
+    Splits the keys of the registry into slices. The bounds of the slices only depend on the slice size, so the slices of a
+    resumed rebuild are the same as those of the interrupted one as long as the same size is used
+
+    Returns:
+        |- (list): of the (first key, last key) of every slice, both inclusive
+    '''
+    from django.db.models import Max
+    from smart_plant_api.models import Plant
+
+    last_key = Plant.objects.aggregate(last_key = Max('id'))['last_key'] or 0
+    return [(first_key, first_key + slice_size - 1) for first_key in range(1, last_key + 1, slice_size)]
+
+def completed_slices() -> set:
+    '''
+    Gets the (first key, last key) of the slices that have been checkpointed
+    '''
+    from smart_plant_api.models import RebuildCheckpoint
+    return set(RebuildCheckpoint.objects.values_list('first_key', 'last_key'))
+
+def checkpoint_slice_sizes() -> set:
+    '''
+    Gets the slice sizes that the checkpointed slices were rebuilt with
+    '''
+    from smart_plant_api.models import RebuildCheckpoint
+    return set(RebuildCheckpoint.objects.values_list('slice_size', flat=True).distinct())
+
+def clear_checkpoints() -> None:
+    from smart_plant_api.models import RebuildCheckpoint
+    RebuildCheckpoint.objects.all().delete()
+
+def start_worker() -> None:
+    '''
+    Prepares a worker process of the pool. A spawned worker has to set Django up itself, and a forked one must not reuse the
+    database connections of its parent
+    '''
+    from django.apps import apps
+    from django.db import connections
+    from smart_plant_api import partitions
+
+    if not apps.ready:
+        import django
+        django.setup()
+
+    connections.close_all()
+    partitions.existing_months(refresh=True)
+
+def rebuild_plant(plant_id, plant_rules, old_decision=None) -> tuple:
+    '''
+    Replays the whole history of a plant
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- plant_rules: the compiled rules of the plant
+        |- old_decision: the stored decision of the plant. The readings of its day are placed at its reading time
+
+    Returns:
+        |- (tuple): of the new (PlantDecision, PlantForecast, number of readings), or (None, None, 0) for a plant without readings
+    '''
+    from smart_plant_api.models import PlantDecision, PlantForecast
+
+    statistics = forecast.empty_statistics()
+    count, latest, previous = 0, None, None
+    day_time, reading_time = None, None
+    decision_day = timezone.localdate(old_decision.reading_time) if old_decision != None else None
+
+    for reading in readings.iter_readings(plant_id):
+        if latest == None or reading.reading_date != latest.reading_date:
+            if reading.reading_date == decision_day:
+                day_time = old_decision.reading_time
+            else:
+                day_time = timezone.make_aware(datetime.datetime.combine(reading.reading_date, datetime.time()))
+
+        forecast.add_reading(statistics, (day_time - reading_time).total_seconds() / 3600 if reading_time != None else 0,
+                             {column: getattr(reading, column) for column in forecast.COLUMNS})
+        count, latest, previous, reading_time = count + 1, reading, latest, day_time
+
+    if latest == None:
+        return (None, None, 0)
+
+    #The first reading of a plant is compared against itself
+    old_soil_moisture = (previous or latest).soil_moisture_reading
+    lamp_intensity_state, water_pump_state = plant_rules.actuators(latest.light_intensity_reading, latest.soil_moisture_reading, old_soil_moisture)
+
+    decision = PlantDecision(plant_id = plant_id, reading_time = reading_time,
+                             soil_moisture_reading = latest.soil_moisture_reading,
+                             light_intensity_reading = latest.light_intensity_reading,
+                             water_level_reading = latest.water_level_reading,
+                             old_soil_moisture_reading = old_soil_moisture,
+                             lamp_intensity_state = lamp_intensity_state,
+                             water_pump_state = water_pump_state,
+                             plant_state_rule = plant_rules.plant_state_rule(latest.soil_moisture_reading, latest.light_intensity_reading,
+                                                                             latest.water_level_reading, lamp_intensity_state, water_pump_state))
+    plant_forecast = PlantForecast(plant_id = plant_id, updated_at = reading_time, statistics = json.dumps(statistics))
+    return (decision, plant_forecast, count)
+
+def rebuild_slice(first_key, last_key, batch_size=100) -> dict:
+    '''
+    Rebuilds the decisions and the forecasts of the plants of a slice and checkpoints the slice. The stored data of the plants
+    that have no readings left is removed, and the plants that changed while they were being rebuilt are skipped
+
+    Arguments:
+        |- first_key: the first key of the slice (inclusive)
+        |- last_key: the last key of the slice (inclusive)
+        |- batch_size: the number of plants whose results are written in a single transaction
+
+    Returns:
+        |- (dict): of the number of plants rebuilt with readings, of readings and of plants skipped in the slice
+    '''
+    from smart_plant_api.models import Plant, PlantDecision, PlantForecast, PlantProfile, RebuildCheckpoint
+
+    plant_ids = list(Plant.objects.filter(id__gte = first_key, id__lte = last_key).order_by('id').values_list('plant_id', flat=True))
+    #Looking the keys up together instead of one plant at a time
+    plants.plant_keys(plant_ids)
+
+    counts = {'plants': 0, 'readings': 0, 'skipped': 0}
+    for start in range(0, max(len(plant_ids), 1), batch_size):
+        batch = plant_ids[start:start + batch_size]
+        #Read before the histories, so that a reading added while they are being replayed is noticed below
+        start_versions = caching.data_versions(batch)
+        overrides = dict(PlantProfile.objects.filter(plant_id__in = batch).values_list('plant_id', 'thresholds'))
+        old_decisions = {decision.plant_id: decision for decision in PlantDecision.objects.filter(plant_id__in = batch)}
+
+        results = {plant_id: rebuild_plant(plant_id, rules.compile_profile(overrides.get(plant_id, '')), old_decisions.get(plant_id))
+                   for plant_id in batch}
+
+        with transaction.atomic():
+            #Bumping the versions first takes the write lock, so no reading can be added to the batch until it is written. A
+            #version that moved on by more than this bump belongs to a plant that changed since its history was read
+            versions = caching.bump_data_versions(batch)
+            rebuilt = [plant_id for plant_id in batch if start_versions[plant_id] != None and versions.get(plant_id) == start_versions[plant_id] + 1]
+            counts['skipped'] += len(batch) - len(rebuilt)
+
+            decisions, forecasts = [], []
+            for plant_id in rebuilt:
+                decision, plant_forecast, count = results[plant_id]
+                if decision != None:
+                    decisions.append(decision)
+                    forecasts.append(plant_forecast)
+                    counts['plants'] += 1
+                    counts['readings'] += count
+
+            PlantDecision.objects.filter(plant_id__in = rebuilt).delete()
+            PlantForecast.objects.filter(plant_id__in = rebuilt).delete()
+            PlantDecision.objects.bulk_create(decisions, batch_size=500)
+            PlantForecast.objects.bulk_create(forecasts, batch_size=500)
+
+            if start + batch_size >= len(plant_ids):
+                RebuildCheckpoint.objects.update_or_create(first_key = first_key, last_key = last_key,
+                                                           defaults = {'plants': counts['plants'], 'readings': counts['readings'], 'slice_size': last_key - first_key + 1, 'completed_at': timezone.now()})
+
+    return counts
@@ -0,0 +1,401 @@
+'''
+The rule engine used to decide the actuator states (lamp intensity and water pump) and the state (mood) of a plant.
+
+Rather than hardcoding the thresholds as a chain of if statements, the rules are described as tables of data. A profile
+(the default one, optionally merged with the per-plant overrides stored in the PlantProfile model) is compiled once into a
+CompiledRules object which can then evaluate a single reading or whole columns of readings in one go. The columns are
+evaluated with NumPy when it is installed (pip install numpy), and in plain Python otherwise.
+'''
+import bisect, functools, json, operator
+
+#The default thresholds used for every plant that does not have its own profile
+DEFAULT_PROFILE = {
+    #(lower bound, lamp intensity) pairs. A light intensity falls into the band of the largest lower bound that does not exceed it
+    #Light intensities below the first lower bound turn the lamp off
+    'lamp_bands': [[0, 100], [25, 75], [50, 50], [75, 10], [100, 0]],
+
+    #The pump is always on at or below the first limit and always off at or above the second one. In between, the pump is only
+    #turned on when the soil moisture is rising by more than pump_difference since the previous reading
+    'pump_limits': [45, 75],
+    'pump_difference': 2,
+
+    #The thresholds used by the plant state rules
+    'moisture_low': 45,
+    'light_low': 25,
+    'lamp_low': 30,
+    'water_low': 20,
+}
+
+#The columns that the plant state rules can look at
+COLUMNS = ('soil_moisture', 'light_intensity', 'water_level', 'lamp_intensity', 'water_pump')
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+}
+
+#The plant state rules. The rules are checked in order and the first rule whose conditions all hold defines the state of the plant.
+#Each condition is a (column, operator, threshold) tuple where the threshold is either a key of the profile or a literal value
+PLANT_STATE_RULES = (
+    ('Happy', "Your plant is well watered, has adequate light exposure and is healthier than ever!",
+        (('soil_moisture', '<', 'moisture_low'), ('light_intensity', '<', 'light_low'))),
+    ('Worried', "Your plant does not have enough water or light intensity to continue healthy growth",
+        (('soil_moisture', '<', 'moisture_low'), ('water_pump', '==', False), ('light_intensity', '<', 'light_low'), ('lamp_intensity', '<', 'lamp_low'))),
+    ('Hungry', "Your plant requires more soil moisture content to continue healthy growth",
+        (('soil_moisture', '<', 'moisture_low'), ('water_pump', '==', False))),
+    ('Sad', "Your plant requires more light in order for it to continue healthy growth",
+        (('light_intensity', '<', 'light_low'), ('lamp_intensity', '<', 'lamp_low'))),
+    ('Worried', "Your plant needs more water in the water tank to feel safe",
+        (('water_level', '<', 'water_low'),)),
+)
+
+DEFAULT_PLANT_STATE = ('Happy', "Your plant is well watered, has adequate light exposure and is healthier than ever!")
+
+class CompiledRules:
+    '''
+    A compiled version of a profile. All of the lookups into the profile are done once when the object is created so that the
+    evaluation itself is only made out of comparisons and list indexing.
+    '''
+    __slots__ = ('profile', 'lamp_bounds', 'lamp_values', 'pump_low', 'pump_high', 'pump_difference', 'state_rules')
+
+    def __init__(self, profile):
+        self.profile = profile
+
+        bands = sorted(profile['lamp_bands'])
+        self.lamp_bounds = [bound for bound, _ in bands]
+        self.lamp_values = [0] + [value for _, value in bands]
+
+        self.pump_low, self.pump_high = min(profile['pump_limits']), max(profile['pump_limits'])
+        self.pump_difference = profile['pump_difference']
+
+        self.state_rules = []
+        for state, description, conditions in PLANT_STATE_RULES:
+            compiled_conditions = tuple(
+                (COLUMNS.index(column), OPERATORS[op], profile[threshold] if isinstance(threshold, str) else threshold)
+                for column, op, threshold in conditions
+            )
+            self.state_rules.append((state, description, compiled_conditions))
+
+    def lamp_intensity(self, light_intensity) -> int:
+        return self.lamp_values[bisect.bisect_right(self.lamp_bounds, light_intensity)]
+
+    def water_pump(self, soil_moisture, old_soil_moisture) -> bool:
+        if soil_moisture <= self.pump_low:
+            return True
+        if soil_moisture >= self.pump_high:
+            return False
+
+        difference = soil_moisture - old_soil_moisture
+        return difference > 0 if abs(difference) > self.pump_difference else False
+
+    def actuators(self, light_intensity, soil_moisture, old_soil_moisture) -> tuple:
+        '''
+        Calculates the (lamp_intensity_state, water_pump_state) of a single reading
+        '''
+        return (self.lamp_intensity(light_intensity), self.water_pump(soil_moisture, old_soil_moisture))
+
+    def plant_state_rule(self, soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state) -> int:
+        '''
+        Finds the index of the first plant state rule that matches a single plant given its latest readings and its actuator states.
+        An index of -1 means that no rule matched and that the plant is in the default state
+        '''
+        row = (soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state)
+        for index, (_, _, conditions) in enumerate(self.state_rules):
+            if all(op(row[column], threshold) for column, op, threshold in conditions):
+                return index
+
+        return -1
+
+    def plant_state(self, soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state) -> tuple:
+        '''
+        Calculates the (state, description) of a single plant given its latest readings and its actuator states
+        '''
+        return describe_state(self.plant_state_rule(soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state))
+
+    def evaluate_batch(self, light_intensity, soil_moisture, old_soil_moisture, water_level, vectorized=None) -> dict:
+        '''
+        Evaluates the rules over whole columns of readings at once. With NumPy installed, every rule is evaluated as array
+        operations over the whole columns. Without it, the columns are still evaluated one rule at a time in plain Python.
+
+        Arguments:
+            |- light_intensity: a sequence of light intensity readings
+            |- soil_moisture: a sequence of soil moisture readings
+            |- old_soil_moisture: a sequence of the soil moisture readings that came before the ones in soil_moisture
+            |- water_level: a sequence of water level readings
+            |- vectorized: True to use NumPy, False to use plain Python. None uses NumPy when it is installed
+
+        Returns:
+            |- (dict): of lists that are all as long as the given columns. The following is the format of the dict
+                {
+                    lamp_intensity_state: [(int)],
+                    water_pump_state: [(bool)],
+                    plant_state_rule: [(int)]
+                }
+        '''
+        if vectorized == None:
+            vectorized = numpy_available()
+
+        if vectorized:
+            return self.evaluate_arrays(light_intensity, soil_moisture, old_soil_moisture, water_level)
+        return self.evaluate_columns(light_intensity, soil_moisture, old_soil_moisture, water_level)
+
+    def evaluate_arrays(self, light_intensity, soil_moisture, old_soil_moisture, water_level) -> dict:
+        '''
+        The NumPy version of evaluate_batch
+        '''
+        import numpy
+
+        light_intensity = numpy.asarray(light_intensity)
+        soil_moisture = numpy.asarray(soil_moisture)
+        difference = soil_moisture - numpy.asarray(old_soil_moisture)
+
+        lamp_intensity_state = numpy.asarray(self.lamp_values)[numpy.searchsorted(self.lamp_bounds, light_intensity, side='right')]
+        water_pump_state = numpy.where(soil_moisture <= self.pump_low, True,
+                                       numpy.where(soil_moisture >= self.pump_high, False,
+                                                   (numpy.abs(difference) > self.pump_difference) & (difference > 0)))
+
+        columns = (soil_moisture, light_intensity, numpy.asarray(water_level), lamp_intensity_state, water_pump_state)
+        plant_state_rule = numpy.full(len(lamp_intensity_state), -1)
+        undecided = numpy.ones(len(lamp_intensity_state), dtype=bool)
+        for index, (_, _, conditions) in enumerate(self.state_rules):
+            matching = undecided.copy()
+            for column, op, threshold in conditions:
+                matching &= op(columns[column], threshold)
+
+            plant_state_rule[matching] = index
+            undecided &= ~matching
+            if not undecided.any():
+                break
+
+        return {
+            'lamp_intensity_state': lamp_intensity_state.tolist(),
+            'water_pump_state': water_pump_state.tolist(),
+            'plant_state_rule': plant_state_rule.tolist(),
+        }
+
+    def evaluate_columns(self, light_intensity, soil_moisture, old_soil_moisture, water_level) -> dict:
+        '''
+        The plain Python version of evaluate_batch. Every rule is turned into a single pass over the columns
+        '''
+        lamp_bounds, lamp_values = self.lamp_bounds, self.lamp_values
+        lamp_intensity_state = [lamp_values[bisect.bisect_right(lamp_bounds, light)] for light in light_intensity]
+        water_pump_state = list(map(self.water_pump, soil_moisture, old_soil_moisture))
+
+        columns = (soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state)
+        plant_state_rule = [-1] * len(lamp_intensity_state)
+        undecided = list(range(len(plant_state_rule)))
+        for index, (_, _, conditions) in enumerate(self.state_rules):
+            #Narrowing down the rows that are still undecided to the ones that match every condition of this rule
+            matching = undecided
+            for column, op, threshold in conditions:
+                values = columns[column]
+                matching = [row for row in matching if op(values[row], threshold)]
+
+            for row in matching:
+                plant_state_rule[row] = index
+            if matching:
+                undecided = [row for row in undecided if plant_state_rule[row] == -1]
+            if not undecided:
+                break
+
+        return {
+            'lamp_intensity_state': lamp_intensity_state,
+            'water_pump_state': water_pump_state,
+            'plant_state_rule': plant_state_rule,
+        }
+
+@functools.lru_cache(maxsize=1)
+def numpy_available() -> bool:
+    '''
+    Checks whether NumPy is installed. It is optional and only imported once a batch is evaluated, since importing it slows
+    down the start of every worker
+    '''
+    try:
+        import numpy
+    except ImportError:
+        return False
+    return True
+
+@functools.lru_cache(maxsize=256)
+def compile_profile(overrides='') -> CompiledRules:
+    '''
+    Compiles the default profile merged with the given overrides. The overrides are given as the JSON text stored in the
+    PlantProfile model so that plants sharing the same overrides share the same compiled rules.
+
+    Arguments:
+        |- overrides: a JSON object of the thresholds to override. An empty string means no overrides.
+
+    Returns:
+        |- (CompiledRules): the compiled rules
+    '''
+    profile = dict(DEFAULT_PROFILE)
+    if overrides:
+        profile.update(json.loads(overrides))
+
+    return CompiledRules(profile)
+
+def profile_overrides(plant_id) -> str:
+    '''
+    Gets the JSON text of the overrides of the given plant or an empty string if the plant uses the default profile
+    '''
+    from smart_plant_api.models import PlantProfile
+    return PlantProfile.objects.filter(plant_id = plant_id).values_list('thresholds', flat=True).first() or ''
+
+def rules_for(plant_id) -> CompiledRules:
+    '''
+    Gets the compiled rules of the given plant.
+    '''
+    return compile_profile(profile_overrides(plant_id))
+
+def describe_state(plant_state_rule) -> tuple:
+    '''
+    Gets the (state, description) of the plant state rule with the given index. An index of -1 gives the default state
+    '''
+    if plant_state_rule == -1:
+        return DEFAULT_PLANT_STATE
+
+    state, description, _ = PLANT_STATE_RULES[plant_state_rule]
+    return (state, description)
+
+def record_decision(plant_id, reading, old_soil_moisture, reading_time):
+    '''
+    Precomputes the actuator states and the plant state of a plant from its latest reading and stores them in the
+    PlantDecision model so that the endpoints do not need to recalculate them on every request.
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- reading: the latest reading entry of the plant
+        |- old_soil_moisture: the soil moisture reading that came before the latest reading
+        |- reading_time: the time that the reading was received at
+
+    Returns:
+        |- (PlantDecision): the stored decision
+    '''
+    from smart_plant_api.models import PlantDecision
+
+    rules = rules_for(plant_id)
+    lamp_intensity_state, water_pump_state = rules.actuators(reading.light_intensity_reading, reading.soil_moisture_reading, old_soil_moisture)
+    plant_state_rule = rules.plant_state_rule(reading.soil_moisture_reading, reading.light_intensity_reading, reading.water_level_reading, lamp_intensity_state, water_pump_state)
+
+    decision, _ = PlantDecision.objects.update_or_create(plant_id = plant_id, defaults = {
+        'reading_time': reading_time,
+        'soil_moisture_reading': reading.soil_moisture_reading,
+        'light_intensity_reading': reading.light_intensity_reading,
+        'water_level_reading': reading.water_level_reading,
+        'old_soil_moisture_reading': old_soil_moisture,
+        'lamp_intensity_state': lamp_intensity_state,
+        'water_pump_state': water_pump_state,
+        'plant_state_rule': plant_state_rule,
+    })
+    return decision
+
+def recompute_decision(plant_id):
+    '''
+    Recomputes the stored decision of a single plant from the readings stored with it, using the current rules of the plant
+
+    Returns:
+        |- (PlantDecision): the stored decision, or None if the plant does not have one yet
+    '''
+    from smart_plant_api.models import PlantDecision
+
+    decision = PlantDecision.objects.filter(plant_id = plant_id).first()
+    if decision == None:
+        return None
+
+    rules = rules_for(plant_id)
+    lamp_intensity_state, water_pump_state = rules.actuators(decision.light_intensity_reading, decision.soil_moisture_reading, decision.old_soil_moisture_reading)
+    plant_state_rule = rules.plant_state_rule(decision.soil_moisture_reading, decision.light_intensity_reading, decision.water_level_reading, lamp_intensity_state, water_pump_state)
+
+    if [decision.lamp_intensity_state, decision.water_pump_state, decision.plant_state_rule] != [lamp_intensity_state, water_pump_state, plant_state_rule]:
+        decision.lamp_intensity_state, decision.water_pump_state, decision.plant_state_rule = lamp_intensity_state, water_pump_state, plant_state_rule
+        decision.save(update_fields=['lamp_intensity_state', 'water_pump_state', 'plant_state_rule'])
+
+    return decision
+
+def profile_changed(plant_id) -> None:
+    '''
+    Brings the stored decision and the cached responses of a plant up to date with its profile. This is called whenever the
+    PlantProfile of the plant is saved or deleted
+    '''
+    from smart_plant_api import caching, live
+
+    decision = recompute_decision(plant_id)
+    data_version = caching.bump_data_version(plant_id)
+    if decision != None:
+        live.publish(plant_id, data_version, lambda: live.reading_changes(plant_id, decision))
+
+def recompute_fleet(batch_size=1000) -> int:
+    '''
+    Recomputes the stored decisions of every plant in the fleet. This is meant to be used whenever the thresholds change.
+    The plants are grouped by their profile and every group is evaluated as a single batch. The data versions of the plants
+    whose decisions changed are bumped together and their changes are published to the live feed.
+
+    Arguments:
+        |- batch_size: the number of rows written to the database in a single query
+
+    Returns:
+        |- (int): the number of decisions that have changed
+    '''
+    from smart_plant_api import caching, live
+    from smart_plant_api.models import PlantDecision, PlantProfile
+
+    overrides = dict(PlantProfile.objects.values_list('plant_id', 'thresholds'))
+    decisions = list(PlantDecision.objects.all())
+
+    groups = {}
+    for decision in decisions:
+        groups.setdefault(overrides.get(decision.plant_id, ''), []).append(decision)
+
+    changed = []
+    for profile, group in groups.items():
+        results = compile_profile(profile).evaluate_batch(
+            [decision.light_intensity_reading for decision in group],
+            [decision.soil_moisture_reading for decision in group],
+            [decision.old_soil_moisture_reading for decision in group],
+            [decision.water_level_reading for decision in group],
+        )
+
+        for decision, *result in zip(group, results['lamp_intensity_state'], results['water_pump_state'], results['plant_state_rule']):
+            if [decision.lamp_intensity_state, decision.water_pump_state, decision.plant_state_rule] != result:
+                decision.lamp_intensity_state, decision.water_pump_state, decision.plant_state_rule = result
+                changed.append(decision)
+
+    PlantDecision.objects.bulk_update(changed, ['lamp_intensity_state', 'water_pump_state', 'plant_state_rule'], batch_size=batch_size)
+
+    #The cached responses of the changed plants are out of date
+    versions = caching.bump_data_versions([decision.plant_id for decision in changed])
+    for decision in changed:
+        live.publish(decision.plant_id, versions.get(decision.plant_id), lambda decision=decision: live.reading_changes(decision.plant_id, decision))
+
+    return len(changed)
+
+def backfill_decisions() -> int:
+    '''
+    Creates the stored decisions of the plants that only have readings from before decisions were precomputed at ingest.
+    The data versions of these plants are bumped together and their decisions are published to the live feed.
+
+    Returns:
+        |- (int): the number of decisions that have been created
+    '''
+    from django.utils import timezone
+    from smart_plant_api.models import PlantDecision
+    from smart_plant_api import caching, live, readings
+    import datetime
+
+    decided = set(PlantDecision.objects.values_list('plant_id', flat=True))
+    plant_ids = readings.plant_ids() - decided
+
+    decisions = []
+    for plant_id in plant_ids:
+        latest_entries = readings.latest_readings(plant_id, 2)
+        reading_time = timezone.make_aware(datetime.datetime.combine(latest_entries[0].reading_date, datetime.time()))
+        decisions.append(record_decision(plant_id, latest_entries[0], latest_entries[-1].soil_moisture_reading, reading_time))
+
+    versions = caching.bump_data_versions(plant_ids)
+    for decision in decisions:
+        live.publish(decision.plant_id, versions.get(decision.plant_id), lambda decision=decision: live.reading_changes(decision.plant_id, decision))
+
+    return len(plant_ids)
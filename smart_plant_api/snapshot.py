@@ -0,0 +1,210 @@
+'''
+A read only copy of the database that the heavy analytical reads (the statistics of the app and the exports) are sent to, so
+that they do not hold up the writes of the devices on the primary database. SQLite lets a single writer in at a time and a long
+read keeps it waiting, which the snapshot avoids.
+
+The snapshot is a separate SQLite file refreshed with the online backup API of SQLite (python manage.py refresh_snapshot), which
+copies the primary a few pages at a time without blocking its writers. A refresh writes a new file which then replaces the old
+one, so the readers never see a half copied snapshot.
+
+The reads only go to the snapshot inside snapshot_reads (or the snapshot_view decorator), and only while the snapshot is younger
+than the staleness bound of SNAPSHOT in the settings and holds all of the tables of the app. Every other read, and every read that must see the latest writes, goes to
+the primary as usual.
+'''
+from django.conf import settings
+from django.db import DatabaseError, connections
+import contextlib, functools, logging, os, pathlib, sqlite3, threading, time
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+#The (inode, modification time, size) of the last snapshot file that was checked by populated, and the result of the check
+_populated = (None, False)
+
+def snapshot_path() -> str:
+    '''
+    Gets the path of the snapshot file, or None if no snapshot database is configured
+    '''
+    database = settings.DATABASES.get(settings.SNAPSHOT['DATABASE'])
+    return database['NAME'] if database != None else None
+
+def snapshot_age() -> float:
+    '''
+    Gets the number of seconds since the data of the snapshot was copied, or None if there is no snapshot yet
+    '''
+    path = snapshot_path()
+    try:
+        #The modification time of the file is set to the time the copy was started at
+        return max(time.time() - os.stat(path).st_mtime, 0) if path != None else None
+    except FileNotFoundError:
+        return None
+
+def refresh() -> float:
+    '''
+    Copies the primary database into a new snapshot
+
+    Returns:
+        |- (float): the number of seconds the copy took
+    '''
+    path = snapshot_path()
+    temporary_path = f'{path}.tmp'
+    start = time.time()
+
+    source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+    target = sqlite3.connect(temporary_path)
+    try:
+        #A few pages are copied at a time so that the writers of the primary only wait for a single step
+        source.backup(target, pages=settings.SNAPSHOT['BACKUP_PAGES'], sleep=settings.SNAPSHOT['BACKUP_SLEEP'])
+    finally:
+        target.close()
+        source.close()
+
+    #The snapshot holds at least the data of when the copy started
+    os.utime(temporary_path, (start, start))
+    os.replace(temporary_path, path)
+    return time.time() - start
+
+def populated() -> bool:
+    '''
+    Checks whether the snapshot file is a copy of the primary that holds the tables of the app. An empty file is left in place
+    of the snapshot by any connection opened to it before its first refresh, and a snapshot made before a migration misses the
+    newer tables. The result is kept until the file is replaced
+    '''
+    global _populated
+    from django.apps import apps
+
+    path = snapshot_path()
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, TypeError):
+        return False
+
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _populated[0] != key:
+        expected = {model._meta.db_table for model in apps.get_app_config('smart_plant_api').get_models() if model._meta.managed}
+        tables = set()
+        if stat.st_size > 0:
+            try:
+                #Opened read only so that a missing file is never created
+                database = sqlite3.connect(f'{pathlib.Path(path).resolve().as_uri()}?mode=ro', uri=True)
+                try:
+                    tables = {name for name, in database.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                finally:
+                    database.close()
+            except sqlite3.DatabaseError:
+                pass
+
+        _populated = (key, expected <= tables)
+
+    return _populated[1]
+
+def usable(max_age=None) -> bool:
+    '''
+    Checks whether the reads can go to the snapshot
+
+    Arguments:
+        |- max_age: the staleness bound in seconds. SNAPSHOT['MAX_AGE'] is used when it is not given
+    '''
+    if not settings.SNAPSHOT['ENABLED']:
+        return False
+
+    age = snapshot_age()
+    return age != None and age <= (max_age if max_age != None else settings.SNAPSHOT['MAX_AGE']) and populated()
+
+def snapshot_identity(max_age=None) -> str:
+    '''
+    Gets what the reads made by snapshot_reads would be answered from: the inode and modification time of the snapshot file
+    while it is usable, and 'primary' otherwise. A refresh always replaces the file, so this changes with every refresh
+    '''
+    if not usable(max_age):
+        return 'primary'
+
+    try:
+        stat = os.stat(snapshot_path())
+    except FileNotFoundError:
+        return 'primary'
+    return f'{stat.st_ino}:{stat.st_mtime_ns}'
+
+def reopen_if_replaced() -> None:
+    '''
+    Closes the connection of this thread to the snapshot if the snapshot has been refreshed since it was opened, since an open
+    connection keeps reading the replaced file
+    '''
+    connection = connections[settings.SNAPSHOT['DATABASE']]
+    inode = os.stat(snapshot_path()).st_ino
+    if connection.connection != None and getattr(connection, 'snapshot_inode', None) != inode:
+        connection.close()
+    connection.snapshot_inode = inode
+
+@contextlib.contextmanager
+def snapshot_reads(max_age=None):
+    '''
+    Sends the reads made inside of the block to the snapshot if it is fresh enough, and to the primary otherwise
+
+    Arguments:
+        |- max_age: the staleness bound in seconds. SNAPSHOT['MAX_AGE'] is used when it is not given
+
+    Returns:
+        |- (bool): whether the reads go to the snapshot
+    '''
+    previous = getattr(_state, 'active', False)
+    _state.active = usable(max_age)
+    if _state.active:
+        reopen_if_replaced()
+
+    try:
+        yield _state.active
+    finally:
+        _state.active = previous
+
+def snapshot_view(view):
+    '''
+    A decorator sending the reads of a view to the snapshot. The view is run again on the primary if it fails on the snapshot,
+    which happens when it needs a table that is newer than the snapshot (the partition of a new month for example).
+
+    The responses read from the snapshot are cached for no longer than the staleness bound allows, and caching.cache_response
+    makes their ETags from the snapshot they are read from as well, which the reads_snapshot attribute of the view tells it to
+    '''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        active = False
+        try:
+            with snapshot_reads() as active:
+                response = view(request, *args, **kwargs)
+        except DatabaseError:
+            if not active:
+                raise
+            logger.warning('Snapshot read failed, reading from the primary', extra={'path': request.path}, exc_info=True)
+            return view(request, *args, **kwargs)
+
+        if active:
+            remaining = max(settings.SNAPSHOT['MAX_AGE'] - (snapshot_age() or 0), 0)
+            response.cache_timeout = min(getattr(response, 'cache_timeout', remaining), remaining)
+        return response
+
+    wrapper.reads_snapshot = True
+    return wrapper
+
+class SnapshotRouter:
+    '''
+    Routes the reads made inside of snapshot_reads to the snapshot. The snapshot is never written to or migrated
+    '''
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'active', False):
+            return settings.SNAPSHOT['DATABASE']
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #The snapshot is a copy of the primary, so their rows can be related
+        if {obj1._state.db, obj2._state.db} <= {'default', settings.SNAPSHOT['DATABASE']}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.SNAPSHOT['DATABASE']:
+            return False
+        return None
@@ -0,0 +1,162 @@
+'''
+The fleet sweeper. It evaluates the alerts of every plant in a single pass over the PlantDecision model (which holds the latest
+reading of every plant) instead of one plant at a time, and is meant to be run periodically with the sweep_alerts command.
+
+Besides the low water and low soil moisture alerts that AddEntry sends, the sweeper finds the plants whose sensors stopped
+reporting, which AddEntry can never notice. The notifications are recorded with a single bulk insert and pushed to Expo in
+batches.
+'''
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+import datetime
+
+#The reason, title and message of every alert. The reasons match the ones that AddEntry records in NotificationSent
+WATER_LEVEL = ('Water Level', "Water Level is too low", "Your current water level is {water_level}. Please refill the tank soon to keep your plant healthy")
+SOIL_MOISTURE = ('Soil Moisture', "Your plant needs to be watered", "Your current soil moisture is {soil_moisture}. Please water your plant as soon as possible to ensure that it is kept healthy")
+SENSOR_OFFLINE = ('Sensor Offline', "Your plant stopped reporting", "No readings have been received from your plant in the last {minutes} minutes. Please check that it is powered and connected")
+
+#The maximum number of messages in a single request to the Expo push service
+PUSH_BATCH_SIZE = 100
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def find_alerts(now) -> list:
+    '''
+    Finds the alerts of the whole fleet with a single query. A plant whose sensor stopped reporting only gets the offline alert
+    since its readings are out of date.
+
+    Returns:
+        |- (list): of (plant_id, alert, reading_time, message) tuples where alert is one of the alert tuples above
+    '''
+    from smart_plant_api.models import PlantDecision
+
+    alerts = settings.ALERTS
+    stale_before = now - datetime.timedelta(minutes=alerts['STALE_MINUTES'])
+    columns = ('plant_id', 'reading_time', 'soil_moisture_reading', 'water_level_reading')
+
+    #Every part of the union is answered from its own index, a single filter with OR would scan the whole table instead
+    rows = PlantDecision.objects.filter(reading_time__lt = stale_before).values_list(*columns).union(
+        PlantDecision.objects.filter(water_level_reading__lt = alerts['WATER_LOW']).values_list(*columns),
+        PlantDecision.objects.filter(soil_moisture_reading__lt = alerts['SOIL_MOISTURE_LOW']).values_list(*columns))
+
+    found = []
+    for plant_id, reading_time, soil_moisture, water_level in rows:
+        if reading_time < stale_before:
+            found.append((plant_id, SENSOR_OFFLINE, reading_time, SENSOR_OFFLINE[2].format(minutes=alerts['STALE_MINUTES'])))
+            continue
+
+        if water_level < alerts['WATER_LOW']:
+            found.append((plant_id, WATER_LEVEL, reading_time, WATER_LEVEL[2].format(water_level=water_level)))
+        if soil_moisture < alerts['SOIL_MOISTURE_LOW']:
+            found.append((plant_id, SOIL_MOISTURE, reading_time, SOIL_MOISTURE[2].format(soil_moisture=soil_moisture)))
+
+    return found
+
+def already_notified(now) -> tuple:
+    '''
+    Gets the notifications that stop an alert from being sent again
+
+    Returns:
+        |- (tuple): of a set of the (plant_id, reason) notified within ALERTS['WAIT_TIME'] minutes, and a dict mapping every
+            plant_id to the time of its latest offline notification
+    '''
+    from smart_plant_api.models import NotificationSent
+
+    recent = set(NotificationSent.objects.filter(time__gte = now - datetime.timedelta(minutes=settings.ALERTS['WAIT_TIME']),
+                                                 reason__in = (WATER_LEVEL[0], SOIL_MOISTURE[0]))
+                                         .values_list('plant__plant_id', 'reason'))
+    offline = dict(NotificationSent.objects.filter(reason = SENSOR_OFFLINE[0])
+                                           .values('plant__plant_id')
+                                           .annotate(latest = Max('time'))
+                                           .values_list('plant__plant_id', 'latest'))
+    return recent, offline
+
+def plant_tokens(plant_ids) -> dict:
+    '''
+    Gets the Expo tokens bound to the given plants as a dict mapping every plant_id to a list of tokens
+    '''
+    from smart_plant_api.models import TokenPlantIDBind
+
+    tokens = {}
+    for chunk in _chunks(list(plant_ids), 500):
+        for plant_id, plant_tokens in TokenPlantIDBind.objects.filter(plant__plant_id__in = chunk).values_list('plant__plant_id', 'tokens'):
+            tokens.setdefault(plant_id, []).extend(token for token in plant_tokens.split(',') if token)
+
+    return tokens
+
+def push(messages) -> int:
+    '''
+    Pushes notifications to Expo in batches. The batches that fail are skipped just like the failed notifications of AddEntry
+
+    Arguments:
+        |- messages: a list of (token, title, message) tuples
+
+    Returns:
+        |- (int): the number of notifications that were accepted by Expo
+    '''
+    from exponent_server_sdk import PushClient, PushMessage
+
+    accepted = 0
+    client = PushClient()
+    valid_messages = [PushMessage(to=token, title=title, body=message, sound='default')
+                      for token, title, message in messages if PushClient.is_exponent_push_token(token)]
+    for batch in _chunks(valid_messages, PUSH_BATCH_SIZE):
+        try:
+            responses = client.publish_multiple(batch)
+        except Exception:
+            continue
+        accepted += sum(1 for response in responses if response.is_success())
+
+    return accepted
+
+def sweep(now=None, send=True) -> dict:
+    '''
+    Evaluates the alerts of the whole fleet, records the new notifications and pushes them
+
+    Arguments:
+        |- now: the time of the sweep, defaults to the current time
+        |- send: whether the notifications are recorded and pushed, or only counted
+
+    Returns:
+        |- (dict): of the counts of the sweep. The following is the format of the dict
+            {
+                alerts: (int) the number of alerts found
+                notifications: (int) the number of alerts that had not been notified yet
+                reasons: (dict) the number of notifications of every reason
+                pushed: (int) the number of push notifications accepted by Expo
+            }
+    '''
+    from smart_plant_api.models import NotificationSent
+    from smart_plant_api import plants
+
+    now = now or timezone.now()
+    found = find_alerts(now)
+    recent, offline = already_notified(now)
+
+    notifications = []
+    for plant_id, alert, reading_time, message in found:
+        if alert == SENSOR_OFFLINE:
+            #A plant is only notified once every time it goes offline
+            if offline.get(plant_id) != None and offline[plant_id] >= reading_time:
+                continue
+        elif (plant_id, alert[0]) in recent:
+            continue
+        notifications.append((plant_id, alert, message))
+
+    reasons = {}
+    for _, alert, _ in notifications:
+        reasons[alert[0]] = reasons.get(alert[0], 0) + 1
+
+    pushed = 0
+    if send and notifications:
+        keys = plants.plant_keys([plant_id for plant_id, _, _ in notifications], create=True)
+        NotificationSent.objects.bulk_create([NotificationSent(plant_id = keys[plant_id], reason = alert[0], time = now) for plant_id, alert, _ in notifications],
+                                             batch_size = 500)
+
+        tokens = plant_tokens({plant_id for plant_id, _, _ in notifications})
+        pushed = push([(token, alert[1], message) for plant_id, alert, message in notifications for token in tokens.get(plant_id, [])])
+
+    return {'alerts': len(found), 'notifications': len(notifications), 'reasons': reasons, 'pushed': pushed}
@@ -1,3 +1,1609 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connections, router
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+from smart_plant_api import admission, blocks, caching, fastpath, forecast, live, logs, partitions, plants, readings, rebuild, rules, snapshot, sweeper, timeseries, warmup
+from smart_plant_api.management.commands import benchmark, generate_fleet, rebuild_derived
+from smart_plant_api.models import NotificationSent, Plant, PlantDecision, PlantForecast, ResponseLock, TokenPlantIDBind
+from smart_plant_api.views import generate_error_message
+import asyncio, datetime, io, json, logging, os, pstats, random, sqlite3, subprocess, sys, tempfile, threading, time
 
-# Create your tests here.
+#Every cache is replaced by a local memory cache so that the tests never read or change the caches of the server
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+    for alias in settings.CACHES
+}
+
+def setUpModule():
+    #The debug events of the views would be mixed with the report of the tests
+    logging.disable(logging.DEBUG)
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+def baseline_actuators(light_intensity, soil_moisture, old_soil_moisture) -> tuple:
+    '''
+    The lamp and water pump logic that the rule tables replaced, kept as it was written
+    '''
+    lamp_intensity_state = 0
+    water_pump_state = False
+
+    if 0 <= light_intensity < 25:
+        lamp_intensity_state = 100
+    elif 25 <= light_intensity < 50:
+        lamp_intensity_state = 75
+    elif 50 <= light_intensity < 75:
+        lamp_intensity_state = 50
+    elif 75 <= light_intensity < 100:
+        lamp_intensity_state = 10
+
+    limits = [45, 75]
+    difference = soil_moisture - old_soil_moisture
+
+    if soil_moisture <= min(limits):
+        water_pump_state = True
+    elif soil_moisture >= max(limits):
+        water_pump_state = False
+    else:
+        water_pump_state = difference > 0 if abs(difference) > 2 else False
+
+    return (lamp_intensity_state, water_pump_state)
+
+def baseline_plant_state(soil_moisture, light_intensity, water_level, lamp_intensity_state, water_pump_state) -> str:
+    '''
+    The plant state logic that the rule tables replaced, kept as it was written
+    '''
+    if soil_moisture < 45 and light_intensity < 25:
+        return "Happy"
+    elif soil_moisture < 45 and water_pump_state == False and light_intensity < 25 and lamp_intensity_state < 30:
+        return "Worried"
+    elif soil_moisture < 45 and water_pump_state == False:
+        return "Hungry"
+    elif light_intensity < 25 and lamp_intensity_state < 30:
+        return "Sad"
+    elif water_level < 20:
+        return "Worried"
+    return "Happy"
+
+class RulesTest(SimpleTestCase):
+    def setUp(self):
+        self.rules = rules.compile_profile()
+
+        #Every threshold of the baseline, the values around it and the values outside of the sensor range
+        self.light_values = [-5, 0, 1, 24, 25, 26, 49, 50, 51, 74, 75, 76, 99, 100, 101, 120]
+        self.soil_values = [0, 19, 20, 43, 44, 45, 46, 60, 73, 74, 75, 76, 100]
+        self.differences = [-5, -3, -2, -1, 0, 1, 2, 3, 5]
+        self.water_values = [0, 19, 20, 21, 100]
+
+    def test_actuators_match_baseline(self):
+        for light in self.light_values:
+            for soil_moisture in self.soil_values:
+                for difference in self.differences:
+                    with self.subTest(light=light, soil_moisture=soil_moisture, difference=difference):
+                        self.assertEqual(self.rules.actuators(light, soil_moisture, soil_moisture - difference),
+                                         baseline_actuators(light, soil_moisture, soil_moisture - difference))
+
+    def test_plant_state_matches_baseline(self):
+        for light in self.light_values:
+            for soil_moisture in self.soil_values:
+                for water_level in self.water_values:
+                    for water_pump_state in (False, True):
+                        lamp_intensity_state = baseline_actuators(light, soil_moisture, soil_moisture)[0]
+                        with self.subTest(light=light, soil_moisture=soil_moisture, water_level=water_level, water_pump_state=water_pump_state):
+                            state, _ = self.rules.plant_state(soil_moisture, light, water_level, lamp_intensity_state, water_pump_state)
+                            self.assertEqual(state, baseline_plant_state(soil_moisture, light, water_level, lamp_intensity_state, water_pump_state))
+
+    def test_batch_matches_single_readings(self):
+        chooser = random.Random(0)
+        columns = ([chooser.choice(self.light_values) for _ in range(2000)],
+                   [chooser.choice(self.soil_values) for _ in range(2000)],
+                   [chooser.choice(self.soil_values) for _ in range(2000)],
+                   [chooser.choice(self.water_values) for _ in range(2000)])
+
+        expected = {'lamp_intensity_state': [], 'water_pump_state': [], 'plant_state_rule': []}
+        for light, soil_moisture, old_soil_moisture, water_level in zip(*columns):
+            lamp_intensity_state, water_pump_state = self.rules.actuators(light, soil_moisture, old_soil_moisture)
+            expected['lamp_intensity_state'].append(lamp_intensity_state)
+            expected['water_pump_state'].append(water_pump_state)
+            expected['plant_state_rule'].append(self.rules.plant_state_rule(soil_moisture, light, water_level, lamp_intensity_state, water_pump_state))
+
+        self.assertEqual(self.rules.evaluate_batch(*columns, vectorized=False), expected)
+        if rules.numpy_available():
+            self.assertEqual(self.rules.evaluate_batch(*columns, vectorized=True), expected)
+
+@override_settings(CACHES=TEST_CACHES)
+class ServerTestCase(TransactionTestCase):
+    '''
+    The readings are written to the partition tables, which are created on demand. SQLite can not create a table inside of
+    a transaction, so these tests do not run inside of one
+    '''
+    def setUp(self):
+        self.client = Client()
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+        #The memory of the worker refers to the rows of the previous tests
+        plants._keys.clear()
+        timeseries._series.clear()
+
+    def tearDown(self):
+        #The partitions are not managed by the migrations, so they are not emptied between the tests
+        partitions.drop_partitions_before(datetime.date(3000, 1, 1))
+
+    def add_entry(self, plant_id, soil_moisture=60, light_intensity=60, water_level=60):
+        return self.client.post('/AddEntry', data=json.dumps({'Soil Moisture': soil_moisture, 'Light Intensity': light_intensity, 'Water Level': water_level}),
+                                content_type='application/json', HTTP_PLANT_ID=plant_id)
+
+class AdmissionControlTest(ServerTestCase):
+    @override_settings(ADMISSION_CONTROL={**settings.ADMISSION_CONTROL, 'BUCKET_CAPACITY': 2, 'REFILL_RATE': 0.01})
+    def test_too_many_entries_from_a_plant(self):
+        self.assertEqual(self.add_entry('burst').status_code, 200)
+        self.assertEqual(self.add_entry('burst').status_code, 200)
+
+        response = self.add_entry('burst')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['status'], 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        #The rejected entry was never written
+        self.assertEqual(readings.reading_count('burst'), 2)
+
+        #The other plants have buckets of their own
+        self.assertEqual(self.add_entry('other').status_code, 200)
+
+    def test_bucket_refills(self):
+        with self.settings(ADMISSION_CONTROL={**settings.ADMISSION_CONTROL, 'BUCKET_CAPACITY': 2, 'REFILL_RATE': 0.5}):
+            self.assertEqual(admission.take_token('refill', now=1000), 0)
+            self.assertEqual(admission.take_token('refill', now=1000), 0)
+            self.assertEqual(admission.take_token('refill', now=1000), 2)
+            self.assertEqual(admission.take_token('refill', now=1001), 1)
+            self.assertEqual(admission.take_token('refill', now=1002), 0)
+            #The bucket never holds more than its capacity however long it has been left alone
+            self.assertEqual(admission.take_token('refill', now=5000), 0)
+            self.assertEqual(admission.take_token('refill', now=5000), 0)
+            self.assertEqual(admission.take_token('refill', now=5000), 2)
+
+    @override_settings(ADMISSION_CONTROL={**settings.ADMISSION_CONTROL, 'MAX_CONCURRENT_INGESTS': 0})
+    def test_server_busy(self):
+        response = self.add_entry('busy')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(readings.reading_count('busy'), 0)
+
+    def test_busy_server_does_not_take_tokens(self):
+        limits = {**settings.ADMISSION_CONTROL, 'BUCKET_CAPACITY': 2, 'REFILL_RATE': 0.01}
+        with self.settings(ADMISSION_CONTROL={**limits, 'MAX_CONCURRENT_INGESTS': 0}):
+            for _ in range(3):
+                self.assertEqual(self.add_entry('patient').status_code, 429)
+
+        with self.settings(ADMISSION_CONTROL=limits):
+            self.assertEqual(self.add_entry('patient').status_code, 200)
+            self.assertEqual(self.add_entry('patient').status_code, 200)
+            self.assertEqual(self.add_entry('patient').status_code, 429)
+
+    @override_settings(ADMISSION_CONTROL={**settings.ADMISSION_CONTROL, 'MAX_CONCURRENT_INGESTS': 2, 'SLOT_TIMEOUT': 60})
+    def test_slots(self):
+        first, second = admission.acquire_slot(now=1000), admission.acquire_slot(now=1000)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(admission.acquire_slot(now=1000))
+
+        admission.release_slot(first)
+        third = admission.acquire_slot(now=1000)
+        self.assertIsNotNone(third)
+        self.assertIsNone(admission.acquire_slot(now=1000))
+
+        #The slots of a worker that never released them are given back once they time out
+        self.assertIsNotNone(admission.acquire_slot(now=1061))
+
+    def test_slots_are_released(self):
+        for _ in range(3):
+            self.assertEqual(self.add_entry('released').status_code, 200)
+
+        holders = [admission.acquire_slot() for _ in range(settings.ADMISSION_CONTROL['MAX_CONCURRENT_INGESTS'])]
+        self.assertNotIn(None, holders)
+        self.assertIsNone(admission.acquire_slot())
+
+class PartitionTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        self.old_date = self.today - datetime.timedelta(days=100)
+        for reading_date in (self.old_date, self.today):
+            readings.create_reading('partitioned', reading_date, 50, 50, 50)
+
+    def drop_behind_the_worker(self, month):
+        '''
+        Drops a partition the way another process would, leaving the list of this worker as it was
+        '''
+        known_months = list(partitions.existing_months(refresh=True))
+        partitions.drop_partition(month)
+        partitions._known_months = known_months
+
+    def test_readings_are_in_their_month(self):
+        months = partitions.existing_months(refresh=True)
+        self.assertIn(partitions.month_of(self.old_date), months)
+        self.assertIn(partitions.month_of(self.today), months)
+        self.assertEqual(partitions.partition_model(partitions.month_of(self.old_date)).objects.count(), 1)
+        self.assertEqual(readings.reading_count('partitioned'), 2)
+
+        #A range only touches the partitions of its months
+        self.assertEqual(partitions.partitions_between(self.today, self.today), [partitions.partition_model(partitions.month_of(self.today))])
+
+    def test_partition_dropped_by_another_worker(self):
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual(readings.reading_count('partitioned'), 1)
+
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual([entry.reading_date for entry in readings.latest_readings('partitioned', 5)], [self.today])
+
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual(list(readings.daily_averages('partitioned', self.old_date, self.today)), [self.today])
+
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual([entry.reading_date for entry in readings.iter_readings('partitioned')], [self.today])
+
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual(readings.plant_ids(), {'partitioned'})
+
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual(len(readings.history_page('partitioned', 10)), 1)
+
+        #The count of AddEntry is taken inside of its transaction
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        self.assertEqual(self.add_entry('partitioned').status_code, 200)
+        self.assertEqual(readings.reading_count('partitioned'), 2)
+
+        self.drop_behind_the_worker(partitions.month_of(self.old_date))
+        readings.delete_readings('partitioned')
+        self.assertEqual(readings.reading_count('partitioned'), 0)
+
+    def test_partition_created_by_another_worker(self):
+        #This worker listed the tables before the partition of the current month was made
+        partitions._known_months = [partitions.month_of(self.old_date)]
+        partitions._last_refresh -= partitions.REFRESH_INTERVAL + 1
+
+        self.assertEqual(readings.reading_count('partitioned'), 2)
+        self.assertIn(partitions.month_of(self.today), partitions._known_months)
+
+    def test_drop_partitions_before(self):
+        blocks.compact(self.old_date + datetime.timedelta(days=1))
+        dropped = partitions.drop_partitions_before(self.today)
+
+        self.assertIn(partitions.month_of(self.old_date), dropped['partitions'])
+        self.assertEqual(dropped['blocks'], 1)
+        self.assertNotIn(partitions.month_of(self.old_date), partitions.existing_months())
+        self.assertEqual(readings.reading_count('partitioned'), 1)
+
+class ResponseCacheTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        for plant_id in ('p1', 'p2'):
+            self.add_entry(plant_id)
+
+    def test_cached_until_the_data_changes(self):
+        for path in ('/AppBasicData', '/StatisticalData'):
+            with self.subTest(path=path):
+                first = self.client.get(path, HTTP_PLANT_ID='p1')
+                self.assertEqual(first['X-Cache'], 'MISS')
+                second = self.client.get(path, HTTP_PLANT_ID='p1')
+                self.assertEqual(second['X-Cache'], 'HIT')
+                self.assertEqual(second.content, first.content)
+
+                self.add_entry('p1', soil_moisture=70)
+                self.assertEqual(self.client.get(path, HTTP_PLANT_ID='p1')['X-Cache'], 'MISS')
+
+    def test_not_modified(self):
+        for path in ('/AppBasicData', '/StatisticalData'):
+            with self.subTest(path=path):
+                response = self.client.get(path, HTTP_PLANT_ID='p1')
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+
+                #The ETag is checked against the DataVersion of the plant alone
+                with self.assertNumQueries(1):
+                    response = self.client.get(path, HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+                response = self.client.get(path, HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH='"other"')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_the_data(self):
+        etag = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1')['ETag']
+
+        self.add_entry('p1', soil_moisture=70)
+        response = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        self.client.post('/Override', data=json.dumps({'Lamp Intensity State': 50, 'Water Pump State': False}),
+                         content_type='application/json', HTTP_PLANT_ID='p1')
+        response = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        #The override expires without any write, which changes the ETag all the same
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(minutes=10)):
+            response = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        #So does the next day
+        etag = response['ETag']
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
+            response = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_data_versions_are_isolated(self):
+        versions = caching.data_versions(['p1', 'p2'])
+        p2_etag = self.client.get('/AppBasicData', HTTP_PLANT_ID='p2')['ETag']
+        p1_etag = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1')['ETag']
+
+        self.add_entry('p1', soil_moisture=70)
+        self.assertEqual(caching.data_version('p1'), versions['p1'] + 1)
+        self.assertEqual(caching.data_version('p2'), versions['p2'])
+
+        #The cached response of the other plant is still served, and its ETag still matches
+        response = self.client.get('/AppBasicData', HTTP_PLANT_ID='p2')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/AppBasicData', HTTP_PLANT_ID='p2', HTTP_IF_NONE_MATCH=p2_etag).status_code, 304)
+        self.assertEqual(self.client.get('/AppBasicData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=p1_etag).status_code, 200)
+
+    def test_unknown_plant_has_no_version(self):
+        self.assertIsNone(caching.data_version('nobody'))
+        self.assertEqual(self.client.get('/AppBasicData', HTTP_PLANT_ID='nobody').status_code, 400)
+        self.assertIsNone(caching.data_version('nobody'))
+
+class WarmUpTest(ServerTestCase):
+    def test_push_libraries_are_imported_lazily(self):
+        #A fresh interpreter, since the libraries may have been imported by the other tests
+        code = ('import django, sys; django.setup(); import CapstoneServer.urls; '
+                'print(sorted({"exponent_server_sdk", "requests"} & set(sys.modules)))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'CapstoneServer.settings'}).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    def test_warm_up(self):
+        #The snapshot mirrors the in memory test database, whose connections can not be closed once a test has opened them
+        with mock.patch.object(connections[settings.SNAPSHOT['DATABASE']], 'ensure_connection') as connect_to_snapshot:
+            timings = warmup.warm_up()
+
+        self.assertEqual(set(timings), {'url_configuration', 'fast_path', 'database_connections', 'caches', 'rules', 'partitions'})
+        self.assertIsNotNone(connections['default'].connection)
+        #The snapshot is left alone until it is usable
+        connect_to_snapshot.assert_not_called()
+        self.assertLessEqual(warmup.startup_time(), timezone.now())
+
+    def test_uptime_counts_from_the_start(self):
+        self.add_entry('debugPlant', soil_moisture=42)
+        response = self.client.get('/Uptime')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'Initial request: {warmup.startup_time()}', response.json()['response'])
+        self.assertIn('Soil Moisture Sensor: 42', response.json()['response'])
+
+class ProfilingTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.add_entry('profiled')
+
+    def profiling(self, **changes):
+        return self.settings(PROFILING={**settings.PROFILING, 'TOKEN': 'secret', 'SAMPLE_RATE': 0, 'DIRECTORY': self.directory.name, **changes})
+
+    def test_only_requests_with_the_token_are_profiled(self):
+        with self.profiling():
+            for headers in ({}, {'HTTP_PROFILE_TOKEN': 'wrong'}):
+                with self.subTest(headers=headers):
+                    response = self.client.get('/AppBasicData', HTTP_PLANT_ID='profiled', **headers)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(response.has_header('Profile-Id'))
+            self.assertEqual(os.listdir(self.directory.name), [])
+
+        #No token is set by default, so no header can match it
+        with self.profiling(TOKEN=None):
+            self.assertFalse(self.client.get('/AppBasicData', HTTP_PLANT_ID='profiled', HTTP_PROFILE_TOKEN='')
+                                 .has_header('Profile-Id'))
+
+    def test_profile_and_sql_trace(self):
+        with self.profiling():
+            response = self.client.get('/AppBasicData', HTTP_PLANT_ID='profiled', HTTP_PROFILE_TOKEN='secret')
+        self.assertEqual(response.status_code, 200)
+
+        profile_id = response['Profile-Id']
+        self.assertEqual(sorted(os.listdir(self.directory.name)), [f'{profile_id}.json', f'{profile_id}.prof'])
+        pstats.Stats(os.path.join(self.directory.name, f'{profile_id}.prof'))
+
+        with open(os.path.join(self.directory.name, f'{profile_id}.json')) as trace:
+            trace = json.load(trace)
+        self.assertEqual(trace['path'], '/AppBasicData')
+        self.assertEqual(trace['plant_id'], 'profiled')
+        self.assertEqual(trace['status'], 200)
+        self.assertGreater(trace['query_count'], 0)
+        self.assertEqual(trace['query_count'], len(trace['queries']))
+        for query in trace['queries']:
+            if query['sql'].startswith('SELECT'):
+                self.assertTrue(query['plan'])
+            else:
+                self.assertIsNone(query['plan'])
+
+    def test_only_the_latest_profiles_are_kept(self):
+        with self.profiling(MAX_PROFILES=2):
+            profile_ids = [self.client.get('/AppBasicData', HTTP_PLANT_ID='profiled', HTTP_PROFILE_TOKEN='secret')['Profile-Id']
+                           for _ in range(3)]
+
+            self.assertEqual(sorted(os.listdir(self.directory.name)),
+                             sorted(f'{profile_id}{extension}' for profile_id in profile_ids[1:] for extension in ('.json', '.prof')))
+
+    def test_profiles_endpoint(self):
+        with self.profiling():
+            profile_id = self.client.get('/AppBasicData', HTTP_PLANT_ID='profiled', HTTP_PROFILE_TOKEN='secret')['Profile-Id']
+
+            #The profiles are only shown to the admins
+            self.assertEqual(self.client.get('/Profiles').status_code, 302)
+
+            self.client.force_login(User.objects.create_user('admin', is_staff=True))
+            response = self.client.get('/Profiles')
+            self.assertEqual([profile['id'] for profile in response.json()['profiles']], [profile_id])
+            self.assertNotIn('queries', response.json()['profiles'][0])
+
+            response = self.client.get(f'/Profiles/{profile_id}.json')
+            self.assertEqual(json.loads(b''.join(response.streaming_content))['id'], profile_id)
+            self.assertEqual(self.client.get('/Profiles/missing.json').status_code, 404)
+            self.assertEqual(self.client.get('/Profiles/..%2Fdb.sqlite3').status_code, 404)
+
+class AddEntryPayloadTest(ServerTestCase):
+    def post(self, payload):
+        return self.client.post('/AddEntry', data=json.dumps(payload), content_type='application/json', HTTP_PLANT_ID='payload')
+
+    def test_fractional_readings_are_truncated(self):
+        self.assertEqual(self.add_entry('payload', soil_moisture=59.9, light_intensity=0.5, water_level=99.99).status_code, 200)
+        entry = readings.latest_readings('payload')[0]
+        self.assertEqual((entry.soil_moisture_reading, entry.light_intensity_reading, entry.water_level_reading), (59, 0, 99))
+
+    def test_range_of_the_sensors(self):
+        self.assertEqual(self.add_entry('payload', soil_moisture=100, light_intensity=0, water_level=100).status_code, 200)
+        self.assertEqual(self.add_entry('payload', light_intensity=100, water_level=100).status_code, 200)
+
+        for readings_sent in ({'light_intensity': -1}, {'soil_moisture': 101}, {'water_level': 1000}, {'light_intensity': 40000}):
+            with self.subTest(**readings_sent):
+                response = self.add_entry('payload', **readings_sent)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('between 0 and 100', response.json()['response'])
+        self.assertEqual(readings.reading_count('payload'), 2)
+
+    @override_settings(SENSOR_RANGE={'MINIMUM': 0, 'MAXIMUM': 100000})
+    def test_readings_that_do_not_fit_are_refused(self):
+        self.assertEqual(self.add_entry('payload', light_intensity=32767).status_code, 200)
+
+        response = self.add_entry('payload', light_intensity=32768)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too large', response.json()['response'])
+        self.assertEqual(readings.reading_count('payload'), 1)
+
+    def test_only_numbers_are_accepted(self):
+        for value in ('50', True, False, [50], {'value': 50}, float('nan'), float('inf')):
+            with self.subTest(value=value):
+                response = self.post({'Soil Moisture': 50, 'Light Intensity': value, 'Water Level': 50})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['response'], generate_error_message('The payload items must be numbers'))
+
+        self.assertEqual(self.post({'Soil Moisture': 50, 'Water Level': 50}).status_code, 400)
+        self.assertEqual(readings.reading_count('payload'), 0)
+
+class RingBufferTest(SimpleTestCase):
+    def setUp(self):
+        self.series = timeseries.PlantSeries(4)
+        self.start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        #Six readings half an hour apart, so the buffer has wrapped around
+        for index in range(6):
+            self.series.append(index + 1, self.start.date(), self.start + datetime.timedelta(minutes=30 * index), 10 * index, index, 100 - index)
+
+    def test_latest_readings(self):
+        self.assertEqual([reading.id for reading in self.series.latest(10)], [6, 5, 4, 3])
+        self.assertEqual(self.series.latest()[0].soil_moisture_reading, 50)
+        self.assertEqual(self.series.latest()[0].reading_time, self.start + datetime.timedelta(minutes=150))
+
+        #An older reading is never appended after a newer one
+        self.assertFalse(self.series.append(2, self.start.date(), self.start, 0, 0, 0))
+        self.assertEqual(self.series.size, 4)
+
+    def test_windows(self):
+        self.assertEqual(list(self.series.window('soil_moisture_reading')), [20, 30, 40, 50])
+        self.assertEqual(list(self.series.window('soil_moisture_reading', count=2)), [40, 50])
+        self.assertEqual(list(self.series.window('soil_moisture_reading', since=self.start + datetime.timedelta(minutes=90))), [30, 40, 50])
+
+    def test_stats(self):
+        stats = self.series.stats('soil_moisture_reading')
+        self.assertEqual({key: stats[key] for key in ('count', 'minimum', 'maximum', 'mean')}, {'count': 4, 'minimum': 20, 'maximum': 50, 'mean': 35})
+        #10 every half an hour
+        self.assertAlmostEqual(stats['trend'], 20)
+        self.assertAlmostEqual(self.series.stats('water_level_reading', count=3)['trend'], -2)
+
+        self.assertEqual(self.series.stats('light_intensity_reading', count=1)['trend'], 0)
+        self.assertIsNone(self.series.stats('light_intensity_reading', since=self.start + datetime.timedelta(days=1)))
+
+class SeriesStoreTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        for value in (50, 51, 52):
+            self.add_entry('series', soil_moisture=value)
+
+    def test_series_is_warmed_from_the_database(self):
+        timeseries._series.clear()
+        series = timeseries.series_for('series')
+        self.assertEqual([reading.soil_moisture_reading for reading in series.latest(5)], [52, 51, 50])
+
+    def test_readings_of_other_workers_are_caught_up(self):
+        series = timeseries.series_for('series')
+
+        #Another worker adds a reading, which only changes the data version as far as this worker knows
+        reading = readings.create_reading('series', self.today, 53, 60, 60)
+        caching.bump_data_version('series', latest_reading_id = reading.id)
+
+        self.assertIs(timeseries.series_for('series'), series)
+        self.assertEqual([reading.soil_moisture_reading for reading in series.latest(5)], [53, 52, 51, 50])
+
+    def test_removed_readings_are_warmed_again(self):
+        series = timeseries.series_for('series')
+
+        readings.delete_readings('series')
+        timeseries.reset('series')
+        #The series of another worker that has not been reset
+        timeseries._series['series'] = series
+
+        self.assertEqual(timeseries.series_for('series').latest(5), [])
+
+    def test_lookup_with_the_version(self):
+        version = caching.data_version('series')
+        timeseries.series_for('series')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(timeseries.series_for('series', version).latest()[0].soil_moisture_reading, 52)
+        with self.assertNumQueries(1):
+            timeseries.series_for('series')
+
+    def test_recent_statistics(self):
+        response = self.client.get('/RecentStatistics', HTTP_PLANT_ID='series')
+        self.assertEqual(response.status_code, 200)
+        soil_moisture = response.json()['statistics']['Soil Moisture']
+        self.assertEqual((soil_moisture['count'], soil_moisture['minimum'], soil_moisture['maximum'], soil_moisture['mean']), (3, 50, 52, 51))
+
+        response = self.client.get('/RecentStatistics', HTTP_PLANT_ID='series', HTTP_READINGS='2', HTTP_MINUTES='60')
+        self.assertEqual(response.json()['statistics']['Soil Moisture']['mean'], 51.5)
+
+        response = self.client.get('/RecentStatistics', HTTP_PLANT_ID='nobody')
+        self.assertEqual(response.json()['statistics'], {'Soil Moisture': None, 'Light Intensity': None, 'Water Level': None})
+
+        for headers in ({'HTTP_READINGS': '0'}, {'HTTP_READINGS': 'many'}, {'HTTP_MINUTES': '-5'}, {'HTTP_MINUTES': 'nan'}):
+            with self.subTest(headers=headers):
+                self.assertEqual(self.client.get('/RecentStatistics', HTTP_PLANT_ID='series', **headers).status_code, 400)
+        self.assertEqual(self.client.get('/RecentStatistics').status_code, 400)
+
+
+class ForecastTest(SimpleTestCase):
+    def test_decayed_regression_matches_least_squares(self):
+        chooser = random.Random(2)
+        hours = [0.0]
+        for _ in range(60):
+            hours.append(hours[-1] + chooser.uniform(0.1, 6))
+        values = {column: [80 - 0.4 * hour + chooser.uniform(-3, 3) for hour in hours] for column in forecast.COLUMNS}
+
+        statistics = forecast.empty_statistics()
+        previous_hour = hours[0]
+        for index, hour in enumerate(hours):
+            statistics = forecast.add_reading(statistics, hour - previous_hour, {column: values[column][index] for column in forecast.COLUMNS})
+            previous_hour = hour
+
+        #The direct weighted least squares fit, with the times relative to the latest reading
+        times = [hour - hours[-1] for hour in hours]
+        weights = [0.5 ** (-time / settings.FORECAST['HALF_LIFE']) for time in times]
+        total = sum(weights)
+        mean_time = sum(weight * time for weight, time in zip(weights, times)) / total
+
+        for column in forecast.COLUMNS:
+            with self.subTest(column=column):
+                mean = sum(weight * value for weight, value in zip(weights, values[column])) / total
+                trend = (sum(weight * (time - mean_time) * (value - mean) for weight, time, value in zip(weights, times, values[column]))
+                         / sum(weight * (time - mean_time) ** 2 for weight, time in zip(weights, times)))
+                deviation = (sum(weight * (value - mean) ** 2 for weight, value in zip(weights, values[column])) / total) ** 0.5
+
+                fit = forecast.regression(statistics, column)
+                self.assertAlmostEqual(fit['trend'], trend, places=6)
+                self.assertAlmostEqual(fit['level'], mean - trend * mean_time, places=6)
+                self.assertAlmostEqual(fit['mean'], mean, places=6)
+                self.assertAlmostEqual(fit['deviation'], deviation, places=6)
+
+    def test_not_enough_data(self):
+        statistics = forecast.add_reading(forecast.empty_statistics(), 0, {column: 50 for column in forecast.COLUMNS})
+        self.assertIsNone(forecast.regression(statistics, forecast.COLUMNS[0]))
+
+class PlantForecastTest(ServerTestCase):
+    def record(self, hours, water_level):
+        reading = readings.create_reading('forecast', self.start.date(), 50, 50, water_level)
+        forecast.record_reading('forecast', reading, self.start + datetime.timedelta(hours=hours))
+
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now() - datetime.timedelta(hours=12)
+
+    def test_depletion_forecast(self):
+        #The tank loses 2 percent an hour
+        for hour in range(6):
+            self.record(hour, 80 - 2 * hour)
+
+        result = forecast.plant_forecast('forecast', 20)
+        self.assertAlmostEqual(result['water_level_trend'], -2)
+        self.assertEqual(result['soil_moisture_trend'], 0)
+        self.assertAlmostEqual(result['hours_until_water_low'], 25)
+        self.assertEqual(result['water_low_time'], self.start + datetime.timedelta(hours=30))
+
+    def test_no_forecast(self):
+        self.assertIsNone(forecast.plant_forecast('forecast', 20)['water_level_trend'])
+
+        #A tank that is being refilled never runs out, and one that is already low has run out
+        for hour in range(6):
+            self.record(hour, 40 + hour)
+        self.assertIsNone(forecast.plant_forecast('forecast', 20)['hours_until_water_low'])
+        self.assertEqual(forecast.plant_forecast('forecast', 50)['hours_until_water_low'], 0)
+
+    def test_not_enough_readings(self):
+        for hour in range(2):
+            self.record(hour, 80 - 2 * hour)
+        self.assertIsNone(forecast.plant_forecast('forecast', 20)['water_level_trend'])
+
+    def test_app_basic_data_reports_the_forecast(self):
+        for hour in range(6):
+            self.record(hour, 80 - 2 * hour)
+
+        response = self.client.get('/AppBasicData', HTTP_PLANT_ID='forecast').json()
+        self.assertAlmostEqual(response['forecast']['water_level_trend'], -2)
+        self.assertAlmostEqual(response['forecast']['hours_until_water_low'], 25)
+        self.assertIn('in about 1.0 days', response['reports'][0]['description'])
+
+class FleetGeneratorTest(ServerTestCase):
+    def generate(self, **options):
+        output = io.StringIO()
+        call_command('generate_fleet', **{'plants': 3, 'days': 2, 'interval': 60, 'seed': 'test', 'prefix': 'generated',
+                                          'end_date': timezone.now().date() - datetime.timedelta(days=1), 'stdout': output, **options})
+        return output.getvalue()
+
+    def history(self):
+        #The ids of the readings are given by the database, so only the values are compared
+        return {plant_id: [entry[2:] for entry in readings.iter_readings(plant_id)] for plant_id in sorted(readings.plant_ids())}
+
+    def test_generated_fleet(self):
+        self.assertIn('3 plants generated with 144 readings', self.generate())
+
+        plant_ids = [generate_fleet.plant_name('generated', index) for index in range(3)]
+        self.assertEqual(readings.plant_ids(), set(plant_ids))
+        for plant_id in plant_ids:
+            self.assertEqual(readings.reading_count(plant_id), 48)
+            self.assertTrue(all(0 <= value <= 100 for entry in readings.iter_readings(plant_id) for value in entry[3:]))
+
+        #The generated plants are served like the plants of real devices
+        self.assertEqual(PlantDecision.objects.filter(plant_id__in = plant_ids).count(), 3)
+        self.assertEqual(PlantForecast.objects.filter(plant_id__in = plant_ids).count(), 3)
+        response = self.client.get('/AppBasicData', HTTP_PLANT_ID=plant_ids[0])
+        self.assertEqual(response.status_code, 200)
+
+    def test_same_arguments_generate_the_same_data(self):
+        self.generate()
+        history = self.history()
+        self.generate(clear=True)
+        self.assertEqual(self.history(), history)
+
+        self.generate(clear=True, seed='other')
+        self.assertNotEqual(self.history(), history)
+
+    def test_growing_a_fleet(self):
+        self.generate()
+        self.generate(first_plant=3, plants=2)
+        self.assertEqual(len(readings.plant_ids()), 5)
+
+    def test_bad_arguments(self):
+        for options in ({'plants': 0}, {'days': 0}, {'interval': -5}):
+            with self.subTest(**options):
+                with self.assertRaises(CommandError):
+                    self.generate(**options)
+
+class BenchmarkHelpersTest(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(benchmark.percentile(values, 0.5), 51)
+        self.assertEqual(benchmark.percentile(values, 0.99), 100)
+        self.assertEqual(benchmark.percentile([7], 0.99), 7)
+
+class LiveFeedTest(ServerTestCase):
+    TOKEN = 'ExponentPushToken[live]'
+
+    def setUp(self):
+        super().setUp()
+        self.add_entry('live')
+        self.add_entry('other')
+        TokenPlantIDBind(plant_id = plants.plant_key('live'), tokens = ','.join(['ExponentPushToken[phone]', self.TOKEN])).save()
+
+    def tearDown(self):
+        live._publications.join()
+        super().tearDown()
+
+    def connect(self, session, headers):
+        '''
+        Runs the live feed application over a pair of queues and gives them to session, a coroutine function
+        '''
+        async def run():
+            incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+            await incoming.put({'type': 'websocket.connect'})
+            application = asyncio.ensure_future(live.websocket_application({'type': 'websocket', 'path': '/Live', 'headers': headers},
+                                                                            incoming.get, outgoing.put))
+            self.assertEqual((await outgoing.get())['type'], 'websocket.accept')
+
+            async def receive():
+                return json.loads((await asyncio.wait_for(outgoing.get(), 10))['text'])
+
+            async def send(message):
+                await incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+            try:
+                await session(receive, send)
+            finally:
+                await incoming.put({'type': 'websocket.disconnect'})
+                await asyncio.wait_for(application, 10)
+
+        asyncio.run(run())
+
+    def test_snapshot_and_updates(self):
+        async def session(receive, send):
+            #The replies are sent before the snapshots
+            self.assertEqual(await receive(), {'type': 'subscribed', 'plant_ids': ['live']})
+            snapshot = await receive()
+            self.assertEqual((snapshot['type'], snapshot['plant_id']), ('snapshot', 'live'))
+            self.assertEqual(snapshot['data']['sensor_readings']['Soil Moisture'], 60)
+
+            await sync_to_async(self.add_entry)('live', soil_moisture=70)
+            update = await receive()
+            self.assertEqual((update['type'], update['plant_id']), ('update', 'live'))
+            self.assertEqual(update['version'], await sync_to_async(caching.data_version)('live'))
+            self.assertEqual(update['changes']['sensor_readings']['Soil Moisture'], 70)
+
+            await send({'unsubscribe': ['live']})
+            self.assertEqual(await receive(), {'type': 'subscribed', 'plant_ids': []})
+            self.assertEqual(live.publish('live', 0, {}), 0)
+
+        self.connect(session, [(b'plant-id', b'live'), (b'token', self.TOKEN.encode())])
+
+    def test_subscriptions_need_a_bound_token(self):
+        async def session(receive, send):
+            error = await receive()
+            self.assertEqual(error['type'], 'error')
+            self.assertIn('live', error['response'])
+            self.assertEqual(await receive(), {'type': 'subscribed', 'plant_ids': []})
+
+            #The token is only bound to one of the plants
+            await send({'subscribe': ['live', 'other'], 'token': self.TOKEN})
+            self.assertIn('other', (await receive())['response'])
+            self.assertEqual(await receive(), {'type': 'subscribed', 'plant_ids': ['live']})
+            self.assertEqual((await receive())['type'], 'snapshot')
+
+        self.connect(session, [(b'plant-id', b'live')])
+        self.assertEqual(live.authorized_plants(['live', 'other', 'unknown'], self.TOKEN), {'live'})
+        self.assertEqual(live.authorized_plants(['live'], 'ExponentPushToken[other]'), set())
+
+    def test_publishing_does_not_query_on_the_request_thread(self):
+        class RecordingSubscription(live.Subscription):
+            def offer(self, plant_id, version, changes):
+                offers.append((plant_id, version, changes))
+
+        offers = []
+        subscription = RecordingSubscription(None)
+        live.subscribe(subscription, 'live')
+        try:
+            decision = PlantDecision.objects.get(plant_id = 'live')
+            with self.assertNumQueries(0):
+                self.assertEqual(live.publish('live', 7, lambda: live.reading_changes('live', decision)), 1)
+            live._publications.join()
+        finally:
+            live.unsubscribe(subscription, 'live')
+
+        self.assertEqual(len(offers), 1)
+        self.assertEqual(offers[0][:2], ('live', 7))
+        self.assertEqual(offers[0][2]['sensor_readings']['Soil Moisture'], 60)
+        self.assertEqual(offers[0][2]['plant_state'], live.decision_changes(decision)['plant_state'])
+
+    def test_merging_of_pending_updates(self):
+        subscription = live.Subscription(None)
+        subscription.plant_ids.add('live')
+        subscription._merge('live', 1, {'override': True})
+        subscription._merge('live', 2, {'actuators': {'Water Pump State': True}})
+        subscription._merge('unsubscribed', 3, {'override': True})
+
+        self.assertEqual(subscription.next_messages(), [{'type': 'update', 'plant_id': 'live', 'version': 2,
+                                                         'changes': {'override': True, 'actuators': {'Water Pump State': True}}}])
+        self.assertEqual(subscription.versions, {'live': 2})
+
+class SweeperTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        for plant_id in ('healthy', 'thirsty', 'dry', 'offline'):
+            self.add_entry(plant_id)
+        self.now = PlantDecision.objects.get(plant_id = 'healthy').reading_time + datetime.timedelta(minutes=1)
+
+        #AddEntry sends its own notifications for low readings, so the readings are changed behind its back
+        PlantDecision.objects.filter(plant_id = 'thirsty').update(water_level_reading = 5)
+        PlantDecision.objects.filter(plant_id = 'dry').update(soil_moisture_reading = 10, water_level_reading = 10)
+        PlantDecision.objects.filter(plant_id = 'offline').update(reading_time = self.now - datetime.timedelta(minutes=settings.ALERTS['STALE_MINUTES'] + 1),
+                                                                  water_level_reading = 0)
+
+        pushing = mock.patch.object(sweeper, 'push', side_effect=lambda messages: len(messages))
+        self.push = pushing.start()
+        self.addCleanup(pushing.stop)
+
+    def notifications(self) -> list:
+        return sorted(NotificationSent.objects.values_list('plant__plant_id', 'reason'))
+
+    def test_alerts_of_the_fleet(self):
+        alerts = sorted((plant_id, alert[0]) for plant_id, alert, _, _ in sweeper.find_alerts(self.now))
+        #An offline plant only gets the offline alert since its readings are out of date
+        self.assertEqual(alerts, [('dry', 'Soil Moisture'), ('dry', 'Water Level'), ('offline', 'Sensor Offline'), ('thirsty', 'Water Level')])
+
+        counts = sweeper.sweep(self.now)
+        self.assertEqual(counts, {'alerts': 4, 'notifications': 4, 'reasons': {'Soil Moisture': 1, 'Water Level': 2, 'Sensor Offline': 1}, 'pushed': 0})
+        self.assertEqual(self.notifications(), alerts)
+
+    def test_alerts_are_not_repeated(self):
+        sweeper.sweep(self.now)
+        self.assertEqual(sweeper.sweep(self.now + datetime.timedelta(minutes=1))['notifications'], 0)
+
+        #The low readings are notified again after the wait time, an offline plant only once until it reports again
+        later = self.now + datetime.timedelta(minutes=settings.ALERTS['WAIT_TIME'] + 1)
+        self.assertEqual(sweeper.sweep(later)['reasons'], {'Soil Moisture': 1, 'Water Level': 2})
+
+        PlantDecision.objects.filter(plant_id = 'offline').update(reading_time = later, water_level_reading = 60)
+        much_later = later + datetime.timedelta(minutes=settings.ALERTS['STALE_MINUTES'] + 1)
+        self.assertEqual(sweeper.sweep(much_later)['reasons']['Sensor Offline'], 4)
+
+    def test_notifications_are_pushed_to_the_bound_tokens(self):
+        TokenPlantIDBind(plant_id = plants.plant_key('thirsty'), tokens = 'ExponentPushToken[a],ExponentPushToken[b]').save()
+
+        self.assertEqual(sweeper.sweep(self.now)['pushed'], 2)
+        messages = self.push.call_args[0][0]
+        self.assertEqual({token for token, _, _ in messages}, {'ExponentPushToken[a]', 'ExponentPushToken[b]'})
+        self.assertTrue(all(title == sweeper.WATER_LEVEL[1] and '5' in message for _, title, message in messages))
+
+    def test_dry_run(self):
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            output = io.StringIO()
+            call_command('sweep_alerts', dry_run=True, stdout=output)
+
+        self.assertIn('4 alerts found, 4 notifications to send (1 Sensor Offline, 1 Soil Moisture, 2 Water Level)', output.getvalue())
+        self.assertEqual(self.notifications(), [])
+        self.push.assert_not_called()
+
+class ReadingHistoryTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        #A few readings a day over two months, so the history spans more than one partition
+        self.expected = []
+        for days_ago in range(0, 45, 3):
+            reading_date = self.today - datetime.timedelta(days=days_ago)
+            for value in range(days_ago % 4 + 1):
+                reading = readings.create_reading('history', reading_date, value, value, value)
+                self.expected.append((reading.reading_date.isoformat(), reading.id))
+
+        self.expected.sort(reverse=True)
+
+    def pages(self, page_size):
+        pages, cursor = [], None
+        while True:
+            headers = {'HTTP_PLANT_ID': 'history', 'HTTP_PAGE_SIZE': str(page_size)}
+            if cursor != None:
+                headers['HTTP_CURSOR'] = cursor
+
+            response = self.client.get('/ReadingHistory', **headers)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()['readings'])
+
+            cursor = response.json()['next_cursor']
+            if cursor == None:
+                return pages
+
+    def read_all(self, page_size):
+        rows = []
+        for page in self.pages(page_size):
+            rows += [(reading['reading_date'], reading['Soil Moisture']) for reading in page]
+        return rows
+
+    def test_pages_cover_the_history_once(self):
+        expected_count = len(self.expected)
+        for page_size in (1, 7, expected_count - 1, expected_count, expected_count + 1, 500):
+            with self.subTest(page_size=page_size):
+                pages = self.pages(page_size)
+                self.assertEqual(sum(len(page) for page in pages), expected_count)
+                self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+                #The last page is never empty, even when the page size divides the history
+                self.assertGreater(len(pages[-1]), 0)
+                dates = [reading['reading_date'] for page in pages for reading in page]
+                self.assertEqual(dates, [reading_date for reading_date, _ in self.expected])
+
+    def test_cursor_edges(self):
+        newest_date, newest_id = self.expected[0]
+        oldest_date, oldest_id = self.expected[-1]
+
+        #A cursor at the oldest reading is followed by nothing
+        response = self.client.get('/ReadingHistory', HTTP_PLANT_ID='history', HTTP_CURSOR=f'{oldest_date}.{oldest_id}')
+        self.assertEqual(response.json()['readings'], [])
+        self.assertIsNone(response.json()['next_cursor'])
+
+        #A cursor at the newest reading is followed by every other reading
+        response = self.client.get('/ReadingHistory', HTTP_PLANT_ID='history', HTTP_CURSOR=f'{newest_date}.{newest_id}', HTTP_PAGE_SIZE='500')
+        self.assertEqual(len(response.json()['readings']), len(self.expected) - 1)
+
+        response = self.client.get('/ReadingHistory', HTTP_PLANT_ID='nobody')
+        self.assertEqual(response.json()['readings'], [])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_bad_cursor(self):
+        for cursor in ('garbage', '2026-01-01', '2026-13-01.5', '2026-01-01.x', '.'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/ReadingHistory', HTTP_PLANT_ID='history', HTTP_CURSOR=cursor)
+                self.assertEqual(response.status_code, 400)
+
+        for page_size in ('0', '501', 'many'):
+            with self.subTest(page_size=page_size):
+                response = self.client.get('/ReadingHistory', HTTP_PLANT_ID='history', HTTP_PAGE_SIZE=page_size)
+                self.assertEqual(response.status_code, 400)
+
+    def test_pages_after_compaction(self):
+        before = self.read_all(7)
+        counts = blocks.compact(self.today - datetime.timedelta(days=20))
+        self.assertGreater(counts['blocks'], 0)
+
+        self.assertEqual(self.read_all(7), before)
+        self.assertEqual(self.read_all(500), before)
+
+class BlockEncodingTest(SimpleTestCase):
+    def test_round_trip(self):
+        chooser = random.Random(1)
+        #Gaps between the ids, and readings going down as well as up (negative deltas), below 0 and above 100
+        ids = sorted(chooser.sample(range(1, 10 ** 7), 300))
+        columns = [[chooser.randint(-50, 150) for _ in ids] for _ in range(len(blocks.COLUMNS))]
+
+        self.assertEqual(blocks.decode_block(blocks.encode_block(ids, columns)), (ids, *columns))
+
+    def test_round_trip_edges(self):
+        for ids, columns in (
+            ([], [[], [], []]),
+            ([7], [[0], [-1], [100]]),
+            ([1, 2, 10 ** 9], [[100, 0, 100], [0, -32768, 32767], [50, 49, 51]]),
+        ):
+            with self.subTest(ids=ids):
+                self.assertEqual(blocks.decode_block(blocks.encode_block(ids, columns)), (ids, *columns))
+
+class CompactionTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        for days_ago in (40, 40, 39, 2):
+            readings.create_reading('compacted', self.today - datetime.timedelta(days=days_ago), days_ago, 50, 60)
+        readings.create_reading('other', self.today - datetime.timedelta(days=40), 10, 20, 30)
+
+    def test_compacted_readings_are_still_read(self):
+        before = list(readings.iter_readings('compacted'))
+        averages = readings.daily_averages('compacted', self.today - datetime.timedelta(days=45), self.today)
+
+        counts = blocks.compact(self.today - datetime.timedelta(days=30))
+        self.assertEqual(counts, {'readings': 4, 'blocks': 3})
+        self.assertEqual(list(readings.iter_readings('compacted')), before)
+        self.assertEqual(readings.daily_averages('compacted', self.today - datetime.timedelta(days=45), self.today), averages)
+        self.assertEqual(readings.reading_count('compacted'), 4)
+        self.assertEqual(readings.plant_ids(), {'compacted', 'other'})
+
+    def test_blocks_are_merged_with_late_readings(self):
+        blocks.compact(self.today - datetime.timedelta(days=30))
+        readings.create_reading('compacted', self.today - datetime.timedelta(days=40), 1, 2, 3)
+
+        self.assertEqual(blocks.compact(self.today - datetime.timedelta(days=30)), {'readings': 1, 'blocks': 1})
+        self.assertEqual(readings.reading_count('compacted'), 5)
+        self.assertEqual([entry.soil_moisture_reading for entry in readings.iter_readings('compacted')], [40, 40, 1, 39, 2])
+
+    def test_deleting_the_readings_deletes_the_blocks(self):
+        blocks.compact(self.today - datetime.timedelta(days=30))
+        readings.delete_readings('compacted')
+
+        self.assertEqual(readings.reading_count('compacted'), 0)
+        self.assertEqual(readings.reading_count('other'), 1)
+        self.assertEqual(blocks.drop_blocks_before(self.today + datetime.timedelta(days=40)), 1)
+        self.assertEqual(readings.reading_count('other'), 0)
+
+class LoggingTest(SimpleTestCase):
+    def record(self, message='Reading received', level=logging.DEBUG, **extra):
+        record = logging.LogRecord('smart_plant_api.views', level, __file__, 1, message, None, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_lines(self):
+        line = logs.JsonFormatter().format(self.record(plant_id='p1', soil_moisture=40, reading_date=datetime.date(2026, 1, 2)))
+        data = json.loads(line)
+
+        self.assertEqual({key: data[key] for key in ('level', 'logger', 'message', 'plant_id', 'soil_moisture', 'reading_date')},
+                         {'level': 'DEBUG', 'logger': 'smart_plant_api.views', 'message': 'Reading received', 'plant_id': 'p1',
+                          'soil_moisture': 40, 'reading_date': '2026-01-02'})
+        self.assertRegex(data['time'], r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$')
+        self.assertNotIn('\n', line)
+
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            record = self.record(level=logging.ERROR, exc_info=sys.exc_info())
+        self.assertIn('ValueError: broken', json.loads(logs.JsonFormatter().format(record))['exception'])
+
+    def test_sampling_of_debug_records(self):
+        sampler = logs.SampleFilter(rate=3)
+        self.assertEqual(sum(sampler.filter(self.record()) for _ in range(9)), 3)
+        #Every event is sampled on its own, and the other levels are never sampled
+        self.assertTrue(sampler.filter(self.record('Actuators polled')))
+        self.assertTrue(all(sampler.filter(self.record(level=logging.INFO)) for _ in range(5)))
+        self.assertTrue(all(logs.SampleFilter(rate=1).filter(self.record()) for _ in range(5)))
+
+    def test_background_writing(self):
+        stream = io.StringIO()
+        handler = logs.BackgroundHandler(stream)
+        handler.handle(self.record('Reading %s', plant_id='p1'))
+        handler.restart()
+        handler.handle(self.record('Actuators polled'))
+        handler.close()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['message'] for line in lines], ['Reading %s', 'Actuators polled'])
+        self.assertEqual(lines[0]['plant_id'], 'p1')
+
+    def test_full_queue_drops_records(self):
+        stream = io.StringIO()
+        handler = logs.BackgroundHandler(stream, max_size=2)
+        #Nothing takes the records off the queue while the thread is stopped
+        handler.stop()
+        for index in range(5):
+            handler.handle(self.record(f'Event {index}'))
+        self.assertEqual(handler.dropped, 3)
+
+        handler.start()
+        handler.queue.join()
+        handler.handle(self.record('Event 5'))
+        handler.close()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['message'] for line in lines], ['Event 0', 'Event 1', 'Event 5'])
+        #The number of dropped records is added to the next record that gets through
+        self.assertEqual(lines[-1]['dropped'], 3)
+        self.assertEqual(handler.dropped, 0)
+
+class FastPathTest(ServerTestCase):
+    READING = json.dumps({'Soil Moisture': 55, 'Light Intensity': 60, 'Water Level': 70})
+
+    def call_wsgi(self, request, application=None):
+        started = []
+        wsgi = fastpath.FastPathWSGI(application or mock.Mock(side_effect=AssertionError('The request went through Django')))
+        response = wsgi(request.environ, lambda status, headers: started.append((status, dict(headers))))
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        return started[0][0], started[0][1], content
+
+    def call_asgi(self, path, body=b'', plant_id='fast', application=None):
+        sent = []
+
+        async def run():
+            bodies = [{'type': 'http.request', 'body': body[:5], 'more_body': True}, {'type': 'http.request', 'body': body[5:]}]
+            async def receive():
+                return bodies.pop(0)
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'POST' if body else 'GET', 'path': path, 'query_string': b'', 'root_path': '',
+                     'headers': [(b'host', b'testserver'), (b'plant-id', plant_id.encode()), (b'content-type', b'application/json')]}
+            await fastpath.FastPathASGI(application)(scope, receive, send)
+
+        asyncio.run(run())
+        return sent
+
+    def test_device_routes_skip_django(self):
+        status, headers, content = self.call_wsgi(RequestFactory().post('/AddEntry', data=self.READING, content_type='application/json', HTTP_PLANT_ID='fast'))
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(readings.latest_readings('fast')[0].soil_moisture_reading, 55)
+
+        #The same view answers through the fast path and through Django
+        status, _, content = self.call_wsgi(RequestFactory().get('/ActuatorData', HTTP_PLANT_ID='fast'))
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(json.loads(content), self.client.get('/ActuatorData', HTTP_PLANT_ID='fast').json())
+
+    def test_other_routes_fall_back_to_django(self):
+        django_application = mock.Mock(return_value=[b'django'])
+        request = RequestFactory().get('/AppBasicData', HTTP_PLANT_ID='fast')
+
+        response = fastpath.FastPathWSGI(django_application)(request.environ, mock.Mock())
+        self.assertEqual(response, [b'django'])
+        django_application.assert_called_once()
+
+        async def application(scope, receive, send):
+            await send({'type': 'django', 'path': scope['path']})
+        self.assertEqual(self.call_asgi('/AppBasicData', application=application), [{'type': 'django', 'path': '/AppBasicData'}])
+
+    def test_errors_are_answered_like_django(self):
+        status, _, _ = self.call_wsgi(RequestFactory().get('/ActuatorData', HTTP_PLANT_ID='fast', HTTP_HOST='somewhere.else'))
+        self.assertEqual(status, '400 Bad Request')
+
+        with mock.patch.dict(fastpath.routes(), {'/ActuatorData': mock.Mock(side_effect=RuntimeError('broken'))}):
+            with self.assertLogs('django.request', logging.ERROR):
+                status, _, _ = self.call_wsgi(RequestFactory().get('/ActuatorData', HTTP_PLANT_ID='fast'))
+        self.assertEqual(status, '500 Internal Server Error')
+
+    def test_asgi_device_routes(self):
+        start, body = self.call_asgi('/AddEntry', self.READING.encode())
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'Content-Type', b'application/json'), start['headers'])
+        self.assertEqual(readings.latest_readings('fast')[0].water_level_reading, 70)
+
+        start, body = self.call_asgi('/ActuatorData')
+        self.assertEqual(json.loads(body['body']), self.client.get('/ActuatorData', HTTP_PLANT_ID='fast').json())
+
+class PlantRegistryTest(ServerTestCase):
+    def test_keys(self):
+        self.assertIsNone(plants.plant_key('registered'))
+        key = plants.plant_key('registered', create=True)
+        self.assertEqual(Plant.objects.get(id = key).plant_id, 'registered')
+
+        #The key is remembered by the worker
+        with self.assertNumQueries(0):
+            self.assertEqual(plants.plant_key('registered'), key)
+        plants.reset()
+        self.assertEqual(plants.plant_key('registered', create=True), key)
+
+        keys = plants.plant_keys(['registered', 'new'], create=True)
+        self.assertEqual(keys['registered'], key)
+        self.assertEqual(plants.plant_keys(['new', 'unknown']), {'new': keys['new']})
+        self.assertEqual(plants.plant_ids_of(keys.values()), {value: name for name, value in keys.items()})
+
+    def test_plant_added_by_another_worker(self):
+        other_key = Plant.objects.create(plant_id = 'raced').id
+        #The lookup misses the plant that another worker adds right after
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            self.assertEqual(plants.plant_key('raced', create=True), other_key)
+
+    def test_readings_are_stored_by_key(self):
+        self.add_entry('keyed')
+        key = plants.plant_key('keyed')
+        model = partitions.partition_model(partitions.month_of(timezone.now().date()))
+        self.assertEqual(list(model.objects.values_list('plant_id', flat=True)), [key])
+
+class PlantKeyMigrationTest(ServerTestCase):
+    BEFORE = [('smart_plant_api', '0012_readingblock')]
+
+    def setUp(self):
+        super().setUp()
+        today = timezone.now().date()
+        #Two partitions with readings of two plants
+        for plant_id, soil_moisture in (('first', 40), ('second', 50)):
+            for days_ago in (0, 40):
+                readings.create_reading(plant_id, today - datetime.timedelta(days=days_ago), soil_moisture, 60, 70)
+        self.months = sorted(partitions.existing_months(refresh=True))
+        self.history = {plant_id: list(readings.iter_readings(plant_id)) for plant_id in ('first', 'second')}
+
+    def tearDown(self):
+        #Every other test runs on the latest schema
+        executor = MigrationExecutor(connections['default'])
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        plants.reset()
+        super().tearDown()
+
+    def partition_plant_ids(self) -> set:
+        with connections['default'].cursor() as cursor:
+            plant_ids = set()
+            for month in self.months:
+                cursor.execute(f'SELECT DISTINCT plant_id FROM {partitions.TABLE_PREFIX}{month}')
+                plant_ids.update(plant_id for plant_id, in cursor.fetchall())
+        return plant_ids
+
+    def test_partitions_are_keyed_and_unkeyed(self):
+        executor = MigrationExecutor(connections['default'])
+        executor.migrate(self.BEFORE)
+        self.assertEqual(self.partition_plant_ids(), {'first', 'second'})
+
+        executor = MigrationExecutor(connections['default'])
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        plants.reset()
+        keys = plants.plant_keys(['first', 'second'])
+        self.assertEqual(self.partition_plant_ids(), set(keys.values()))
+        #The readings keep their ids
+        self.assertEqual({plant_id: list(readings.iter_readings(plant_id)) for plant_id in keys}, self.history)
+
+class FleetRecomputeTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_entry('recomputed')
+        self.add_entry('unchanged')
+
+    def test_changed_decisions_bump_their_versions(self):
+        #A decision made with thresholds that have changed since
+        PlantDecision.objects.filter(plant_id = 'recomputed').update(lamp_intensity_state = 0, plant_state_rule = -1)
+        versions = caching.data_versions(['recomputed', 'unchanged'])
+        etag = self.client.get('/AppBasicData', HTTP_PLANT_ID='recomputed')['ETag']
+
+        offers = []
+        subscription = live.Subscription(None)
+        subscription.offer = lambda plant_id, version, changes: offers.append((plant_id, version, changes))
+        live.subscribe(subscription, 'recomputed')
+        try:
+            self.assertEqual(rules.recompute_fleet(), 1)
+            live._publications.join()
+        finally:
+            live.unsubscribe(subscription, 'recomputed')
+
+        self.assertEqual(caching.data_versions(['recomputed', 'unchanged']), {'recomputed': versions['recomputed'] + 1, 'unchanged': versions['unchanged']})
+        response = self.client.get('/AppBasicData', HTTP_PLANT_ID='recomputed', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.assertEqual([offer[:2] for offer in offers], [('recomputed', versions['recomputed'] + 1)])
+        self.assertNotEqual(offers[0][2]['actuators']['Lamp Intensity State'], 0)
+
+    def test_backfilled_decisions_bump_their_versions(self):
+        readings.create_reading('backfilled', timezone.now().date(), 60, 60, 60)
+        version = caching.data_version('backfilled')
+        etag = self.client.get('/AppBasicData', HTTP_PLANT_ID='backfilled')['ETag']
+
+        output = io.StringIO()
+        call_command('recompute_decisions', stdout=output)
+        self.assertIn('1 decisions created, 0 decisions changed', output.getvalue())
+        self.assertTrue(PlantDecision.objects.filter(plant_id = 'backfilled').exists())
+        self.assertEqual(caching.data_version('backfilled'), version + 1)
+        self.assertEqual(self.client.get('/AppBasicData', HTTP_PLANT_ID='backfilled', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bumping_many_versions(self):
+        versions = caching.data_versions(['recomputed', 'unchanged'])
+        plants.plant_key('registered', create=True)
+
+        #One update for all of the versions
+        with self.assertNumQueries(4):
+            bumped = caching.bump_data_versions(['recomputed', 'unchanged', 'unknown'])
+        self.assertEqual(bumped, {plant_id: version + 1 for plant_id, version in versions.items()})
+        #A registered plant without a version gets one
+        self.assertEqual(set(caching.bump_data_versions(['registered', 'unknown'])), {'registered'})
+
+class RebuildTest(ServerTestCase):
+    #The slices cover every key up to the last one, so the keys start from 1
+    reset_sequences = True
+
+    def setUp(self):
+        super().setUp()
+        for plant_id in ('first', 'second', 'third'):
+            for soil_moisture in (70, 60, 50):
+                self.add_entry(plant_id, soil_moisture=soil_moisture)
+        self.keys = plants.plant_keys(['first', 'second', 'third'])
+        self.decisions = {decision.plant_id: decision for decision in PlantDecision.objects.all()}
+
+    def rebuild(self, **options):
+        output = io.StringIO()
+        #The worker processes could not see the in memory test database, so the workers are threads here
+        with mock.patch.object(rebuild_derived, 'ProcessPoolExecutor', ThreadPoolExecutor):
+            call_command('rebuild_derived', **{'workers': 1, 'slice_size': 1, 'stdout': output, **options})
+        return output.getvalue()
+
+    def test_rebuilt_data_matches_ingest(self):
+        versions = caching.data_versions(self.keys)
+        PlantDecision.objects.update(lamp_intensity_state = 0, old_soil_moisture_reading = 0)
+        PlantForecast.objects.update(statistics = json.dumps(forecast.empty_statistics()))
+
+        self.assertEqual(rebuild.rebuild_slice(min(self.keys.values()), max(self.keys.values())), {'plants': 3, 'readings': 9, 'skipped': 0})
+        for decision in PlantDecision.objects.all():
+            expected = self.decisions[decision.plant_id]
+            self.assertEqual((decision.lamp_intensity_state, decision.old_soil_moisture_reading), (expected.lamp_intensity_state, 60))
+            #The time recorded by AddEntry is kept rather than replaced by midnight
+            self.assertEqual(decision.reading_time, expected.reading_time)
+            self.assertEqual(PlantForecast.objects.get(plant_id = decision.plant_id).updated_at, expected.reading_time)
+
+        self.assertEqual(caching.data_versions(self.keys), {plant_id: version + 1 for plant_id, version in versions.items()})
+
+    def test_plants_changed_during_the_rebuild_are_skipped(self):
+        rebuild_plant = rebuild.rebuild_plant
+        def rebuild_during_a_reading(plant_id, *arguments):
+            result = rebuild_plant(plant_id, *arguments)
+            if plant_id == 'second':
+                self.add_entry('second', soil_moisture=40)
+            return result
+
+        with mock.patch.object(rebuild, 'rebuild_plant', side_effect=rebuild_during_a_reading):
+            counts = rebuild.rebuild_slice(min(self.keys.values()), max(self.keys.values()))
+
+        self.assertEqual(counts, {'plants': 2, 'readings': 6, 'skipped': 1})
+        #The decision made by AddEntry is not replaced by one that misses its reading
+        self.assertEqual(PlantDecision.objects.get(plant_id = 'second').soil_moisture_reading, 40)
+
+    def test_interrupted_rebuild_resumes(self):
+        rebuild_slice = rebuild.rebuild_slice
+        def interrupted(first_key, last_key, batch_size):
+            if first_key == self.keys['second']:
+                raise RuntimeError('interrupted')
+            return rebuild_slice(first_key, last_key, batch_size)
+
+        with mock.patch.object(rebuild, 'rebuild_slice', side_effect=interrupted):
+            with self.assertRaises(RuntimeError):
+                self.rebuild()
+        #The other slices are done all the same
+        self.assertEqual(rebuild.completed_slices(), {(self.keys[plant_id], self.keys[plant_id]) for plant_id in ('first', 'third')})
+
+        with self.assertRaises(CommandError):
+            self.rebuild(resume=True, slice_size=2)
+
+        output = self.rebuild(resume=True)
+        self.assertIn('1 of 3 slices to rebuild', output)
+        self.assertIn('1 plants rebuilt from 3 readings', output)
+        self.assertEqual(rebuild.completed_slices(), {(key, key) for key in self.keys.values()})
+
+        #Without --resume everything is rebuilt again
+        self.assertIn('3 of 3 slices to rebuild', self.rebuild())
+
+class ActuatorPlanTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_entry('planned', light_intensity=10)
+
+    def plan(self, now=None, plant_id='planned'):
+        with mock.patch('django.utils.timezone.now', return_value=now or timezone.now()):
+            response = self.client.get('/ActuatorPlan', HTTP_PLANT_ID=plant_id)
+        return response.status_code, response.json()
+
+    def seconds(self, start, end) -> float:
+        parse = lambda value: datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return round((parse(end) - parse(start)).total_seconds())
+
+    def test_regulated_plan(self):
+        status, plan = self.plan()
+        self.assertEqual(status, 200)
+        self.assertFalse(plan['override'])
+        actuators = self.client.get('/ActuatorData', HTTP_PLANT_ID='planned').json()
+
+        self.assertEqual(len(plan['plan']), 1)
+        step = plan['plan'][0]
+        self.assertEqual((step['override'], step['Lamp Intensity State'], step['Water Pump State']),
+                         (False, actuators['Lamp Intensity State'], actuators['Water Pump State']))
+        self.assertEqual(step['until'], plan['valid_until'])
+        self.assertEqual(self.seconds(step['from'], step['until']), settings.ACTUATOR_PLAN['HORIZON'])
+        self.assertEqual(plan['next_poll'], settings.ACTUATOR_PLAN['HORIZON'] * settings.ACTUATOR_PLAN['POLL_FRACTION'])
+
+    def test_plan_is_short_while_the_pump_runs(self):
+        self.add_entry('planned', soil_moisture=40, light_intensity=10)
+        _, plan = self.plan()
+
+        self.assertTrue(plan['plan'][0]['Water Pump State'])
+        self.assertEqual(self.seconds(plan['plan'][0]['from'], plan['valid_until']), settings.ACTUATOR_PLAN['PUMP_HORIZON'])
+
+    def test_expiry_of_the_override_is_planned(self):
+        self.client.post('/Override', data=json.dumps({'Lamp Intensity State': 50, 'Water Pump State': False}),
+                         content_type='application/json', HTTP_PLANT_ID='planned')
+        _, plan = self.plan()
+
+        self.assertTrue(plan['override'])
+        overridden, regulated = plan['plan']
+        self.assertEqual((overridden['override'], overridden['Lamp Intensity State']), (True, 50))
+        #The regulated states follow as soon as the override expires
+        self.assertEqual(regulated['from'], overridden['until'])
+        self.assertEqual((regulated['override'], regulated['Lamp Intensity State']), (False, rules.rules_for('planned').lamp_intensity(10)))
+        self.assertEqual(regulated['until'], plan['valid_until'])
+
+        expires = datetime.datetime.fromisoformat(overridden['until'].replace('Z', '+00:00'))
+        _, plan = self.plan(expires - datetime.timedelta(seconds=10))
+        self.assertEqual(self.seconds(plan['plan'][0]['from'], plan['plan'][0]['until']), 10)
+
+        #The age of an override is counted in whole seconds, and the times of the plan in milliseconds
+        _, plan = self.plan(expires + datetime.timedelta(seconds=2))
+        self.assertFalse(plan['override'])
+        self.assertEqual([step['override'] for step in plan['plan']], [False])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.plan(plant_id='nobody')[0], 400)
+        self.assertEqual(self.client.get('/ActuatorPlan').status_code, 400)
+        self.assertEqual(self.client.post('/ActuatorPlan', HTTP_PLANT_ID='planned').status_code, 400)
+
+class SingleFlightTest(ServerTestCase):
+    KEY = 'response:/AppBasicData:p1:etag'
+
+    def compute(self, content=b'computed'):
+        self.computed += 1
+        return HttpResponse(content, content_type='application/json')
+
+    def setUp(self):
+        super().setUp()
+        self.computed = 0
+
+    def test_identical_requests_of_a_worker_wait_for_the_first_one(self):
+        started, release = threading.Event(), threading.Event()
+        def slow_compute():
+            started.set()
+            release.wait(10)
+            return self.compute()
+
+        responses = []
+        def request(compute):
+            responses.append(caching.single_flight(self.KEY, compute))
+            connections.close_all()
+
+        leader = threading.Thread(target=request, args=(slow_compute,))
+        leader.start()
+        started.wait(10)
+        followers = [threading.Thread(target=request, args=(self.compute,)) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        #Letting the followers reach the flight of the leader
+        time.sleep(0.2)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(10)
+
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(sorted(response.get('X-Cache', 'LEADER') for response in responses), ['COALESCED'] * 3 + ['LEADER'])
+        self.assertTrue(all(response.content == b'computed' for response in responses))
+
+    def test_requests_of_other_workers_wait_for_the_lock(self):
+        holder = caching.acquire_lock(self.KEY)
+        self.assertIsNone(caching.acquire_lock(self.KEY))
+
+        #The other worker caches its response and gives the lock back
+        def other_worker():
+            time.sleep(0.1)
+            caching.get_cache().set(self.KEY, (b'other worker', 'application/json'))
+            caching.release_lock(self.KEY, holder)
+            connections.close_all()
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        response = caching.single_flight(self.KEY, self.compute)
+        thread.join(10)
+
+        self.assertEqual((response.content, response['X-Cache'], self.computed), (b'other worker', 'COALESCED', 0))
+        self.assertFalse(ResponseLock.objects.exists())
+
+    def test_uncacheable_response_of_other_worker(self):
+        holder = caching.acquire_lock(self.KEY)
+        threading.Timer(0.1, caching.release_lock, (self.KEY, holder)).start()
+
+        response = caching.single_flight(self.KEY, self.compute)
+        self.assertEqual((response.content, self.computed), (b'computed', 1))
+
+    def test_abandoned_lock_is_taken_over(self):
+        holder = caching.acquire_lock(self.KEY, now=time.time() - settings.RESPONSE_CACHE['WAIT_TIMEOUT'] - 1)
+
+        new_holder = caching.acquire_lock(self.KEY)
+        self.assertNotIn(new_holder, (None, holder))
+        #The worker that lost the lock can not release it any more
+        caching.release_lock(self.KEY, holder)
+        self.assertTrue(caching.lock_held(self.KEY))
+        caching.release_lock(self.KEY, new_holder)
+        self.assertFalse(caching.lock_held(self.KEY))
+
+class SnapshotTest(ServerTestCase):
+    #The snapshot mirrors the test database, so the reads sent to it see the same rows
+    databases = {'default', 'snapshot'}
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot.sqlite3')
+
+        patcher = mock.patch.object(snapshot, 'snapshot_path', return_value=self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        snapshot._populated = (None, False)
+
+    def copy_primary(self, age=0):
+        #The test database only lives in memory, so it is copied with the same backup API as snapshot.refresh
+        connections['default'].ensure_connection()
+        target = sqlite3.connect(self.path)
+        try:
+            connections['default'].connection.backup(target)
+        finally:
+            target.close()
+        os.utime(self.path, (time.time() - age, time.time() - age))
+
+    def read_database(self) -> str:
+        return router.db_for_read(PlantDecision)
+
+    def test_reads_go_to_a_fresh_snapshot(self):
+        self.assertFalse(snapshot.usable())
+        self.copy_primary()
+        self.assertTrue(snapshot.usable())
+
+        with snapshot.snapshot_reads() as active:
+            self.assertTrue(active)
+            self.assertEqual(self.read_database(), settings.SNAPSHOT['DATABASE'])
+            #The writes and the data versions always go to the primary
+            self.assertEqual(router.db_for_write(PlantDecision), 'default')
+        self.assertEqual(self.read_database(), 'default')
+
+    def test_reads_go_to_the_primary_past_the_staleness_bound(self):
+        self.copy_primary(age=settings.SNAPSHOT['MAX_AGE'] + 1)
+        self.assertFalse(snapshot.usable())
+        self.assertTrue(snapshot.usable(max_age=settings.SNAPSHOT['MAX_AGE'] + 10))
+
+        with snapshot.snapshot_reads() as active:
+            self.assertFalse(active)
+            self.assertEqual(self.read_database(), 'default')
+
+        with self.settings(SNAPSHOT={**settings.SNAPSHOT, 'ENABLED': False}):
+            self.copy_primary()
+            self.assertFalse(snapshot.usable())
+
+    def test_snapshot_without_the_tables_is_not_used(self):
+        #Left behind by a connection opened before the first refresh
+        open(self.path, 'w').close()
+        self.assertFalse(snapshot.usable())
+
+        database = sqlite3.connect(self.path)
+        database.execute('CREATE TABLE smart_plant_api_plantdecision (id INTEGER)')
+        database.commit()
+        database.close()
+        self.assertFalse(snapshot.usable())
+
+        self.copy_primary()
+        self.assertTrue(snapshot.usable())
+
+    def test_view_falls_back_to_the_primary(self):
+        self.copy_primary(age=100)
+        calls = []
+        def view(request):
+            calls.append(self.read_database())
+            if len(calls) == 1:
+                raise DatabaseError('no such table: smart_plant_api_readingentry_209912')
+            return HttpResponse('primary')
+
+        with self.assertLogs('smart_plant_api.snapshot', logging.WARNING):
+            response = snapshot.snapshot_view(view)(RequestFactory().get('/StatisticalData'))
+        self.assertEqual((response.content, calls), (b'primary', [settings.SNAPSHOT['DATABASE'], 'default']))
+
+    def test_snapshot_responses_are_cached_within_the_staleness_bound(self):
+        self.copy_primary(age=100)
+        response = snapshot.snapshot_view(lambda request: HttpResponse('snapshot'))(RequestFactory().get('/StatisticalData'))
+        self.assertAlmostEqual(response.cache_timeout, settings.SNAPSHOT['MAX_AGE'] - 100, delta=5)
+
+        #A failure on the primary is not retried
+        os.remove(self.path)
+        failing = mock.Mock(side_effect=DatabaseError('locked'))
+        with self.assertRaises(DatabaseError):
+            snapshot.snapshot_view(failing)(RequestFactory().get('/StatisticalData'))
+        failing.assert_called_once()
+
+    def test_etag_follows_the_snapshot(self):
+        self.add_entry('p1')
+        etag = self.client.get('/StatisticalData', HTTP_PLANT_ID='p1')['ETag']
+        basic_etag = self.client.get('/AppBasicData', HTTP_PLANT_ID='p1')['ETag']
+
+        #The statistics of a fresh snapshot are not the ones read from the primary, even if the plant has not changed
+        self.copy_primary(age=100)
+        response = self.client.get('/StatisticalData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/StatisticalData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        #Nor are the ones of the next snapshot
+        self.copy_primary(age=10)
+        response = self.client.get('/StatisticalData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        #The views that do not read the snapshot are not affected by it
+        self.assertEqual(self.client.get('/AppBasicData', HTTP_PLANT_ID='p1', HTTP_IF_NONE_MATCH=basic_etag).status_code, 304)
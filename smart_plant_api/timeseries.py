@@ -0,0 +1,254 @@
+'''
+An in-process store of the recent readings of every plant. Each plant gets fixed size ring buffers (one array per sensor
+column) holding its latest TIMESERIES['CAPACITY'] readings, so that the previous-reading lookups and the short windowed
+statistics (served by /RecentStatistics) are answered without querying the readings or making any model object.
+
+A series is warmed from the database the first time its plant is used by the worker and then filled by add_entry. The data
+version of the plant (see caching.py) tells a worker when another worker has added readings, in which case only the
+missing readings are fetched, and the series_reset of its DataVersion row tells it when the readings have been removed. A
+lookup costs no query when the caller passes the data version it has already read (cache_response keeps it in
+request.data_version) and the series is up to date with it. Otherwise the DataVersion row of the plant is read once.
+'''
+from django.conf import settings
+from django.utils import timezone
+from smart_plant_api import caching, readings
+import array, collections, datetime, threading, time
+
+COLUMNS = ('soil_moisture_reading', 'light_intensity_reading', 'water_level_reading')
+READING_RANGE = range(-2**15, 2**15) #The values that fit in the arrays of the readings
+
+Reading = collections.namedtuple('Reading', ('id', 'reading_date', 'reading_time') + COLUMNS)
+
+class PlantSeries:
+    '''
+    The ring buffers of a single plant. The readings are stored in insertion order which is also their chronological order.
+
+    Note: the readings warmed from the database only know their date, so their reading_time is the start of that day.
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0 #The index the next reading is written to
+        self.version = None
+        self.series_reset = None
+        self.lock = threading.Lock()
+
+        self.ids = array.array('q', bytes(8 * capacity))
+        self.days = array.array('l', bytes(array.array('l').itemsize * capacity))
+        self.times = array.array('d', bytes(8 * capacity))
+        self.columns = {column: array.array('h', bytes(2 * capacity)) for column in COLUMNS}
+
+    def _index(self, age) -> int:
+        #The index of the reading with the given age, 0 being the latest reading
+        return (self.head - 1 - age) % self.capacity
+
+    def last_cursor(self) -> tuple:
+        '''
+        Gets the (date ordinal, id) of the latest reading, or None if the series is empty
+        '''
+        if self.size == 0:
+            return None
+
+        index = self._index(0)
+        return (self.days[index], self.ids[index])
+
+    def append(self, reading_id, reading_date, reading_time, soil_moisture_reading, light_intensity_reading, water_level_reading) -> bool:
+        '''
+        Appends a reading to the series unless it is not newer than the latest reading of the series
+
+        Returns:
+            |- (bool): whether the reading was appended
+        '''
+        cursor = (reading_date.toordinal(), reading_id)
+        if self.size and cursor <= self.last_cursor():
+            return False
+
+        index = self.head
+        self.ids[index], self.days[index] = reading_id, cursor[0]
+        self.times[index] = reading_time.timestamp()
+        self.columns['soil_moisture_reading'][index] = soil_moisture_reading
+        self.columns['light_intensity_reading'][index] = light_intensity_reading
+        self.columns['water_level_reading'][index] = water_level_reading
+
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return True
+
+    def append_entry(self, entry, reading_time=None) -> bool:
+        if reading_time == None:
+            reading_time = timezone.make_aware(datetime.datetime.combine(entry.reading_date, datetime.time()), datetime.timezone.utc)
+
+        return self.append(entry.id, entry.reading_date, reading_time, entry.soil_moisture_reading, entry.light_intensity_reading, entry.water_level_reading)
+
+    def latest(self, count=1) -> list:
+        '''
+        Gets the latest readings of the series
+
+        Returns:
+            |- (list): of at most count Reading tuples sorted from the newest to the oldest
+        '''
+        latest = []
+        for age in range(min(count, self.size)):
+            index = self._index(age)
+            latest.append(Reading(self.ids[index],
+                                  datetime.date.fromordinal(self.days[index]),
+                                  datetime.datetime.fromtimestamp(self.times[index], datetime.timezone.utc),
+                                  *(self.columns[column][index] for column in COLUMNS)))
+
+        return latest
+
+    def _window_size(self, count=None, since=None) -> int:
+        size = self.size if count == None else min(count, self.size)
+        if since != None:
+            since = since.timestamp()
+            size = next((age for age in range(size) if self.times[self._index(age)] < since), size)
+
+        return size
+
+    def window(self, column, count=None, since=None) -> array.array:
+        '''
+        Gets the values of a column over a window of the latest readings, from the oldest to the newest
+
+        Arguments:
+            |- column: one of COLUMNS
+            |- count: the window is limited to the latest count readings
+            |- since: the window is limited to the readings received at or after this time
+        '''
+        size = self._window_size(count, since)
+        start = (self.head - size) % self.capacity
+        values = self.columns[column]
+
+        if start + size <= self.capacity:
+            return values[start:start + size]
+        return values[start:] + values[:(start + size) % self.capacity]
+
+    def stats(self, column, count=None, since=None) -> dict:
+        '''
+        Gets the statistics of a column over a window of the latest readings (see window)
+
+        Returns:
+            |- (dict): of the statistics, or None if the window is empty. The following is the format of the dict
+                {
+                    count: (int),
+                    minimum: (int),
+                    maximum: (int),
+                    mean: (float),
+                    trend: (float) the least squares slope of the values in units per hour, 0 with less than two readings
+                }
+        '''
+        size = self._window_size(count, since)
+        if size == 0:
+            return None
+
+        values = self.window(column, size)
+        times = [self.times[self._index(age)] / 3600 for age in range(size - 1, -1, -1)]
+
+        mean = sum(values) / size
+        mean_time = sum(times) / size
+        time_variance = sum((hour - mean_time) ** 2 for hour in times)
+        trend = sum((hour - mean_time) * (value - mean) for hour, value in zip(times, values)) / time_variance if time_variance else 0
+
+        return {'count': size, 'minimum': min(values), 'maximum': max(values), 'mean': mean, 'trend': trend}
+
+_series = collections.OrderedDict()
+_store_lock = threading.Lock()
+
+def _data_state(plant_id) -> tuple:
+    '''
+    Gets the (data version, series reset) of a plant from its DataVersion row
+    '''
+    from smart_plant_api.models import DataVersion
+
+    state = DataVersion.objects.using('default').filter(plant_id = plant_id).values_list('version', 'series_reset').first()
+    if state == None:
+        #The row is made for the plants that have data, the version of the other plants is None
+        return (caching.data_version(plant_id), None)
+
+    return state
+
+def _warm(series, plant_id) -> None:
+    series.size, series.head = 0, 0
+    for entry in reversed(readings.latest_readings(plant_id, series.capacity)):
+        series.append_entry(entry)
+
+def _catch_up(series, plant_id) -> None:
+    cursor = series.last_cursor()
+    if cursor == None:
+        return _warm(series, plant_id)
+
+    entries = readings.readings_after(plant_id, datetime.date.fromordinal(cursor[0]), cursor[1], series.capacity)
+    for entry in entries:
+        series.append_entry(entry)
+
+def series_for(plant_id, version=None) -> PlantSeries:
+    '''
+    Gets the series of a plant, warming it from the database or catching up with the readings added by the other workers
+    when needed. The least recently used series are dropped once there are more than TIMESERIES['MAX_PLANTS'] of them.
+
+    Arguments:
+        |- plant_id: the Plant-Id of the plant
+        |- version: the data version of the plant, when the caller has already read it. It is read from the database otherwise
+    '''
+    with _store_lock:
+        series = _series.get(plant_id)
+        if series == None:
+            series = _series[plant_id] = PlantSeries(settings.TIMESERIES['CAPACITY'])
+            if len(_series) > settings.TIMESERIES['MAX_PLANTS']:
+                _series.popitem(last=False)
+        _series.move_to_end(plant_id)
+
+    state = _data_state(plant_id) if version == None else None
+    if state != None:
+        version = state[0]
+
+    with series.lock:
+        if series.version != version:
+            series_reset = (state or _data_state(plant_id))[1]
+            if series.version == None or series.series_reset != series_reset:
+                _warm(series, plant_id)
+            else:
+                _catch_up(series, plant_id)
+            series.version, series.series_reset = version, series_reset
+
+    return series
+
+def record_reading(plant_id, reading, reading_time, series=None) -> PlantSeries:
+    '''
+    Appends a reading that has just been added by this worker to the series of its plant
+
+    Arguments:
+        |- series: the series of the plant, when it was already taken before the reading was added
+
+    Returns:
+        |- (PlantSeries): the series of the plant
+    '''
+    if series == None:
+        series = series_for(plant_id)
+    with series.lock:
+        if not series.append_entry(reading, reading_time) and series.last_cursor() == (reading.reading_date.toordinal(), reading.id):
+            #The reading has already been warmed from the database, which only knows its date
+            series.times[series._index(0)] = reading_time.timestamp()
+
+    return series
+
+def data_changed(series, old_version, new_version) -> None:
+    '''
+    Marks a series as up to date with the new data version of its plant after this worker changed the data, as long as no
+    other worker changed the data in the mean time.
+    '''
+    with series.lock:
+        if series.version == old_version and new_version == old_version + 1:
+            series.version = new_version
+
+def reset(plant_id) -> int:
+    '''
+    Makes every worker warm the series of a plant again. This is used when readings are removed instead of added, and marks
+    the data of the plant as changed along with it
+
+    Returns:
+        |- (int): the new data version of the plant
+    '''
+    with _store_lock:
+        _series.pop(plant_id, None)
+
+    return caching.bump_data_version(plant_id, latest_reading_id = None, series_reset = time.time_ns())
@@ -1,20 +1,19 @@
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, FileResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
-from smart_plant_api.models import ReadingEntry, OverrideRequest, TokenPlantIDBind, NotificationSent
-import json, collections, pytz, random, datetime, statistics
+from smart_plant_api.models import OverrideRequest, TokenPlantIDBind, NotificationSent, PlantDecision
+from smart_plant_api import readings, rules, timeseries, forecast, live, plants
+from smart_plant_api.admission import admission_control
+from smart_plant_api.caching import cache_response, bump_data_version
+from smart_plant_api.snapshot import snapshot_view
+from smart_plant_api import profiling, warmup
+import json, collections, datetime, logging
 
-from exponent_server_sdk import DeviceNotRegisteredError
-from exponent_server_sdk import PushClient
-from exponent_server_sdk import PushMessage
-from exponent_server_sdk import PushResponseError
-from exponent_server_sdk import PushServerError
-from requests.exceptions import ConnectionError
-from requests.exceptions import HTTPError
-
-startup_time = timezone.now()
+logger = logging.getLogger(__name__)
 
 #All of the following are helper methods
 def generate_error_message(error_message) -> str:
@@ -46,17 +45,19 @@ def override_data(plant_id) -> dict:
                     "Lamp Intensity State": (int),
                     "Water Pump State": (int)
                 }
+                expires: (datetime)
             }
     
-    Notes: if there are no valid override requests, data is equal to None 
+    Notes: if there are no valid override requests, data and expires are equal to None 
     '''
-    override_validity = 5 #How long an override request is valid in minutes
-    override_requests = OverrideRequest.objects.filter(plant_id = plant_id)
+    override_validity = OverrideRequest.VALIDITY #How long an override request is valid in minutes
+    override_requests = OverrideRequest.objects.filter(plant_id = plants.plant_key(plant_id))
 
     if len(override_requests) == 0 or override_requests[len(override_requests) - 1].override_since(timezone.now()) > override_validity:
         return {
             "isOverridden": False,
-            "data": None
+            "data": None,
+            "expires": None
         }
     
     return {
@@ -64,59 +65,51 @@ def override_data(plant_id) -> dict:
         "data": {
             "Lamp Intensity State": override_requests[len(override_requests) - 1].lamp_intensity_state,
             "Water Pump State": override_requests[len(override_requests) - 1].water_pump_state,
-        }
+        },
+        "expires": override_requests[len(override_requests) - 1].request_time + datetime.timedelta(minutes = override_validity)
     }
 
-def calculate_actuator_values(light_intensity, soil_moisture, old_soil_moisture) -> tuple:
+def calculate_actuator_values(light_intensity, soil_moisture, old_soil_moisture, plant_rules=None) -> tuple:
     '''
     A method used to calculate the lamp_intensity_state, and the water_pump_state based on the light_intensity and the soil moisture
 
     Arguments:
         |- light_intensity: the amount of light that the plant is currently exposed to
         |- soil_moisture: the amount of moisture currently in the soil
+        |- old_soil_moisture: the amount of moisture in the soil in the previous reading
+        |- plant_rules: the compiled rules of the plant. The default rules are used when this is not provided
 
     Returns
         |- (tuple): a tuple of the (lamp_intensity_state, water_pump_state)
     '''
-    lamp_intensity_state = 0
-    water_pump_state = False
-    
-    #Controlling the lamp intensity.
-    if 0 <= light_intensity < 25:
-        lamp_intensity_state = 100
-    elif 25 <= light_intensity < 50:
-        lamp_intensity_state = 75
-    elif 50 <= light_intensity < 75:
-        lamp_intensity_state = 50
-    elif 75 <= light_intensity < 100:
-        lamp_intensity_state = 10
-    
-    #Controlling the water pump.
-    limits = [45, 75]
-    difference = soil_moisture - old_soil_moisture
-    
-    if soil_moisture <= min(limits):
-        water_pump_state = True
-    elif soil_moisture >= max(limits):
-        water_pump_state = False
-    else:
-        print("Special Case")
-        print(f"Soil Moisture: {soil_moisture}, Old Soil Moisture: {old_soil_moisture},")
-        water_pump_state = difference > 0 if abs(difference) > 2 else False
-    
-    return (lamp_intensity_state, water_pump_state)
+    plant_rules = plant_rules if plant_rules != None else rules.compile_profile()
+
+    if plant_rules.pump_low < soil_moisture < plant_rules.pump_high:
+        logger.debug('Soil moisture between the pump thresholds', extra={'soil_moisture': soil_moisture, 'old_soil_moisture': old_soil_moisture})
 
-def print_v(string, end="\n") -> None:
+    return plant_rules.actuators(light_intensity, soil_moisture, old_soil_moisture)
+
+def regulated_actuator_values(plant_id) -> tuple:
     '''
-    A very simple method used to print a string if the verbouse parameter in the settings is set to true, othrewise it doesnt print it.
+    Gets the actuator states that the server regulates the plant with when it is not overridden
 
     Arguments:
-        |- string: the string to print
-        |- end: the end of the string
+        |- plant_id: the Plant-Id of the plant
 
+    Returns:
+        |- (tuple): a tuple of the (lamp_intensity_state, water_pump_state), or None if the plant has no entries
     '''
-    if settings.VERBOUSE:
-        print(string, end=end)
+    decision = PlantDecision.objects.filter(plant_id = plant_id).first()
+    if decision != None:
+        return (decision.lamp_intensity_state, decision.water_pump_state)
+
+    #Plants that have not sent a reading since decisions started being precomputed at ingest
+    entries = timeseries.series_for(plant_id).latest(2)
+    if len(entries) == 0:
+        return None
+
+    last_entry, second_to_last = entries[0], entries[len(entries) - 1]
+    return calculate_actuator_values(last_entry.light_intensity_reading, last_entry.soil_moisture_reading, second_to_last.soil_moisture_reading, rules.rules_for(plant_id))
 
 def send_notification(token, title, message):
     '''
@@ -126,7 +119,18 @@ def send_notification(token, title, message):
         |- token: The Expo notification token to send notifications to
         |- title: The title of the notification that displays on the screen
         |- messag: The message included in the body of the message
+
+    Note: the push notification libraries are only imported the first time a notification is sent since most of the
+          requests never send one, and importing them slows down the start of every worker.
     '''
+    from exponent_server_sdk import DeviceNotRegisteredError
+    from exponent_server_sdk import PushClient
+    from exponent_server_sdk import PushMessage
+    from exponent_server_sdk import PushResponseError
+    from exponent_server_sdk import PushServerError
+    from requests.exceptions import ConnectionError
+    from requests.exceptions import HTTPError
+
     extra = None
     try:
         response = PushClient().publish(
@@ -185,6 +189,7 @@ def welcome_view(request):
     return JsonResponse({'status': 200, 'response': 'Server is up and running'}, status=200)
 
 @csrf_exempt
+@admission_control
 def add_entry(request):
     '''
     This is the end point that is responsible for the addition of the entries to the database.
@@ -200,6 +205,7 @@ def add_entry(request):
             |- Soil Moisture: the value of the soil moisture being read by the soil moisture sensor
             |- Light Intensity: the value of the light intensity being read by the LDR sensor
             |- Water Level: the value of the water level in the water tank being read by the water level sensor
+            The values must be numbers in SENSOR_RANGE (0 to 100 by default). Fractional values are truncated
         Expected Response:
             |- status: 200 If the entry has been added sucessfully, 400 if the addition has failed
             |- response: a verbal response of the status.
@@ -209,17 +215,11 @@ def add_entry(request):
     '''
     def check_and_send(monitored_quantity_name, monitored_quantity_value, minimum_value, title, message, wait_time):
         if monitored_quantity_value < minimum_value:
-            notifications_sent = NotificationSent.objects.filter(plant_id = plant_id)
-            
-            shouldContinue = True
-            for notification in notifications_sent:
-                if notification.reason == monitored_quantity_name and notification.minutes_since(timezone.now()) < wait_time:
-                    shouldContinue = False
-                    break
+            shouldContinue = not NotificationSent.objects.filter(plant_id = plant_key, reason = monitored_quantity_name, time__gte = timezone.now() - datetime.timedelta(minutes = wait_time)).exists()
 
             if shouldContinue:
-                NotificationSent(plant_id = plant_id, reason = monitored_quantity_name, time=timezone.now()).save()
-                tokens = TokenPlantIDBind.objects.filter(plant_id = request.headers.get('Plant-Id'))[0].tokens.split(',')
+                NotificationSent(plant_id = plant_key, reason = monitored_quantity_name, time=timezone.now()).save()
+                tokens = TokenPlantIDBind.objects.filter(plant_id = plant_key)[0].tokens.split(',')
                 for token in tokens:
                     try:
                         send_notification(token, title, message)
@@ -240,32 +240,69 @@ def add_entry(request):
                                 'response': generate_error_message('No Plant-Id provided in the request header')},
                                 status = 400)
 
-        ReadingEntry(plant_id = plant_id, reading_date = timezone.now(), soil_moisture_reading = sensor_readings["Soil Moisture"], light_intensity_reading = sensor_readings["Light Intensity"], water_level_reading = sensor_readings["Water Level"]).save()
-        print_v(f'Soil Moisture: {sensor_readings["Soil Moisture"]}\nLight Intensity: {sensor_readings["Light Intensity"]}\nWater Level: {sensor_readings["Water Level"]}\n')
-        entry_count = len(ReadingEntry.objects.all().filter(plant_id = plant_id))
+        try:
+            #The readings are stored as integers, so the fractional readings of some sensors are truncated the way the
+            #IntegerFields of the readings always did. Anything but a JSON number is refused before anything is written
+            if any(isinstance(sensor_readings[name], bool) or not isinstance(sensor_readings[name], (int, float)) for name in READING_FIELDS):
+                raise TypeError
+            sensor_readings = {name: int(sensor_readings[name]) for name in READING_FIELDS}
+        except (TypeError, ValueError, OverflowError):
+            return JsonResponse({'status': 400,
+                                'response': generate_error_message('The payload items must be numbers')},
+                                status = 400)
+
+        if any(not settings.SENSOR_RANGE['MINIMUM'] <= value <= settings.SENSOR_RANGE['MAXIMUM'] for value in sensor_readings.values()):
+            return JsonResponse({'status': 400,
+                                'response': generate_error_message(f'The payload items must be between {settings.SENSOR_RANGE["MINIMUM"]} and {settings.SENSOR_RANGE["MAXIMUM"]}')},
+                                status = 400)
+
+        #Only reached when SENSOR_RANGE is wider than what the recent readings of every worker can hold (see timeseries.py)
+        if any(value not in timeseries.READING_RANGE for value in sensor_readings.values()):
+            return JsonResponse({'status': 400,
+                                'response': generate_error_message('The payload items are too large to be stored')},
+                                status = 400)
+
+        plant_key = plants.request_plant_key(request, create=True)
+        reading_time = timezone.now()
+        readings.prepare_write(reading_time)
+        series = timeseries.series_for(plant_id)
+        latest_entries = series.latest()
+
+        #The reading and everything derived from it are written together, so a failed write leaves none of them behind
+        with transaction.atomic():
+            reading = readings.create_reading(plant_id = plant_id, reading_date = reading_time, soil_moisture_reading = sensor_readings["Soil Moisture"], light_intensity_reading = sensor_readings["Light Intensity"], water_level_reading = sensor_readings["Water Level"])
+            entry_count = readings.reading_count(plant_id)
+
+            #The first reading of a plant is compared against itself
+            previous_entry = latest_entries[0] if latest_entries else reading
+
+            #Precomputing the actuator states and the plant state so that the endpoints reading them do not have to
+            decision = rules.record_decision(plant_id, reading, previous_entry.soil_moisture_reading, reading_time)
+            forecast.record_reading(plant_id, reading, reading_time)
+            data_version = bump_data_version(plant_id, latest_reading_id = reading.id)
+
+        logger.debug('Reading received', extra={'plant_id': plant_id, 'soil_moisture': sensor_readings["Soil Moisture"],
+                                                'light_intensity': sensor_readings["Light Intensity"], 'water_level': sensor_readings["Water Level"]})
+        timeseries.record_reading(plant_id, reading, reading_time, series)
+        timeseries.data_changed(series, series.version, data_version)
+        live.publish(plant_id, data_version, lambda: live.reading_changes(plant_id, decision))
 
         #Checking for the water level sensor and the soil moisture and sending notifications if they're too low.
-        wait_time = 10 #The wait time is in minutes
-        check_and_send('Water Level', sensor_readings["Water Level"], 20, "Water Level is too low", f"Your current water level is {sensor_readings['Water Level']}. Please refill the tank soon to keep your plant healthy", wait_time = wait_time)
-        check_and_send('Soil Moisture', sensor_readings["Soil Moisture"], 20, "Your plant needs to be watered", f"Your current soil moisture is {sensor_readings['Soil Moisture']}. Please water your plant as soon as possible to ensure that it is kept healthy", wait_time = wait_time)
+        #The same alerts are sent for the whole fleet by the sweeper (see sweeper.py), which shares the thresholds and the wait time
+        wait_time = settings.ALERTS['WAIT_TIME'] #The wait time is in minutes
+        check_and_send('Water Level', sensor_readings["Water Level"], settings.ALERTS['WATER_LOW'], "Water Level is too low", f"Your current water level is {sensor_readings['Water Level']}. Please refill the tank soon to keep your plant healthy", wait_time = wait_time)
+        check_and_send('Soil Moisture', sensor_readings["Soil Moisture"], settings.ALERTS['SOIL_MOISTURE_LOW'], "Your plant needs to be watered", f"Your current soil moisture is {sensor_readings['Soil Moisture']}. Please water your plant as soon as possible to ensure that it is kept healthy", wait_time = wait_time)
 
 
         #Leaking Tank Notification process
-        entries = ReadingEntry.objects.filter(plant_id = plant_id)
-        old_water_level = entries[len(entries) - 2].water_level_reading
+        old_water_level = previous_entry.water_level_reading
         
         if old_water_level - sensor_readings["Water Level"] > 25:
-            notifications_sent = NotificationSent.objects.filter(plant_id = plant_id)
-                
-            shouldContinue = True
-            for notification in notifications_sent:
-                if notification.reason == "Leaking Tank" and notification.minutes_since(timezone.now()) < wait_time:
-                    shouldContinue = False
-                    break
-            
+            shouldContinue = not NotificationSent.objects.filter(plant_id = plant_key, reason = "Leaking Tank", time__gte = timezone.now() - datetime.timedelta(minutes = wait_time)).exists()
+
             if shouldContinue:
-                NotificationSent(plant_id = plant_id, reason = "Leaking Tank", time=timezone.now()).save()
-                tokens = TokenPlantIDBind.objects.filter(plant_id = request.headers.get('Plant-Id'))[0].tokens.split(',')
+                NotificationSent(plant_id = plant_key, reason = "Leaking Tank", time=timezone.now()).save()
+                tokens = TokenPlantIDBind.objects.filter(plant_id = plant_key)[0].tokens.split(',')
                 for token in tokens:
                     try:
                         send_notification(token, "Possible leaking tank", f"Your water level went from {old_water_level} to {sensor_readings['Water Level']} in a short while which could mean that a leak is happening. Please check your tank to ensure it is safe.")
@@ -277,6 +314,8 @@ def add_entry(request):
     else:
         return JsonResponse({"status": 400, "response": generate_error_message("Endpoint only accepts post requests")}, status = 400)
 
+@cache_response(vary_on_headers=('Plant-Id', 'Period'))
+@snapshot_view
 def statistical_data(request):
     '''
     This is an endpoint that is used to provide some statiscal data on the plant and its needs. Examples of what it provides are water level statistics, light sensor readings,
@@ -322,35 +361,6 @@ def statistical_data(request):
             'todays': y_axis_data[-1]
         }
 
-    def get_reading_entry_average(reading_entry_array) -> dict:
-        '''
-        A simple helper method that can be used to find the average from the given reading entry array given
-
-        Arguments:
-            |- reading_entry_array: an array of reading entries 
-    
-        Returns: 
-            |- (dict): of the data. The following is the format of the dict
-                {
-                    soil_moisture_reading: (float)
-                    light_intensity_reading: (float)
-                    water_level_reading: (float)
-                }
-        '''
-        light_intensity_readings = []
-        soil_moisture_readings = []
-        water_level_readings = []
-        for entry in reading_entry_array:
-            light_intensity_readings.append(entry.light_intensity_reading)
-            soil_moisture_readings.append(entry.soil_moisture_reading)
-            water_level_readings.append(entry.water_level_reading)
-
-        return {
-            'light_intensity_reading': statistics.mean(light_intensity_readings if len(soil_moisture_readings) != 0 else [0]),
-            'soil_moisture_reading': statistics.mean(soil_moisture_readings if len(soil_moisture_readings) != 0 else [0]),
-            'water_level_reading': statistics.mean(water_level_readings if len(soil_moisture_readings) != 0 else [0])
-        }
-
     if request.method == "GET":
         if request.headers.get('Plant-Id') == None:
             return JsonResponse({'status': 400,
@@ -362,8 +372,11 @@ def statistical_data(request):
 
         applicable_dates = [todays_date - datetime.timedelta(days=i) for i in range(0, number_of_data, 1)][::-1]
         x_axis = [date.strftime("%a") for date in applicable_dates]
-        applicable_data = [ReadingEntry.objects.filter(plant_id = request.headers.get('Plant-Id'), reading_date = date) for date in applicable_dates]
-        applicable_data = list(map(get_reading_entry_average, applicable_data))
+
+        #Days without any readings have an average of 0
+        no_readings = {'light_intensity_reading': 0, 'soil_moisture_reading': 0, 'water_level_reading': 0}
+        daily_averages = readings.daily_averages(request.headers.get('Plant-Id'), applicable_dates[0], applicable_dates[-1])
+        applicable_data = [daily_averages.get(date, no_readings) for date in applicable_dates]
 
         light_intensity_stats = [int(data['light_intensity_reading']) for data in applicable_data]
         soil_moisture_stats = [int(data['soil_moisture_reading']) for data in applicable_data]
@@ -382,6 +395,131 @@ def statistical_data(request):
     else:
         return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts get requests')}, status = 400)
 
+#The names of the reading columns used in the payloads and in the Fields header
+READING_FIELDS = {
+    'Soil Moisture': 'soil_moisture_reading',
+    'Light Intensity': 'light_intensity_reading',
+    'Water Level': 'water_level_reading',
+}
+
+def reading_history(request):
+    '''
+    This endpoint lets the smartphone application scroll through the individual readings of a plant, from the newest to the oldest.
+    The pages are linked through cursors instead of offsets so that every page takes the same time no matter how deep it is.
+
+    Endpoint: /ReadingHistory
+
+    Get:
+        Expected Headers:
+            |- Plant-Id: a unique identifier to each plant to identify the plant in the database and to ensure 
+            |- Cursor: An optional header with the next_cursor of the previous page. The first page is returned when it is not defined.
+            |- Page-Size: An optional header with the number of readings in a page. Defaults to 50 and can not be more than 500.
+            |- Fields: An optional comma separated list of the readings to return out of Soil Moisture, Light Intensity and Water Level. Defaults to all of them.
+            |- Start-Date: An optional header with the first date (YYYY-MM-DD) of the readings to return.
+            |- End-Date: An optional header with the last date (YYYY-MM-DD) of the readings to return.
+        Expected Payload: None
+        Expected Response:
+            |- status: 200 if the request is sucessful, and 400 if the request made is in an invalid format
+            |- readings: an array of the readings of the page. Every reading has its reading_date and the selected fields
+            |- next_cursor: the cursor of the next page, null if this is the last page
+
+    Post: No post requests are allowed to this end point. A post request will result in a status 400 response
+    '''
+    if request.method != "GET":
+        return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts get requests')}, status = 400)
+
+    if request.headers.get('Plant-Id') == None:
+        return JsonResponse({'status': 400,
+                            'response': generate_error_message('No Plant-Id provided in the request header')},
+                            status = 400)
+
+    try:
+        page_size = int(request.headers.get('Page-Size', 50))
+        if page_size < 1 or page_size > 500:
+            raise ValueError
+
+        fields = [field.strip() for field in request.headers.get('Fields', ','.join(READING_FIELDS)).split(',') if field.strip()]
+        if len(fields) == 0 or any(field not in READING_FIELDS for field in fields):
+            raise ValueError
+
+        start_date = datetime.date.fromisoformat(request.headers['Start-Date']) if request.headers.get('Start-Date') != None else None
+        end_date = datetime.date.fromisoformat(request.headers['End-Date']) if request.headers.get('End-Date') != None else None
+
+        #The cursor is the date and the id of the last reading of the previous page
+        before = None
+        if request.headers.get('Cursor') != None:
+            cursor_date, cursor_id = request.headers['Cursor'].split('.')
+            before = (datetime.date.fromisoformat(cursor_date), int(cursor_id))
+    except ValueError:
+        return JsonResponse({'status': 400,
+                            'response': generate_error_message('Invalid Cursor, Page-Size, Fields, Start-Date or End-Date header')},
+                            status = 400)
+
+    #Getting one more reading than needed tells whether there is a next page
+    entries = readings.history_page(request.headers.get('Plant-Id'), page_size + 1, before, start_date, end_date, [READING_FIELDS[field] for field in fields])
+    next_cursor = None
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        next_cursor = f"{entries[-1]['reading_date'].isoformat()}.{entries[-1]['id']}"
+
+    return JsonResponse({
+        'status': 200,
+        'readings': [{'reading_date': entry['reading_date'], **{field: entry[READING_FIELDS[field]] for field in fields}} for entry in entries],
+        'next_cursor': next_cursor,
+    })
+
+def recent_statistics(request):
+    '''
+    This endpoint gives the statistics of the latest readings of a plant, such as the last hour or the last 100 readings. They
+    are computed from the recent readings that every worker keeps in memory (see timeseries.py) without querying the readings.
+    This endpoint is typically used by the smartphone app.
+
+    Endpoint: /RecentStatistics
+
+    Get:
+        Expected Headers:
+            |- Plant-Id: a unique identifier to each plant to identify the plant in the database and to ensure 
+            |- Readings: An optional header limiting the statistics to this many of the latest readings. Defaults to all of the recent readings kept (TIMESERIES['CAPACITY']).
+            |- Minutes: An optional header limiting the statistics to the readings received in this many of the last minutes.
+        Expected Payload: None
+        Expected Response:
+            |- status: 200 if the request is sucessful, and 400 if the request made is in an invalid format
+            |- statistics: the statistics of Soil Moisture, Light Intensity and Water Level over the window, each of them null when the window is empty
+                |- count: the number of readings in the window
+                |- minimum: the lowest reading of the window
+                |- maximum: the highest reading of the window
+                |- mean: the average of the readings of the window
+                |- trend: the change of the readings in units per hour (least squares), 0 with less than two readings
+
+    Post: No post requests are allowed to this end point. A post request will result in a status 400 response
+
+    Note: the readings added before the worker started only know their date, so they count as received at the start of that day.
+    '''
+    if request.method != "GET":
+        return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts get requests')}, status = 400)
+
+    if request.headers.get('Plant-Id') == None:
+        return JsonResponse({'status': 400,
+                            'response': generate_error_message('No Plant-Id provided in the request header')},
+                            status = 400)
+
+    try:
+        count = int(request.headers['Readings']) if request.headers.get('Readings') != None else None
+        minutes = float(request.headers['Minutes']) if request.headers.get('Minutes') != None else None
+        if (count != None and count < 1) or (minutes != None and not minutes > 0):
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'status': 400,
+                            'response': generate_error_message('Invalid Readings or Minutes header')},
+                            status = 400)
+
+    since = timezone.now() - datetime.timedelta(minutes = minutes) if minutes != None else None
+    series = timeseries.series_for(request.headers.get('Plant-Id'))
+    with series.lock:
+        statistics = {field: series.stats(column, count, since) for field, column in READING_FIELDS.items()}
+
+    return JsonResponse({'status': 200, 'statistics': statistics})
+
 @csrf_exempt
 def remove_entries(request):
     '''
@@ -416,7 +554,9 @@ def remove_entries(request):
 
         admin_response = input(f'A request has been made to delete entries for the plant with plant-id {request.headers.get("Plant-Id")}\nAccept this request? (y/n): ').lower()
         if 'y' in admin_response:
-            ReadingEntry.objects.filter(plant_id = request.headers.get('Plant-Id')).delete()
+            readings.delete_readings(request.headers.get('Plant-Id'))
+            forecast.delete_forecast(request.headers.get('Plant-Id'))
+            timeseries.reset(request.headers.get('Plant-Id'))
             status = 200
             response_message = 'Removal request has been accepted'
         else:
@@ -425,7 +565,7 @@ def remove_entries(request):
 
         return JsonResponse({'status': status,
                             'response': response_message,
-                            'count': len(ReadingEntry.objects.filter(plant_id = request.headers.get('Plant-Id')))},
+                            'count': readings.reading_count(request.headers.get('Plant-Id'))},
                             status=status)
 
     else:
@@ -471,33 +611,110 @@ def actuator_data(request):
                         "Lamp Intensity State": override_request['data']['Lamp Intensity State'], 
                         "Water Pump State": override_request['data']['Water Pump State']}
 
-            print_v(response)
+            logger.debug('Actuator states sent', extra={'plant_id': request.headers.get('Plant-Id'), 'override': True,
+                                                        'lamp_intensity': response["Lamp Intensity State"], 'water_pump': response["Water Pump State"]})
             return JsonResponse(response)
 
         #The following section is the processing done based on the last entry added 
         else:
-            entries = ReadingEntry.objects.all().filter(plant_id = request.headers.get('Plant-Id'))
-            
-            if len(entries) == 0:
+            actuator_values = regulated_actuator_values(request.headers.get('Plant-Id'))
+
+            if actuator_values == None:
                 return JsonResponse({'status': 400,
                                     'response': generate_error_message('The Plant-Id provided has no entries linked to it')},
-                                    status = 400) 
-
-            last_entry = entries[len(entries) - 1]  #the Django ORM rejects any negative indexing, so the only way to get he last index is to do entries[len(entries) - 1]
-            second_to_last = entries[len(entries) - 2]
-            lamp_intensity_state, water_pump_state = calculate_actuator_values(last_entry.light_intensity_reading, last_entry.soil_moisture_reading, second_to_last.soil_moisture_reading)
+                                    status = 400)
 
+            lamp_intensity_state, water_pump_state = actuator_values
             response = {'status': 200, 
                         'override': False, 
                         "Lamp Intensity State": lamp_intensity_state, 
                         "Water Pump State": water_pump_state}
 
-            print_v(f'{response}\n')
+            logger.debug('Actuator states sent', extra={'plant_id': request.headers.get('Plant-Id'), 'override': False,
+                                                        'lamp_intensity': lamp_intensity_state, 'water_pump': water_pump_state})
             return JsonResponse(response)
 
     else:
         return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts get requests')}, status = 400)
 
+def actuator_plan(request):
+    '''
+    An alternative to /ActuatorData for the actuators that poll less often. Instead of the states to use right now, it sends the
+    states to use over the next few minutes as a list of steps. The actuator states only change when a reading is added or when
+    an override is made or expires, so the expiry of the current override is planned ahead and the device only has to poll
+    again to find out about the readings and the overrides that are yet to come.
+
+    Note: while the server turns the water pump on, the plan is kept short (see ACTUATOR_PLAN in the settings) since the next
+          reading is expected to turn it off again.
+
+    Endpoint: /ActuatorPlan
+
+    Post: No post requests are allowed to this end point. A post request will result in a status 400 response
+
+    Get:
+        Expected Headers:
+            |- Plant-Id: a unique identifier to each plant to identify the plant in the database and to ensure
+        Expected Payload: No payload is expected to be supplied to this endpoint
+        Expected Response:
+            |- status: 200 upon sucess, 400 or 500 upon failure
+            |- override: whether the values are currently overridden by the user
+            |- plan: a list of the steps of the plan, sorted by time. Every step has the following format
+                {
+                    from: (datetime) the time at which the step starts
+                    until: (datetime) the time at which the step ends
+                    override: (bool) whether the states of the step come from an override request
+                    Lamp Intensity State: (int) the intensity that the lamp should run at. This is sent as a percentage.
+                    Water Pump State: (bool) whether the water pump should be turned on or off
+                }
+            |- valid_until: the time at which the plan ends. The device should stop acting on the plan after this time
+            |- next_poll: the number of seconds after which the device should ask for a new plan
+    '''
+    if request.method == "GET":
+        plant_id = request.headers.get('Plant-Id')
+        if plant_id == None:
+            return JsonResponse({'status': 400,
+                                'response': generate_error_message('No Plant-Id provided in the request header')},
+                                status = 400)
+
+        now = timezone.now()
+        override_request = override_data(plant_id)
+        actuator_values = regulated_actuator_values(plant_id)
+
+        if actuator_values == None and not override_request['isOverridden']:
+            return JsonResponse({'status': 400,
+                                'response': generate_error_message('The Plant-Id provided has no entries linked to it')},
+                                status = 400)
+
+        #The steps as (start, end, override, lamp intensity state, water pump state)
+        steps = []
+        valid_until = now + datetime.timedelta(seconds = settings.ACTUATOR_PLAN['HORIZON'])
+        if override_request['isOverridden']:
+            steps.append((now, override_request['expires'], True, override_request['data']['Lamp Intensity State'], override_request['data']['Water Pump State']))
+
+        if actuator_values != None:
+            start = override_request['expires'] if override_request['isOverridden'] else now
+            if actuator_values[1]:
+                valid_until = min(valid_until, start + datetime.timedelta(seconds = settings.ACTUATOR_PLAN['PUMP_HORIZON']))
+            steps.append((start, valid_until, False, *actuator_values))
+        else:
+            #Nothing is known about what comes after the override
+            valid_until = min(valid_until, override_request['expires'])
+
+        plan = [{'from': start, 'until': min(end, valid_until), 'override': override,
+                 "Lamp Intensity State": lamp_intensity_state, "Water Pump State": water_pump_state}
+                for start, end, override, lamp_intensity_state, water_pump_state in steps if start < valid_until]
+
+        logger.debug('Actuator plan sent', extra={'plant_id': plant_id, 'override': override_request['isOverridden'], 'steps': len(plan)})
+        return JsonResponse({'status': 200,
+                            'override': override_request['isOverridden'],
+                            'plan': plan,
+                            'valid_until': valid_until,
+                            'next_poll': max(1, round((valid_until - now).total_seconds() * settings.ACTUATOR_PLAN['POLL_FRACTION']))})
+
+    else:
+        return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts get requests')}, status = 400)
+
+@cache_response()
 def app_basic_data(request):
     '''
     This endpoint is responsible for providing all of the basic data about the plant to the smartphone application. This is data such as the latest sensor readings,
@@ -528,6 +745,13 @@ def app_basic_data(request):
                 |- header_text: the header of the report
                 |- value: the values of the given report
                 |- description: a verbal description of the title and value of the report
+            |- forecast: the trends of the plant, read from running statistics that are updated with every reading. A value is null until it can be forecasted
+                |- soil_moisture_trend: the change of the soil moisture in percent per hour
+                |- soil_moisture_deviation: the standard deviation of the soil moisture
+                |- water_level_trend: the change of the water level in percent per hour
+                |- water_low_threshold: the water level (in percent) at which the low water alert is sent
+                |- hours_until_water_low: the hours from the last reading until the water level reaches the threshold, null if the water level is not decreasing
+                |- water_low_time: the time at which the water level reaches the threshold
 
     Post: No post requests are allowed to this end point. A post request will result in a status 400 response
     '''
@@ -538,8 +762,14 @@ def app_basic_data(request):
                                 'response': generate_error_message('No Plant-Id provided in the request header')},
                                 status = 400)
 
-        latest_entry = ReadingEntry.objects.filter(plant_id = request.headers.get('Plant-Id')).order_by('-id')[0]
-        second_to_last = ReadingEntry.objects.filter(plant_id = request.headers.get('Plant-Id')).order_by('-id')[1]
+        #The data version has been read by cache_response already
+        entries = timeseries.series_for(request.headers.get('Plant-Id'), getattr(request, 'data_version', None)).latest(2)
+        if len(entries) == 0:
+            return JsonResponse({'status': 400,
+                                'response': generate_error_message('The Plant-Id provided has no entries linked to it')},
+                                status = 400)
+
+        latest_entry, second_to_last = entries[0], entries[len(entries) - 1]
         water_tank_max_level = 1
 
         #Working on the metadata
@@ -569,18 +799,28 @@ def app_basic_data(request):
         #Working on the reports section
         #Getting the last override request
         override_info = override_data(request.headers.get('Plant-Id'))
+        decision = PlantDecision.objects.filter(plant_id = request.headers.get('Plant-Id')).first()
+        plant_rules = rules.rules_for(request.headers.get('Plant-Id'))
         response_dict['metadata']['override'] = override_info['isOverridden']
         if override_info['isOverridden'] == True:
             lamp_intensity_state, water_pump_state = override_info['data']['Lamp Intensity State'], override_info['data']['Water Pump State']
+        elif decision != None:
+            lamp_intensity_state, water_pump_state = decision.lamp_intensity_state, decision.water_pump_state
         else:
-            lamp_intensity_state, water_pump_state = calculate_actuator_values(latest_entry.light_intensity_reading, latest_entry.soil_moisture_reading, second_to_last.soil_moisture_reading)
+            lamp_intensity_state, water_pump_state = calculate_actuator_values(latest_entry.light_intensity_reading, latest_entry.soil_moisture_reading, second_to_last.soil_moisture_reading, plant_rules)
+
+        #Working on the forecast which is read from the running statistics of the plant
+        response_dict['forecast'] = forecast.plant_forecast(request.headers.get('Plant-Id'), plant_rules.profile['water_low'])
+        water_tank_description = "The amount of water present in the water tank and used to water the plant."
+        if response_dict['forecast']['hours_until_water_low'] != None:
+            water_tank_description += f" At the current rate, the water level will reach {response_dict['forecast']['water_low_threshold']}% in about {round(response_dict['forecast']['hours_until_water_low'] / 24, 1)} days."
 
         response_dict['reports'] = [
             {
                 'title': 'Water Tank Report',
                 'header_text': 'Water Level',
                 'value': " - ".join([one for one in response_dict['sensor_readings'][2]['readings']]),
-                'description': "The amount of water present in the water tank and used to water the plant."
+                'description': water_tank_description
             },
             {
                 'title': 'Water Pump Report',
@@ -596,34 +836,26 @@ def app_basic_data(request):
             }
         ]
 
-        #Working on the plant state
+        #Working on the plant state. The precomputed state is only valid when the actuators are not overridden
+        if override_info['isOverridden'] == False and decision != None:
+            state, description = rules.describe_state(decision.plant_state_rule)
+        else:
+            state, description = plant_rules.plant_state(latest_entry.soil_moisture_reading, latest_entry.light_intensity_reading, latest_entry.water_level_reading, lamp_intensity_state, water_pump_state)
+
         plant_state = {
-            'state': "",
-            'description': ""
+            'state': state,
+            'description': description
         }
 
-        if (latest_entry.soil_moisture_reading < 45 and latest_entry.light_intensity_reading < 25):
-            plant_state['state'] = "Happy"
-            plant_state['description'] = "Your plant is well watered, has adequate light exposure and is healthier than ever!"
-        elif latest_entry.soil_moisture_reading < 45 and water_pump_state == False and latest_entry.light_intensity_reading < 25 and lamp_intensity_state < 30:
-            plant_state['state'] = "Worried"
-            plant_state['description'] = "Your plant does not have enough water or light intensity to continue healthy growth"
-        elif latest_entry.soil_moisture_reading < 45 and water_pump_state == False:
-            plant_state['state'] = "Hungry"
-            plant_state['description'] = "Your plant requires more soil moisture content to continue healthy growth"
-        elif latest_entry.light_intensity_reading < 25 and lamp_intensity_state < 30:
-            plant_state['state'] = "Sad"
-            plant_state['description'] = "Your plant requires more light in order for it to continue healthy growth"
-        elif latest_entry.water_level_reading < 20:
-            plant_state['state'] = "Worried"
-            plant_state['description'] = "Your plant needs more water in the water tank to feel safe"
-        else:
-            plant_state['state'] = "Happy"
-            plant_state['description'] = "Your plant is well watered, has adequate light exposure and is healthier than ever!"
-
         response_dict['plant_state'] = plant_state
 
-        return JsonResponse(dict(response_dict), status=200)
+        response = JsonResponse(dict(response_dict), status=200)
+
+        #The response changes once the override expires even though the data of the plant does not
+        if override_info['isOverridden'] == True:
+            response.cache_timeout = max(0, (override_info['expires'] - timezone.now()).total_seconds())
+
+        return response
 
     else:
         return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts get requests')}, status = 400)
@@ -654,13 +886,17 @@ def Override(request):
     if request.method == "POST":
         lamp_intensity_state = json.loads(request.body).get('Lamp Intensity State')
         water_pump_state = json.loads(request.body).get('Water Pump State')
-        print_v(f"Lamp Intensity: {lamp_intensity_state}\tWater Pump: {water_pump_state}")
+        logger.debug('Override requested', extra={'plant_id': request.headers.get('Plant-Id'), 'lamp_intensity': lamp_intensity_state, 'water_pump': water_pump_state})
 
         #only triggers if one of the above terms are not provided        
         if lamp_intensity_state == None or water_pump_state == None:
             return JsonResponse({"status": 400, "response": generate_error_message('Bad request. Either the lamp intensity or the water pump state were not provided')}, status = 400)
 
-        OverrideRequest(plant_id = request.headers.get('Plant-Id'), request_time = timezone.now(), lamp_intensity_state = lamp_intensity_state, water_pump_state = water_pump_state).save()
+        with transaction.atomic():
+            override_request = OverrideRequest(plant_id = plants.request_plant_key(request, create=True), request_time = timezone.now(), lamp_intensity_state = lamp_intensity_state, water_pump_state = water_pump_state)
+            override_request.save()
+            data_version = bump_data_version(request.headers.get('Plant-Id'), override_id = override_request.id, override_time = override_request.request_time)
+        live.publish(request.headers.get('Plant-Id'), data_version, lambda: live.override_changes(request.headers.get('Plant-Id')))
         return JsonResponse({'status': 200, 'response': "override request made"})
 
     else:
@@ -686,10 +922,13 @@ def RemoveOverride(request):
                                 'response': generate_error_message('No Plant-Id provided in the request header')},
                                 status = 400)
 
-        OverrideRequest.objects.filter(plant_id = request.headers.get('Plant-Id')).delete()
+        with transaction.atomic():
+            OverrideRequest.objects.filter(plant_id = plants.request_plant_key(request)).delete()
+            data_version = bump_data_version(request.headers.get('Plant-Id'), override_id = None, override_time = None)
+        live.publish(request.headers.get('Plant-Id'), data_version, lambda: live.override_changes(request.headers.get('Plant-Id')))
         return JsonResponse({'status': 200,
                             'response': 'Records have been removed sucessfully', 
-                            'count': len(OverrideRequest.objects.filter(plant_id = request.headers.get('Plant-Id')))})
+                            'count': len(OverrideRequest.objects.filter(plant_id = plants.request_plant_key(request)))})
 
     else:
         return JsonResponse({"status": 400, "response": generate_error_message('Endpoint only accepts delete requests')}, status = 400)
@@ -723,10 +962,11 @@ def bindPlantIdToken(request):
                                 'response': generate_error_message('No valid expo token was provided in the request')},
                                 status = 400)
 
-        bind = TokenPlantIDBind.objects.filter(plant_id = request.headers.get('Plant-Id'))
+        plant_key = plants.request_plant_key(request, create=True)
+        bind = TokenPlantIDBind.objects.filter(plant_id = plant_key)
         if (len(bind) == 0):
             #No binds in the database. Create a bind and save it to the database
-            TokenPlantIDBind(plant_id = request.headers.get('Plant-Id'), tokens = token).save()
+            TokenPlantIDBind(plant_id = plant_key, tokens = token).save()
         else:
             #A bind already exists in the database. Update the bind.
             tokens = bind[0].tokens
@@ -745,7 +985,8 @@ def uptime(request):
     All requests made to this endpoint are asumed to be get requests for simplicity and assume a plant-id of "debugPlant"
     '''
     current_time = timezone.now()
-    latest_entry = ReadingEntry.objects.filter(plant_id = "debugPlant").order_by('-id')[0]
+    startup_time = warmup.startup_time()
+    latest_entry = timeseries.series_for("debugPlant").latest()[0]
 
     diff = str(datetime.timedelta(seconds = (current_time - startup_time).seconds)).split(':')
 
@@ -764,5 +1005,27 @@ Latest Sensor Readnigs:
     Water Level Sensor: {latest_entry.water_level_reading}
 """
 
-    print(data)
-    return JsonResponse({'status': 200, 'response': data})
\ No newline at end of file
+    logger.debug('Uptime requested', extra={'uptime_seconds': (current_time - startup_time).seconds})
+    return JsonResponse({'status': 200, 'response': data})
+
+@staff_member_required
+def profiles(request, file_name=None):
+    '''
+    This endpoint is used by the admins to list and download the profiles of the requests that have been profiled. The
+    profiling is set up through the PROFILING setting.
+
+    Endpoint: /Profiles and /Profiles/<file_name>
+
+    Get:
+        Expected Response:
+            |- /Profiles: a list of the stored profiles from the newest to the oldest along with the names of their files
+            |- /Profiles/<file_name>: the file itself. The .prof files are cProfile dumps and the .json files hold the SQL trace
+    '''
+    if file_name == None:
+        return JsonResponse({'status': 200, 'response': 'success', 'profiles': profiling.list_profiles()})
+
+    path = profiling.profile_path(file_name)
+    if path == None:
+        return JsonResponse({'status': 404, 'response': generate_error_message('No profile with this name exists')}, status = 404)
+
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=file_name)
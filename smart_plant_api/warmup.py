@@ -0,0 +1,68 @@
+'''
+The warm up hook run by the WSGI and ASGI entry points once the application has been loaded. It does the work that would
+otherwise be paid by the first requests of a new worker: opening the database connections, touching the caches, compiling
+the default rules, and loading the URL configuration (and with it the views).
+'''
+from django.utils import timezone
+import time
+
+_startup_time = None
+timings = {}
+
+def startup_time():
+    '''
+    Gets the time that the worker was started at. Workers that were not warmed up use the time of the first call instead
+    '''
+    global _startup_time
+    if _startup_time == None:
+        _startup_time = timezone.now()
+
+    return _startup_time
+
+def _timed(name, function):
+    start = time.perf_counter()
+    function()
+    timings[name] = time.perf_counter() - start
+
+def warm_up(keep_connections=True) -> dict:
+    '''
+    Warms up the current worker
+
+    Arguments:
+        |- keep_connections: whether the database connections opened by the warm up are kept open for the first requests.
+                             The connections belong to the thread that runs the warm up, so this is only useful when the
+                             requests are served from that same thread.
+
+    Returns:
+        |- (dict): the number of seconds each of the warm up steps took
+    '''
+    from django.conf import settings
+    from django.core.cache import caches
+    from django.db import connections
+    from django.urls import get_resolver
+    from smart_plant_api import fastpath, partitions, rules
+
+    startup_time()
+
+    def open_connections():
+        for connection in connections.all():
+            #Connecting to a snapshot that has not been refreshed yet would create an empty file in its place, so the snapshot is
+            #only connected to by snapshot_reads once it is usable
+            if connection.alias != settings.SNAPSHOT['DATABASE']:
+                connection.ensure_connection()
+
+    def open_caches():
+        for alias in settings.CACHES:
+            caches[alias].get('warm_up')
+
+    _timed('url_configuration', lambda: get_resolver().url_patterns)
+    _timed('fast_path', fastpath.routes)
+    _timed('database_connections', open_connections)
+    _timed('caches', open_caches)
+    _timed('rules', rules.compile_profile)
+    _timed('partitions', partitions.existing_months)
+
+    if not keep_connections:
+        connections.close_all()
+
+    return timings